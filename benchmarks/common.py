@@ -0,0 +1,180 @@
+"""
+Helpers shared by the benchmark scripts.
+
+The benchmarks configure hr_api through environment variables, so `use_database`
+has to run before anything from hr_api or main is imported.
+"""
+import asyncio
+import json
+import os
+import platform
+import time
+
+RESULTS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Minimal code lists, enough for the joins of the read endpoints
+CODE_TABLE_ROWS = {
+    "geschlecht": [
+        {"code": "1", "wert": "männlich", "beschreibung": None},
+        {"code": "2", "wert": "weiblich", "beschreibung": None},
+        {"code": "3", "wert": "divers", "beschreibung": None},
+    ],
+    "rechtsform": [
+        {"code": "GMBH", "wert": "Gesellschaft mit beschränkter Haftung", "beschreibung": None},
+        {"code": "UG", "wert": "Unternehmergesellschaft (haftungsbeschränkt)", "beschreibung": None},
+        {"code": "AG", "wert": "Aktiengesellschaft", "beschreibung": None},
+        {"code": "KG", "wert": "Kommanditgesellschaft", "beschreibung": None},
+        {"code": "OHG", "wert": "Offene Handelsgesellschaft", "beschreibung": None},
+        {"code": "EK", "wert": "Eingetragener Kaufmann", "beschreibung": None},
+    ],
+    "gerichtscode": [
+        {"XJustiz_Id": "F1103R", "Registergericht": "Berlin (Charlottenburg)", "Art": "R", "Land": "BE", "PLZ": "14057", "gueltigBis": None, "kuenftigZuVerwendendeCodes": None},
+        {"XJustiz_Id": "D2601", "Registergericht": "München", "Art": "R", "Land": "BY", "PLZ": "80333", "gueltigBis": None, "kuenftigZuVerwendendeCodes": None},
+        {"XJustiz_Id": "K1101R", "Registergericht": "Hamburg", "Art": "R", "Land": "HH", "PLZ": "20355", "gueltigBis": None, "kuenftigZuVerwendendeCodes": None},
+        {"XJustiz_Id": "M1201", "Registergericht": "Frankfurt am Main", "Art": "R", "Land": "HE", "PLZ": "60313", "gueltigBis": None, "kuenftigZuVerwendendeCodes": None},
+        {"XJustiz_Id": "R3101", "Registergericht": "Köln", "Art": "R", "Land": "NW", "PLZ": "50667", "gueltigBis": None, "kuenftigZuVerwendendeCodes": None},
+    ],
+    "rollenbezeichnung": [
+        {"code": "086", "wert": "Geschäftsführer(in)", "fachmodul": None},
+        {"code": "287", "wert": "Rechtsträger(in)", "fachmodul": None},
+        {"code": "253", "wert": "Prokurist(in)", "fachmodul": None},
+        {"code": "265", "wert": "Vorstand", "fachmodul": None},
+        {"code": "179", "wert": "Kommanditist(in)", "fachmodul": None},
+    ],
+    "eintragungsart": [
+        {"Schluessel": "1", "Wert": "Ersteintragung"},
+        {"Schluessel": "2", "Wert": "Veränderung"},
+        {"Schluessel": "3", "Wert": "Löschung"},
+    ],
+    "anschriftstyp": [
+        {"code": "1", "wert": "Geschäftsanschrift"},
+        {"code": "2", "wert": "Wohnanschrift"},
+    ],
+}
+
+
+def use_database(path, **environment):
+    """
+    Points hr_api at a benchmark database and sets further environment variables.
+    """
+    os.environ["DB_LOCATION"] = path
+    for key, value in environment.items():
+        os.environ[key] = str(value)
+
+
+def create_schema():
+    """
+    Creates all tables and fills the code tables, so neither the API nor the
+    ingest needs to download code lists.
+    """
+    import hr_api.models as models
+    from hr_api.database import writer_engine
+
+    models.Base.metadata.create_all(bind=writer_engine)
+    with writer_engine.begin() as connection:
+        for table_name, rows in CODE_TABLE_ROWS.items():
+            table = models.Base.metadata.tables[table_name]
+            connection.execute(table.delete())
+            connection.execute(table.insert(), rows)
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[rank]
+
+
+def latency_summary(latencies):
+    """
+    Summarizes latencies given in seconds as milliseconds.
+    """
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        "p90_ms": round(percentile(latencies, 90) * 1000, 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+        "max_ms": round(max(latencies) * 1000, 3) if latencies else None,
+    }
+
+
+async def _asgi_get(app, path, headers):
+    path, _, query_string = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query_string.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"benchmark")]
+        + [(key.lower().encode(), value.encode()) for key, value in headers.items()],
+        "client": ("127.0.0.1", 0),
+        "server": ("benchmark", 80),
+    }
+    response = {"status": None, "headers": [], "body": b""}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = message.get("headers", [])
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    await app(scope, receive, send)
+    return response
+
+
+def asgi_get(app, path, headers=None):
+    """
+    Runs a GET request through the ASGI app in-process, without a server or an HTTP client.
+
+    Returns:
+        dict: The status, the raw headers and the body of the response.
+    """
+    return asyncio.run(_asgi_get(app, path, headers or {}))
+
+
+async def _time_requests(app, path, repeat, headers):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = await _asgi_get(app, path, headers)
+        latencies.append(time.perf_counter() - start)
+        if response["status"] != 200:
+            raise RuntimeError(f"GET {path} returned {response['status']}")
+    return latencies
+
+
+def time_requests(app, path, repeat, headers=None):
+    """
+    Runs the same GET request repeatedly through the ASGI app.
+
+    Returns:
+        list: The latency of each request in seconds.
+    """
+    return asyncio.run(_time_requests(app, path, repeat, headers or {}))
+
+
+def store_result(benchmark, result):
+    """
+    Appends a benchmark result to benchmarks/results/<benchmark>.jsonl.
+    """
+    os.makedirs(RESULTS_FOLDER, exist_ok=True)
+    record = {
+        "benchmark": benchmark,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        **result,
+    }
+    with open(os.path.join(RESULTS_FOLDER, f"{benchmark}.jsonl"), "a", encoding="utf-8") as file:
+        file.write(json.dumps(record) + "\n")
+    return record
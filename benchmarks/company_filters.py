@@ -0,0 +1,129 @@
+"""
+Measures filtered company listings on a dataset the size of the full register.
+
+Fills the companies table with synthetic companies whose legal forms, courts,
+cities and register codes are skewed like the real ones, checks that the query
+plan of every combination of filters and sorts is index-backed, and times typical
+listings through the API.
+
+    python -m benchmarks.company_filters --companies 2000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+from benchmarks.common import create_schema, latency_summary, store_result, time_requests, use_database
+
+LEGAL_FORMS = {"GMBH": 60, "UG": 15, "KG": 10, "EK": 10, "AG": 3, "OHG": 2}
+COURTS = {"F1103R": 25, "D2601": 25, "K1101R": 20, "M1201": 15, "R3101": 15}
+REGISTER_CODES = {"HRB": 70, "HRA": 27, "GnR": 1, "PR": 1, "VR": 1}
+CITY_COUNT = 2000
+INSERT_BATCH_SIZE = 50000
+
+LISTINGS = [
+    "/companies/?limit=100",
+    "/companies/?legal_form_code=AG&limit=100",
+    "/companies/?court_sender_code=D2601&register_code=HRA&limit=100",
+    "/companies/?city=Stadt7&limit=100&sort=current_designation",
+    "/companies/?postal_code=10&limit=100&sort=postal_code",
+    "/companies/?legal_form_code=GMBH&postal_code=8&limit=100",
+    "/companies/?statute_date_from=2020-01-01&limit=100&sort=current_statute_date&order=desc",
+    "/companies/?legal_form_code=KG&statute_date_from=2015-01-01&statute_date_to=2016-12-31&limit=100",
+    "/companies/?state=DE&city=Stadt1234&legal_form_code=UG&limit=100&sort=current_statute_date",
+    "/companies/?legal_form_code=OHG&court_sender_code=R3101&register_code=HRA&limit=100&skip=1000",
+    "/companies/?legal_form_code=OHG&court_sender_code=R3101&register_code=GnR&limit=100&sort=current_designation",
+]
+
+
+def weighted(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def seed_companies(count, rng):
+    import hr_api.aggregates as aggregates
+    import hr_api.listing as listing
+    import hr_api.models as models
+    from hr_api.database import WriterSessionLocal, writer_engine
+
+    # City sizes follow Zipf's law, each city has its own postal codes
+    cities = [f"Stadt{number}" for number in range(CITY_COUNT)]
+    city_weights = [1 / (rank + 1) for rank in range(CITY_COUNT)]
+    first_statute_date = date(1950, 1, 1)
+    with writer_engine.begin() as connection:
+        for start in range(0, count, INSERT_BATCH_SIZE):
+            rows = []
+            for number in range(start + 1, min(start + INSERT_BATCH_SIZE, count) + 1):
+                court = weighted(rng, COURTS)
+                register_code = weighted(rng, REGISTER_CODES)
+                city = rng.choices(range(CITY_COUNT), weights=city_weights)[0]
+                rows.append(
+                    {
+                        "court_sender_code": court,
+                        "current_statute_date": (
+                            (first_statute_date + timedelta(days=rng.randrange(27000))).isoformat()
+                            if rng.random() < 0.8
+                            else None
+                        ),
+                        "current_designation": f"Firma {rng.randrange(count)} {number}",
+                        "legal_form_code": weighted(rng, LEGAL_FORMS),
+                        "postal_code": f"{(city * 7919) % 99000 + 1000:05d}",
+                        "city": cities[city],
+                        "state": "DE",
+                        "register_code": register_code,
+                        "register_number": str(number),
+                        "company_number": f"{court}_{register_code}{number}",
+                    }
+                )
+            connection.execute(models.Companies.__table__.insert(), rows)
+    # As at the end of an ingest
+    with WriterSessionLocal() as db:
+        aggregates.refresh_aggregates(db, None)
+        listing.refresh_statistics(db)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--companies", type=int, default=500000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        use_database(os.path.join(folder, "filters.db"), RESPONSE_CACHE_MB=0)
+        create_schema()
+        start = time.perf_counter()
+        seed_companies(args.companies, random.Random(args.seed))
+        seed_seconds = round(time.perf_counter() - start, 1)
+
+        import hr_api.listing as listing
+        from hr_api.database import SessionLocal
+        from main import create_app
+
+        with SessionLocal() as db:
+            start = time.perf_counter()
+            unindexed = listing.unindexed_listings(db)
+            check_seconds = round(time.perf_counter() - start, 2)
+        for failure in unindexed:
+            print(f"not index-backed: {failure}")
+
+        app = create_app()
+        latencies = {path: latency_summary(time_requests(app, path, args.repeat)) for path in LISTINGS}
+
+    result = {
+        "companies": args.companies,
+        "seed_seconds": seed_seconds,
+        "plan_check_seconds": check_seconds,
+        "unindexed_listings": len(unindexed),
+        "listings": latencies,
+    }
+    print(f"{args.companies} companies, {len(unindexed)} listings not index-backed")
+    for path, summary in latencies.items():
+        print(f"  {path}: p50 {summary['p50_ms']} ms, p99 {summary['p99_ms']} ms")
+    store_result("company_filters", result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Measures the size of the entries table and the /register-entries lookup latency with
+plain and with zstd-compressed entry texts.
+
+Ingests a synthetic corpus with compression off, measures, compresses the texts in
+place (as the ingest does), vacuums and measures again.
+
+    python -m benchmarks.entry_compression --companies 20000 --repeat 200
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.common import create_schema, latency_summary, store_result, time_requests, use_database
+
+
+def table_size(database):
+    with sqlite3.connect(database) as connection:
+        connection.execute("VACUUM")
+        entries_bytes = connection.execute(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name = 'entries'"
+        ).fetchone()[0]
+    return {
+        "entries_mb": round(entries_bytes / (1024 * 1024), 2),
+        "database_mb": round(os.path.getsize(database) / (1024 * 1024), 2),
+    }
+
+
+def lookup_latency(app, company_numbers, repeat):
+    latencies = []
+    for company_number in company_numbers:
+        latencies.extend(time_requests(app, f"/register-entries/{company_number}", repeat))
+    return latency_summary(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--companies", type=int, default=5000)
+    parser.add_argument("--lookups", type=int, default=50, help="Companies looked up")
+    parser.add_argument("--repeat", type=int, default=20, help="Requests per company")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        from benchmarks.xjustiz_corpus import write_corpus
+
+        corpus = os.path.join(folder, "corpus")
+        write_corpus(corpus, args.companies, seed=args.seed, workers=os.cpu_count() or 1)
+
+        database = os.path.join(folder, "benchmark.db")
+        use_database(database, DOWNLOAD_FOLDER=corpus, COLUMNAR_SNAPSHOT_FOLDER="", RESPONSE_CACHE_MB=0)
+        create_schema()
+
+        import main as api
+        import hr_api.compression as compression
+        import hr_api.ingest as ingest
+        from hr_api.database import WriterSessionLocal
+
+        compression.ENTRY_TEXT_COMPRESSION = False
+        ingest.run_ingest(WriterSessionLocal())
+
+        with sqlite3.connect(database) as connection:
+            company_numbers = [
+                row[0]
+                for row in connection.execute(
+                    "SELECT company_number FROM entries GROUP BY company_number"
+                )
+            ]
+            generation = connection.execute("SELECT MAX(generation) FROM generations").fetchone()[0]
+        company_numbers = random.Random(args.seed).sample(
+            company_numbers, min(args.lookups, len(company_numbers))
+        )
+
+        results = {}
+        results["plain"] = {**table_size(database), **lookup_latency(api.app, company_numbers, args.repeat)}
+
+        compression.ENTRY_TEXT_COMPRESSION = True
+        db = WriterSessionLocal()
+        start = time.perf_counter()
+        try:
+            compressed = compression.compress_entries(db, generation)
+        finally:
+            db.close()
+        compress_seconds = round(time.perf_counter() - start, 3)
+
+        results["zstd"] = {**table_size(database), **lookup_latency(api.app, company_numbers, args.repeat)}
+
+    plain, zstd = results["plain"], results["zstd"]
+    print(
+        f"entries table: {plain['entries_mb']} -> {zstd['entries_mb']} MB "
+        f"({plain['entries_mb'] / zstd['entries_mb']:.1f}x), "
+        f"database: {plain['database_mb']} -> {zstd['database_mb']} MB"
+    )
+    print(
+        f"/register-entries: p50 {plain['p50_ms']} -> {zstd['p50_ms']} ms, "
+        f"p99 {plain['p99_ms']} -> {zstd['p99_ms']} ms"
+    )
+    print(f"compressed {compressed} texts in {compress_seconds} s")
+
+    store_result(
+        "entry_compression",
+        {
+            "companies": args.companies,
+            "compressed_texts": compressed,
+            "compress_seconds": compress_seconds,
+            **results,
+        },
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Measures the trigram index for fuzzy company name matching on millions of names.
+
+Fills the companies table with distinct synthetic names, builds the index as the
+ingest does, and matches a sample of the names after introducing the differences
+seen in CRM data: typos, spelled out legal forms, punctuation and case. Reports
+the build time, the index size, single and batch matching throughput and how often
+the original company is the best candidate (recall@1) or among the first five.
+
+    python -m benchmarks.fuzzy_match --companies 2000000 --queries 2000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.common import create_schema, latency_summary, store_result, use_database
+
+# Syllables of made up words, enough of them for the trigram variety of real names
+SYLLABLES = [
+    onset + vowel + coda
+    for onset in ("b", "d", "f", "g", "h", "k", "l", "m", "n", "p", "r", "s", "t", "w", "z", "br", "st", "sch", "kr", "pf")
+    for vowel in ("a", "e", "i", "o", "u", "ei", "au", "ie")
+    for coda in ("", "n", "r", "l", "s", "t", "ch", "ck")
+]
+LEGAL_FORMS = {
+    "GmbH": "Gesellschaft mit beschränkter Haftung",
+    "AG": "Aktiengesellschaft",
+    "KG": "Kommanditgesellschaft",
+    "UG (haftungsbeschränkt)": "Unternehmergesellschaft (haftungsbeschränkt)",
+    "e.K.": "eingetragener Kaufmann",
+    "GmbH & Co. KG": "Gesellschaft mit beschränkter Haftung & Co. KG",
+}
+INSERT_BATCH_SIZE = 50000
+
+
+def random_word(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+
+
+def company_names(count, rng):
+    names = set()
+    while len(names) < count:
+        words = " ".join(random_word(rng) for _ in range(rng.randint(1, 3)))
+        names.add(f"{words} {rng.choice(list(LEGAL_FORMS))}")
+    return sorted(names)
+
+
+def crm_variant(name, rng):
+    """
+    Returns a name as a CRM might hold it: with a typo, the legal form spelled out,
+    other punctuation or case.
+    """
+    for short, spelled in LEGAL_FORMS.items():
+        if name.endswith(" " + short) and rng.random() < 0.5:
+            name = name[: -len(short)] + spelled
+            break
+    base, _, rest = name.partition(" ")
+    if len(base) > 3:
+        position = rng.randrange(1, len(base) - 1)
+        typo = rng.choice(("swap", "drop", "double", "replace"))
+        if typo == "swap":
+            base = base[:position] + base[position + 1] + base[position] + base[position + 2 :]
+        elif typo == "drop":
+            base = base[:position] + base[position + 1 :]
+        elif typo == "double":
+            base = base[:position] + base[position] + base[position:]
+        else:
+            base = base[:position] + rng.choice("aeiou") + base[position + 1 :]
+    name = f"{base} {rest}" if rest else base
+    if rng.random() < 0.3:
+        name = name.replace(" ", "-", 1)
+    if rng.random() < 0.3:
+        name = name.upper()
+    return name
+
+
+def seed_companies(names):
+    from datetime import datetime, timezone
+
+    import hr_api.models as models
+    from hr_api.database import writer_engine
+
+    with writer_engine.begin() as connection:
+        generation = connection.execute(
+            models.Generations.__table__.insert().values(created_at=datetime.now(timezone.utc).isoformat())
+        ).inserted_primary_key[0]
+        for start in range(0, len(names), INSERT_BATCH_SIZE):
+            connection.execute(
+                models.Companies.__table__.insert(),
+                [
+                    {
+                        "company_number": f"F1103R_HRB{start + offset + 1}",
+                        "current_designation": name,
+                        "register_code": "HRB",
+                        "register_number": str(start + offset + 1),
+                        "generation": generation,
+                    }
+                    for offset, name in enumerate(names[start : start + INSERT_BATCH_SIZE])
+                ],
+            )
+    return generation
+
+
+def index_size_mb(database):
+    with sqlite3.connect(database) as connection:
+        size = connection.execute(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name IN ('company_names', 'name_trigrams')"
+        ).fetchone()[0]
+    return round(size / (1024 * 1024), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--companies", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as folder:
+        database = os.path.join(folder, "fuzzy.db")
+        use_database(database)
+        create_schema()
+
+        import hr_api.fuzzy as fuzzy
+        from hr_api.database import SessionLocal, WriterSessionLocal
+
+        names = company_names(args.companies, rng)
+        generation = seed_companies(names)
+
+        db = WriterSessionLocal()
+        start = time.perf_counter()
+        try:
+            fuzzy.refresh_name_index(db, generation)
+        finally:
+            db.close()
+        build_seconds = round(time.perf_counter() - start, 2)
+        size_mb = index_size_mb(database)
+
+        expected = rng.sample(range(len(names)), min(args.queries, len(names)))
+        queries = [crm_variant(names[index], rng) for index in expected]
+        expected_numbers = [f"F1103R_HRB{index + 1}" for index in expected]
+
+        latencies = []
+        single_results = []
+        with SessionLocal() as db:
+            for query in queries:
+                query_start = time.perf_counter()
+                single_results.extend(fuzzy.match_names(db, [query], min_score=0))
+                latencies.append(time.perf_counter() - query_start)
+
+            batch_start = time.perf_counter()
+            for offset in range(0, len(queries), args.batch_size):
+                fuzzy.match_names(db, queries[offset : offset + args.batch_size], min_score=0)
+            batch_seconds = time.perf_counter() - batch_start
+
+    top_1 = top_5 = 0
+    for result, company_number in zip(single_results, expected_numbers):
+        candidates = [candidate["company_number"] for candidate in result["candidates"]]
+        top_1 += candidates[:1] == [company_number]
+        top_5 += company_number in candidates[:5]
+
+    result = {
+        "companies": args.companies,
+        "queries": len(queries),
+        "build_seconds": build_seconds,
+        "index_mb": size_mb,
+        "single": latency_summary(latencies),
+        "batch_names_per_s": round(len(queries) / batch_seconds, 1),
+        "recall_at_1": round(top_1 / len(queries), 3),
+        "recall_at_5": round(top_5 / len(queries), 3),
+    }
+    print(
+        f"{args.companies} names: index built in {build_seconds} s, {size_mb} MB; "
+        f"single p50 {result['single']['p50_ms']} ms, p99 {result['single']['p99_ms']} ms; "
+        f"batch {result['batch_names_per_s']} names/s; "
+        f"recall@1 {result['recall_at_1']}, recall@5 {result['recall_at_5']}"
+    )
+    for query, candidate in list(zip(queries, single_results))[:3]:
+        best = candidate["candidates"][0] if candidate["candidates"] else None
+        print(f"  {query!r} -> {best['current_designation'] if best else None!r}")
+    store_result("fuzzy_match", result)
+
+
+if __name__ == "__main__":
+    main()
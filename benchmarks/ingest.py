@@ -0,0 +1,253 @@
+"""
+Measures the ingest on a synthetic XJustiz corpus, stage by stage.
+
+Every stage runs in a fresh interpreter, so its peak RSS is not inflated by the
+previous ones:
+
+- parse: reads the latest file of every company and runs xmltodict.parse
+- extract: parse plus extract_company_info, extract_parties and extract_entries
+- ingest: the full ingest run (hr_api.ingest.run_ingest) into an empty database
+
+With --history the ingest stage runs with INGEST_HISTORY, reads every extract and
+reports the size of the company history next to the data tables. With --pack the
+generated corpus is compressed or archived first, see benchmarks.xjustiz_corpus.
+
+    python -m benchmarks.ingest --companies 20000 --snapshots 2
+    python -m benchmarks.ingest --companies 20000 --snapshots 5 --stages ingest --history
+    python -m benchmarks.ingest --companies 20000 --pack tar.zst
+    python -m benchmarks.ingest --corpus /tmp/corpus
+
+The result is appended to benchmarks/results/ingest.jsonl and compared with the
+previous run.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+from benchmarks.common import RESULTS_FOLDER, create_schema, store_result, use_database
+from benchmarks.xjustiz_corpus import PACKINGS
+
+STAGES = ("parse", "extract", "ingest")
+
+
+def corpus_files(corpus, latest=True):
+    """
+    Yields the extracts of a corpus as the ingest finds them, only the latest of
+    every company by default.
+    """
+    import hr_api.extract_files as extract_files
+    import hr_api.history as history
+
+    for company_files in extract_files.company_extracts(corpus):
+        if latest:
+            yield max(company_files, key=lambda extract_file: history.extracted_at(extract_file.path))
+        else:
+            yield from company_files
+
+
+def corpus_size(corpus):
+    return sum(os.path.getsize(os.path.join(folder, name)) for folder, _, names in os.walk(corpus) for name in names)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_parse(corpus):
+    import xmltodict
+
+    files = size = 0
+    start = time.perf_counter()
+    for extract_file in corpus_files(corpus):
+        xml_data = extract_file.read()
+        files += 1
+        size += len(xml_data)
+        xmltodict.parse(xml_data)
+    return {"files": files, "bytes": size, "seconds": time.perf_counter() - start}
+
+
+def run_extract(corpus):
+    import xmltodict
+
+    import hr_api.ingest as ingest
+
+    files = size = rows = 0
+    start = time.perf_counter()
+    for extract_file in corpus_files(corpus):
+        path = extract_file.path
+        xml_data = extract_file.read()
+        files += 1
+        size += len(xml_data)
+        data_dict = xmltodict.parse(xml_data)
+        company = ingest.extract_company_info(data_dict, path)
+        parties = ingest.extract_parties(data_dict, company.company_number, path)
+        entries = ingest.extract_entries(data_dict, company.company_number, path)
+        rows += 1 + len(parties) + len(entries)
+    return {"files": files, "bytes": size, "rows": rows, "seconds": time.perf_counter() - start}
+
+
+def run_ingest(corpus):
+    import hr_api.ingest as ingest
+    from hr_api.database import WriterSessionLocal, writer_engine
+    from sqlalchemy import text
+
+    import hr_api.history as history
+
+    files = size = 0
+    for extract_file in corpus_files(corpus, latest=not history.INGEST_HISTORY):
+        files += 1
+        size += len(extract_file.read())
+    start = time.perf_counter()
+    ingest.run_ingest(WriterSessionLocal())
+    seconds = time.perf_counter() - start
+
+    tables = ("companies", "participant_persons", "participant_organizations", "entries")
+    with writer_engine.connect() as connection:
+        rows = sum(connection.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar() for table in tables)
+        # Pages of the tables and their indexes
+        table_bytes = dict(
+            connection.execute(
+                text("SELECT tbl_name, SUM(pgsize) FROM dbstat JOIN sqlite_master USING (name) GROUP BY tbl_name")
+            ).all()
+        )
+    return {
+        "files": files,
+        "bytes": size,
+        "rows": rows,
+        "seconds": seconds,
+        "db_mb": round(os.path.getsize(os.environ["DB_LOCATION"]) / (1024 * 1024), 1),
+        "data_tables_mb": round(sum(table_bytes.get(table, 0) for table in tables) / (1024 * 1024), 1),
+        "history_mb": round(table_bytes.get("company_history", 0) / (1024 * 1024), 1),
+    }
+
+
+def run_stage(stage, corpus, folder, history=False):
+    """
+    Runs one stage in a subprocess and returns its measurements.
+    """
+    environment = dict(
+        os.environ,
+        DB_LOCATION=os.path.join(folder, f"{stage}.db"),
+        DOWNLOAD_FOLDER=corpus,
+        FILESERVER_URL="https://files.example/download/",
+        # Keep the snapshot writer out of the ingest timing
+        COLUMNAR_SNAPSHOT_FOLDER="",
+        INGEST_HISTORY=str(history).lower(),
+    )
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.ingest", "--run-stage", stage, "--corpus", corpus],
+        env=environment,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+
+    seconds = result["seconds"]
+    summary = {
+        "files": result["files"],
+        "seconds": round(seconds, 3),
+        "files_per_s": round(result["files"] / seconds, 1) if seconds else None,
+        "mb_per_s": round(result["bytes"] / (1024 * 1024) / seconds, 2) if seconds else None,
+        "peak_rss_mb": result["peak_rss_mb"],
+    }
+    if "rows" in result:
+        summary["rows"] = result["rows"]
+        summary["rows_per_s"] = round(result["rows"] / seconds, 1) if seconds else None
+    for key in ("db_mb", "data_tables_mb", "history_mb"):
+        if key in result:
+            summary[key] = result[key]
+    return summary
+
+
+def previous_result():
+    path = os.path.join(RESULTS_FOLDER, "ingest.jsonl")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as file:
+        lines = file.read().splitlines()
+    return json.loads(lines[-1]) if lines else None
+
+
+def _child(stage, corpus):
+    # Runs inside the subprocess started by run_stage
+    if stage != "parse":
+        use_database(os.environ["DB_LOCATION"])
+        create_schema()
+    result = {"parse": run_parse, "extract": run_extract, "ingest": run_ingest}[stage](corpus)
+    result["peak_rss_mb"] = peak_rss_mb()
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Existing corpus folder, generated when left out")
+    parser.add_argument("--companies", type=int, default=5000)
+    parser.add_argument("--snapshots", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--history", action="store_true", help="Ingest with INGEST_HISTORY")
+    parser.add_argument("--pack", choices=PACKINGS, help="Compress or archive the generated corpus")
+    parser.add_argument("--run-stage", choices=STAGES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        _child(args.run_stage, args.corpus)
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        corpus = args.corpus
+        if corpus is None:
+            from benchmarks.xjustiz_corpus import pack_corpus, write_corpus
+
+            corpus = os.path.join(folder, "corpus")
+            write_corpus(corpus, args.companies, seed=args.seed, snapshots=args.snapshots, workers=args.workers)
+            if args.pack:
+                # In a worker, the peak RSS of this process is passed on to the stages
+                with Pool(1) as pool:
+                    pool.apply(pack_corpus, (corpus, args.pack))
+        corpus_mb = round(corpus_size(corpus) / (1024 * 1024), 1)
+        print(f"corpus: {corpus_mb} MB")
+
+        stages = {}
+        for stage in args.stages:
+            stages[stage] = run_stage(stage, corpus, folder, args.history)
+            print(f"{stage}: {json.dumps(stages[stage])}")
+
+    previous = previous_result()
+    if previous is not None:
+        for stage, result in stages.items():
+            before = previous.get("stages", {}).get(stage)
+            if before and before.get("files_per_s") and result["files_per_s"]:
+                change = (result["files_per_s"] / before["files_per_s"] - 1) * 100
+                print(
+                    f"{stage}: {before['files_per_s']} -> {result['files_per_s']} files/s ({change:+.1f}%), "
+                    f"peak RSS {before['peak_rss_mb']} -> {result['peak_rss_mb']} MB"
+                )
+
+    store_result(
+        "ingest",
+        {
+            "corpus": args.corpus,
+            "companies": args.companies if args.corpus is None else None,
+            "snapshots": args.snapshots if args.corpus is None else None,
+            "history": args.history,
+            "pack": args.pack,
+            "corpus_mb": corpus_mb,
+            "seed": args.seed,
+            "stages": stages,
+        },
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+"""
+Load test of the read API against a local uvicorn.
+
+Seeds a database of the given size, starts uvicorn on it and replays a mix of
+lookups at a fixed arrival rate. Company ids are drawn from a Zipf distribution,
+so a few companies are requested very often and most of them rarely, like on the
+public API.
+
+    python -m benchmarks.loadtest --companies 100000 --rps 500 --duration 60
+    python -m benchmarks.loadtest --database hr.db --rps 200 --report report.json
+
+Requests are scheduled open loop: latency is measured from the time a request
+was due, not from when a connection became free, so a slow server shows up in
+the percentiles instead of silently lowering the offered load. The report with
+throughput, latency percentiles and error rate per endpoint is written as JSON
+and appended to benchmarks/results/loadtest.jsonl.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from bisect import bisect_left
+
+from benchmarks.common import create_schema, latency_summary, store_result, use_database
+
+# Endpoint templates and their share of the traffic
+ENDPOINT_MIX = {
+    "/companies/{company_number}": 0.4,
+    "/register-entries/{company_number}": 0.2,
+    "/participant-persons/{company_number}": 0.15,
+    "/participant-organizations/{company_number}": 0.15,
+    "/companies/?skip={skip}&limit=100": 0.1,
+}
+
+COURTS = ["F1103R", "D2601", "K1101R", "M1201", "R3101"]
+LEGAL_FORMS = ["GMBH", "UG", "AG", "KG", "OHG", "EK"]
+CITIES = ["Berlin", "München", "Hamburg", "Köln", "Frankfurt am Main", "Leipzig"]
+LAST_NAMES = ["Müller", "Schmidt", "Schneider", "Fischer", "Weber", "Meyer", "Wagner", "Becker"]
+
+
+def company_numbers(companies):
+    return [f"{COURTS[number % len(COURTS)]}_HRB{number}" for number in range(1, companies + 1)]
+
+
+def seed_database(companies, seed=42, batch_size=5000):
+    """
+    Fills the database with synthetic companies, participants and entries.
+    """
+    from datetime import datetime, timezone
+
+    import hr_api.aggregates as aggregates
+    import hr_api.models as models
+    from hr_api.database import WriterSessionLocal, writer_engine
+
+    rng = random.Random(seed)
+    with writer_engine.begin() as connection:
+        generation = connection.execute(
+            models.Generations.__table__.insert().values(created_at=datetime.now(timezone.utc).isoformat())
+        ).inserted_primary_key[0]
+
+    numbers = company_numbers(companies)
+    for start in range(0, companies, batch_size):
+        source_rows, company_rows, person_rows, organization_rows, entry_rows = [], [], [], [], []
+        for offset, company_number in enumerate(numbers[start:start + batch_size]):
+            index = start + offset
+            source_file_id = index + 1
+            source_rows.append(
+                {"id": source_file_id, "path": f"{index}/si/2024-03-11T13-59-19.xml", "generation": generation}
+            )
+            company_rows.append(
+                {
+                    "court_sender_code": COURTS[(index + 1) % len(COURTS)],
+                    "current_designation": f"Benchmark {index} {rng.choice(LEGAL_FORMS)}",
+                    "legal_form_code": rng.choice(LEGAL_FORMS),
+                    "address_type_code": "1",
+                    "street": "Hauptstraße",
+                    "house_number": str(rng.randint(1, 200)),
+                    "postal_code": f"{rng.randint(1000, 99999):05d}",
+                    "city": rng.choice(CITIES),
+                    "state": "DE",
+                    "subject_matter": "Der Handel mit Waren aller Art. " * rng.randint(1, 6),
+                    "register_code": "HRB",
+                    "register_number": company_number.split("_HRB")[1],
+                    "company_number": company_number,
+                    "source_file_id": source_file_id,
+                    "generation": generation,
+                }
+            )
+            for role_number in range(rng.choice([0, 1, 1, 2, 2, 3, 5, 12])):
+                person_rows.append(
+                    {
+                        "role_number": str(role_number + 1),
+                        "role_name_code": rng.choice(["086", "253", "179"]),
+                        "first_name": "Erika",
+                        "last_name": rng.choice(LAST_NAMES),
+                        "birth_date": "1970-01-01",
+                        "gender_code": rng.choice("123"),
+                        "city": rng.choice(CITIES),
+                        "state_code": "DE",
+                        "company_number": company_number,
+                        "source_file_id": source_file_id,
+                        "generation": generation,
+                    }
+                )
+            for role_number in range(rng.choice([0, 0, 0, 1, 1, 2])):
+                organization_rows.append(
+                    {
+                        "role_number": str(role_number + 1),
+                        "role_name_code": rng.choice(["287", "179"]),
+                        "name": f"Beteiligung {rng.randint(1, companies)} GmbH",
+                        "legal_form_code": "GMBH",
+                        "city": rng.choice(CITIES),
+                        "state_code": "DE",
+                        "company_number": company_number,
+                        "source_file_id": source_file_id,
+                        "generation": generation,
+                    }
+                )
+            for position in range(rng.choice([1, 1, 2, 3, 5, 8, 20])):
+                entry_rows.append(
+                    {
+                        "column": "6",
+                        "position": str(position + 1),
+                        "running_number": str(position + 1),
+                        "entry_type_code": rng.choice("123"),
+                        "text": f"Eintragung {position + 1}: Geschäftsführer {rng.choice(LAST_NAMES)} bestellt. " * 3,
+                        "company_number": company_number,
+                        "source_file_id": source_file_id,
+                        "generation": generation,
+                    }
+                )
+        with writer_engine.begin() as connection:
+            connection.execute(models.SourceFiles.__table__.insert(), source_rows)
+            connection.execute(models.Companies.__table__.insert(), company_rows)
+            for table, rows in (
+                (models.ParticipantPersons.__table__, person_rows),
+                (models.ParticipantOrganizations.__table__, organization_rows),
+                (models.Entries.__table__, entry_rows),
+            ):
+                if rows:
+                    connection.execute(table.insert(), rows)
+
+    db = WriterSessionLocal()
+    try:
+        aggregates.refresh_aggregates(db, generation)
+    finally:
+        db.close()
+
+
+class ZipfSampler:
+    """
+    Draws items with probability proportional to 1 / rank ** exponent.
+
+    The ranks are shuffled over the items, so the popular companies are spread
+    over the table instead of being the first rows inserted.
+    """
+
+    def __init__(self, items, exponent, rng):
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.cumulative = list(itertools.accumulate(1 / rank ** exponent for rank in range(1, len(self.items) + 1)))
+        self.rng = rng
+
+    def sample(self):
+        index = bisect_left(self.cumulative, self.rng.random() * self.cumulative[-1])
+        return self.items[min(index, len(self.items) - 1)]
+
+
+def request_plan(numbers, count, zipf_exponent, seed):
+    """
+    Returns (endpoint template, path) pairs in the order they are sent.
+    """
+    rng = random.Random(seed)
+    sampler = ZipfSampler(numbers, zipf_exponent, rng)
+    templates = list(ENDPOINT_MIX)
+    weights = list(ENDPOINT_MIX.values())
+    plan = []
+    for template in rng.choices(templates, weights, k=count):
+        path = template.format(
+            company_number=sampler.sample(),
+            skip=rng.randrange(0, max(1, len(numbers) - 100)),
+        )
+        plan.append((template, path))
+    return plan
+
+
+class Connection:
+    """
+    A keep-alive HTTP/1.1 connection sending GET requests.
+    """
+
+    def __init__(self, host, port, accept_encoding="identity"):
+        self.host = host
+        self.port = port
+        self.accept_encoding = accept_encoding
+        self.reader = None
+        self.writer = None
+
+    async def get(self, path):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(
+            f"GET {path} HTTP/1.1\r\nHost: {self.host}\r\nAccept-Encoding: {self.accept_encoding}\r\n\r\n".encode()
+        )
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by the server")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding") == "chunked":
+            size = 0
+            while True:
+                chunk_size = int((await self.reader.readline()).split(b";")[0], 16)
+                await self.reader.readexactly(chunk_size + 2)
+                size += chunk_size
+                if chunk_size == 0:
+                    break
+        else:
+            size = int(headers.get("content-length", 0))
+            await self.reader.readexactly(size)
+
+        if headers.get("connection") == "close":
+            await self.close()
+        return status, size
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+        self.reader = self.writer = None
+
+
+async def run_load(host, port, plan, rps, connections, timeout, accept_encoding="identity"):
+    """
+    Sends the planned requests at a fixed arrival rate over a pool of connections.
+
+    Returns:
+        tuple: Per endpoint template a list of (latency seconds, status, bytes), status
+            0 for transport errors and timeouts, and the wall time of the run.
+    """
+    queue = asyncio.Queue()
+    results = {template: [] for template in ENDPOINT_MIX}
+
+    async def worker():
+        connection = Connection(host, port, accept_encoding)
+        while True:
+            item = await queue.get()
+            if item is None:
+                await connection.close()
+                return
+            template, path, due = item
+            try:
+                status, size = await asyncio.wait_for(connection.get(path), timeout)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError):
+                await connection.close()
+                status, size = 0, 0
+            results[template].append((time.perf_counter() - due, status, size))
+
+    workers = [asyncio.create_task(worker()) for _ in range(connections)]
+    start = time.perf_counter()
+    for number, (template, path) in enumerate(plan):
+        due = start + number / rps
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        queue.put_nowait((template, path, due))
+    for _ in workers:
+        queue.put_nowait(None)
+    await asyncio.gather(*workers)
+    return results, time.perf_counter() - start
+
+
+def summarize(results, wall_time):
+    report = {}
+    for template, samples in results.items():
+        if not samples:
+            continue
+        errors = sum(1 for _, status, _ in samples if status == 0 or status >= 500)
+        summary = latency_summary([latency for latency, _, _ in samples])
+        summary.update(
+            {
+                "throughput_rps": round(len(samples) / wall_time, 1),
+                "error_rate": round(errors / len(samples), 4),
+                "status_codes": {
+                    str(status): sum(1 for _, code, _ in samples if code == status)
+                    for status in sorted({status for _, status, _ in samples})
+                },
+                "mean_bytes": round(sum(size for _, _, size in samples) / len(samples)),
+            }
+        )
+        report[template] = summary
+    return report
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def start_server(database, port, workers, environment):
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning", "--no-access-log",
+        ],
+        env=dict(os.environ, DB_LOCATION=database, **environment),
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/companies/?limit=1", timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("uvicorn did not start within 60 seconds")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", help="Existing database to test against, seeded when left out")
+    parser.add_argument("--companies", type=int, default=20000, help="Companies to seed")
+    parser.add_argument("--rps", type=float, default=500, help="Target arrival rate")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds of load before measuring")
+    parser.add_argument("--connections", type=int, default=64, help="Keep-alive connections")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of the company ids")
+    parser.add_argument("--timeout", type=float, default=10, help="Request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--orjson", action="store_true", help="Serve with ORJSON_RESPONSES=true")
+    parser.add_argument("--accept-encoding", default="identity", help="Accept-Encoding of the requests, e.g. br, gzip")
+    parser.add_argument(
+        "--response-cache-mb", type=float, help="Serve with RESPONSE_CACHE_MB, 0 disables the response cache"
+    )
+    parser.add_argument("--report", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        database = args.database
+        if database is None:
+            database = os.path.join(folder, "loadtest.db")
+            use_database(database)
+            create_schema()
+            start = time.perf_counter()
+            seed_database(args.companies, args.seed)
+            print(f"Seeded {args.companies} companies in {time.perf_counter() - start:.1f} s")
+            numbers = company_numbers(args.companies)
+        else:
+            import sqlite3
+
+            with sqlite3.connect(database) as connection:
+                numbers = [row[0] for row in connection.execute("SELECT company_number FROM companies")]
+
+        port = free_port()
+        environment = {"ORJSON_RESPONSES": str(args.orjson).lower(), "COLUMNAR_SNAPSHOT_FOLDER": ""}
+        if args.response_cache_mb is not None:
+            environment["RESPONSE_CACHE_MB"] = str(args.response_cache_mb)
+        server = start_server(database, port, args.workers, environment)
+        try:
+            warmup = request_plan(numbers, int(args.rps * args.warmup), args.zipf, args.seed + 1)
+            asyncio.run(
+                run_load("127.0.0.1", port, warmup, args.rps, args.connections, args.timeout, args.accept_encoding)
+            )
+            plan = request_plan(numbers, int(args.rps * args.duration), args.zipf, args.seed)
+            results, wall_time = asyncio.run(
+                run_load("127.0.0.1", port, plan, args.rps, args.connections, args.timeout, args.accept_encoding)
+            )
+        finally:
+            server.terminate()
+            server.wait()
+
+    endpoints = summarize(results, wall_time)
+    all_samples = [sample for samples in results.values() for sample in samples]
+    overall = summarize({"all": all_samples}, wall_time)["all"]
+    report = {
+        "database": args.database,
+        "companies": len(numbers),
+        "target_rps": args.rps,
+        "duration_s": args.duration,
+        "connections": args.connections,
+        "workers": args.workers,
+        "zipf": args.zipf,
+        "orjson": args.orjson,
+        "accept_encoding": args.accept_encoding,
+        "response_cache_mb": args.response_cache_mb,
+        "overall": overall,
+        "endpoints": endpoints,
+    }
+    for template, summary in endpoints.items():
+        print(
+            f"{template}: {summary['throughput_rps']} rps, p50 {summary['p50_ms']} ms, "
+            f"p90 {summary['p90_ms']} ms, p99 {summary['p99_ms']} ms, errors {summary['error_rate']:.2%}"
+        )
+    print(
+        f"overall: {overall['throughput_rps']} rps of {args.rps} offered, "
+        f"p99 {overall['p99_ms']} ms, errors {overall['error_rate']:.2%}"
+    )
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    store_result("loadtest", report)
+
+
+if __name__ == "__main__":
+    main()
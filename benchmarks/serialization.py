@@ -0,0 +1,155 @@
+"""
+Compares the default and the orjson response path of the read endpoints on a large company.
+
+    python -m benchmarks.serialization --participants 5000 --entries 2000 --repeat 100
+"""
+import argparse
+import os
+import tempfile
+
+from benchmarks.common import create_schema, latency_summary, store_result, time_requests, use_database
+
+COMPANY_NUMBER = "F1103R_HRB1B"
+
+ENDPOINTS = [
+    f"/companies/{COMPANY_NUMBER}",
+    f"/register-entries/{COMPANY_NUMBER}",
+    f"/participant-persons/{COMPANY_NUMBER}",
+    f"/participant-organizations/{COMPANY_NUMBER}",
+    "/companies/?limit=1000",
+    # Sparse fieldsets: no subject matter, no code table joins
+    "/companies/?limit=1000&fields=company_number,current_designation",
+    f"/participant-persons/{COMPANY_NUMBER}?fields=first_name,last_name",
+]
+
+
+def seed_large_company(participants, entries):
+    import hr_api.models as models
+    from hr_api.database import writer_engine
+
+    with writer_engine.begin() as connection:
+        connection.execute(
+            models.SourceFiles.__table__.insert(),
+            [
+                {"id": number, "path": f"{number}/si/2024-01-01T00-00-00.xml"}
+                for number in range(1, 1001)
+            ],
+        )
+        connection.execute(
+            models.Companies.__table__.insert(),
+            [
+                {
+                    "court_sender_code": "F1103R",
+                    "current_designation": f"Benchmark {number} GmbH",
+                    "legal_form_code": "GMBH",
+                    "address_type_code": "1",
+                    "street": "Hauptstraße",
+                    "house_number": "1",
+                    "postal_code": "10115",
+                    "city": "Berlin",
+                    "state": "DE",
+                    "subject_matter": "Handel mit Waren aller Art. " * 20,
+                    "register_code": "HRB",
+                    "register_number": str(number),
+                    "register_number_addition": "B",
+                    "company_number": f"F1103R_HRB{number}B",
+                    "source_file_id": number,
+                }
+                for number in range(1, 1001)
+            ],
+        )
+        connection.execute(
+            models.ParticipantPersons.__table__.insert(),
+            [
+                {
+                    "role_number": str(index),
+                    "role_name_code": "179",
+                    "first_name": "Erika",
+                    "last_name": f"Musterfrau {index}",
+                    "birth_date": "1970-01-01",
+                    "gender_code": "2",
+                    "city": "Berlin",
+                    "state_code": "DE",
+                    "company_number": COMPANY_NUMBER,
+                    "source_file_id": 1,
+                }
+                for index in range(participants)
+            ],
+        )
+        connection.execute(
+            models.ParticipantOrganizations.__table__.insert(),
+            [
+                {
+                    "role_number": str(index),
+                    "role_name_code": "179",
+                    "name": f"Beteiligung {index} GmbH",
+                    "legal_form_code": "GMBH",
+                    "city": "Hamburg",
+                    "state_code": "DE",
+                    "company_number": COMPANY_NUMBER,
+                    "source_file_id": 1,
+                }
+                for index in range(participants)
+            ],
+        )
+        connection.execute(
+            models.Entries.__table__.insert(),
+            [
+                {
+                    "column": "6",
+                    "position": str(index),
+                    "running_number": str(index),
+                    "entry_type_code": "2",
+                    "text": f"Eintragung {index}: Kommanditist Musterfrau {index} eingetreten.",
+                    "company_number": COMPANY_NUMBER,
+                    "source_file_id": 1,
+                }
+                for index in range(entries)
+            ],
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--participants", type=int, default=5000)
+    parser.add_argument("--entries", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        use_database(os.path.join(folder, "benchmark.db"), RESPONSE_CACHE_MB=0)
+        create_schema()
+        seed_large_company(args.participants, args.entries)
+
+        import main as api
+        import hr_api.serialization as serialization
+
+        results = {}
+        for endpoint in ENDPOINTS:
+            results[endpoint] = {}
+            for path_name, enabled in (("default", False), ("orjson", True)):
+                serialization.ORJSON_RESPONSES = enabled
+                # Warm up the statement cache and the page cache
+                time_requests(api.app, endpoint, 3)
+                results[endpoint][path_name] = latency_summary(
+                    time_requests(api.app, endpoint, args.repeat)
+                )
+            default, fast = results[endpoint]["default"], results[endpoint]["orjson"]
+            print(
+                f"{endpoint}: p50 {default['p50_ms']} -> {fast['p50_ms']} ms, "
+                f"p99 {default['p99_ms']} -> {fast['p99_ms']} ms"
+            )
+
+    store_result(
+        "serialization",
+        {
+            "participants": args.participants,
+            "entries": args.entries,
+            "repeat": args.repeat,
+            "endpoints": results,
+        },
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Measures the cold start of an API worker: import time of main, app creation, and the
+time until a fresh uvicorn process answers its first request.
+
+Every measurement runs in a new interpreter. The script also checks that the API
+does not load the ingest stack (the XML parser, the HTTP client and hr_api.ingest).
+
+    python -m benchmarks.startup --repeat 10
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from benchmarks.common import create_schema, store_result, use_database
+from benchmarks.loadtest import free_port
+
+# Modules the API workers must not import
+INGEST_MODULES = ("xmltodict", "requests", "hr_api.ingest")
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.create_app()
+created = time.perf_counter()
+print(json.dumps({
+    "import_s": imported - start,
+    "create_app_s": created - imported,
+    "ingest_modules": [name for name in %r if name in sys.modules],
+}))
+"""
+
+
+def measure_import(environment):
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE % (INGEST_MODULES,)],
+        env=environment,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def top_imports(environment, count=15):
+    """
+    Returns the slowest direct imports of main by cumulative time from -X importtime.
+    """
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        env=environment,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stderr
+    modules = []
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+        if match:
+            modules.append((int(match.group(2)), len(match.group(3)), match.group(4)))
+    # main is imported at depth 1, its own imports are indented by two more spaces;
+    # deeper ones are already part of their parent's cumulative time
+    top_level = [(cumulative, name) for cumulative, depth, name in modules if depth == 3]
+    return [
+        {"module": name, "cumulative_ms": round(cumulative / 1000, 1)}
+        for cumulative, name in sorted(top_level, reverse=True)[:count]
+    ]
+
+
+def measure_first_request(environment):
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        env=environment,
+    )
+    try:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/companies/?limit=1", timeout=1):
+                    return time.perf_counter() - start
+            except OSError:
+                if time.perf_counter() - start > 60:
+                    raise RuntimeError("uvicorn did not answer within 60 seconds")
+                time.sleep(0.01)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def median(values):
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        database = os.path.join(folder, "startup.db")
+        use_database(database)
+        create_schema()
+        environment = dict(os.environ, DB_LOCATION=database)
+
+        imports = [measure_import(environment) for _ in range(args.repeat)]
+        first_requests = [measure_first_request(environment) for _ in range(args.repeat)]
+        slowest = top_imports(environment)
+
+    ingest_modules = sorted({name for probe in imports for name in probe["ingest_modules"]})
+    result = {
+        "repeat": args.repeat,
+        "import_ms": round(median([probe["import_s"] for probe in imports]) * 1000, 1),
+        "create_app_ms": round(median([probe["create_app_s"] for probe in imports]) * 1000, 1),
+        "first_request_ms": round(median(first_requests) * 1000, 1),
+        "ingest_modules_loaded": ingest_modules,
+        "slowest_imports": slowest,
+    }
+    print(
+        f"import main: {result['import_ms']} ms, create_app: {result['create_app_ms']} ms, "
+        f"uvicorn to first response: {result['first_request_ms']} ms"
+    )
+    for module in slowest[:5]:
+        print(f"  {module['module']}: {module['cumulative_ms']} ms")
+    if ingest_modules:
+        print(f"API workers load ingest modules: {', '.join(ingest_modules)}")
+    store_result("startup", result)
+    if ingest_modules:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
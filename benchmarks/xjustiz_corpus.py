@@ -0,0 +1,410 @@
+"""
+Generates a synthetic corpus of XJustiz register extracts (`tns:nachricht.reg.0400003`)
+in the layout of DOWNLOAD_FOLDER: `<root>/<id>/<company name>/si/<timestamp>.xml`.
+
+The documents vary the shapes the parser has to cope with: zero, one (a dict after
+xmltodict.parse) or many `tns:beteiligung` and `tns:eintragungstext` elements, one or
+several `tns:rolle`, persons and organizations, structured and free-text register
+numbers, and optional fields that are left out.
+
+    python -m benchmarks.xjustiz_corpus /tmp/corpus --companies 100000 --workers 8
+
+With --pack the extracts are compressed (gz, zst) or every register directory is
+packed into an archive (tar, tar.gz, tar.zst, zip), as hr_api.extract_files reads them.
+"""
+import argparse
+import glob
+import gzip
+import os
+import random
+import shutil
+import tarfile
+import time
+import zipfile
+from multiprocessing import Pool
+from xml.sax.saxutils import escape
+
+from benchmarks.common import CODE_TABLE_ROWS
+
+PACKINGS = ("gz", "zst", "tar", "tar.gz", "tar.zst", "zip")
+
+COURTS = [row["XJustiz_Id"] for row in CODE_TABLE_ROWS["gerichtscode"]]
+LEGAL_FORMS = {
+    "GMBH": "GmbH",
+    "UG": "UG (haftungsbeschränkt)",
+    "AG": "AG",
+    "KG": "KG",
+    "OHG": "OHG",
+    "EK": "e.K.",
+}
+REGISTERS = {"GMBH": "HRB", "UG": "HRB", "AG": "HRB", "KG": "HRA", "OHG": "HRA", "EK": "HRA"}
+PERSON_ROLES = ["086", "253", "265", "179"]
+ORGANIZATION_ROLES = ["179", "086"]
+
+NAME_WORDS = [
+    "Nord", "Süd", "Berliner", "Hanseatische", "Bayerische", "Rhein", "Main", "Elb",
+    "Technik", "Logistik", "Immobilien", "Beteiligungs", "Verwaltungs", "Handels",
+    "Software", "Consulting", "Energie", "Solar", "Bau", "Medien", "Holding", "Service",
+    "Müller", "Schmidt", "Schneider", "Fischer", "Weber", "Meyer", "Wagner", "Becker",
+    "Alpha", "Nova", "Kontor", "Werk", "Manufaktur", "Handwerk", "Digital", "Grün",
+]
+FIRST_NAMES = ["Anna", "Max", "Erika", "Jürgen", "Sabine", "Thomas", "Özlem", "Lukas", "Marie", "Stefan"]
+LAST_NAMES = ["Müller", "Schmidt", "Schneider", "Fischer", "Weber", "Meyer", "Wagner", "Becker", "Hoffmann", "Schäfer"]
+CITIES = [
+    ("Berlin", "10115"), ("München", "80331"), ("Hamburg", "20095"), ("Köln", "50667"),
+    ("Frankfurt am Main", "60311"), ("Leipzig", "04109"), ("Düsseldorf", "40213"), ("Bremen", "28195"),
+]
+STREETS = ["Hauptstraße", "Bahnhofstraße", "Schillerstraße", "Goethestraße", "Am Markt", "Lindenallee"]
+ENTRY_PHRASES = [
+    "Gesellschaft mit beschränkter Haftung.",
+    "Der Gesellschaftsvertrag ist am {date} abgeschlossen.",
+    "Die Gesellschafterversammlung vom {date} hat die Änderung des Gesellschaftsvertrages beschlossen.",
+    "Ist nur ein Geschäftsführer bestellt, so vertritt er die Gesellschaft allein.",
+    "Sind mehrere Geschäftsführer bestellt, so wird die Gesellschaft durch zwei Geschäftsführer oder durch einen Geschäftsführer gemeinsam mit einem Prokuristen vertreten.",
+    "Bestellt als Geschäftsführer: {person}, {city}, *{date}, einzelvertretungsberechtigt; mit der Befugnis, im Namen der Gesellschaft mit sich im eigenen Namen oder als Vertreter eines Dritten Rechtsgeschäfte abzuschließen.",
+    "Nicht mehr Geschäftsführer: {person}.",
+    "Einzelprokura: {person}, {city}, *{date}.",
+    "Geändert, nun: Geschäftsanschrift: {street} {number}, {postal_code} {city}.",
+    "Das Stammkapital ist um {amount} EUR auf {amount2} EUR erhöht.",
+    "Die Gesellschaft ist aufgelöst. Liquidator: {person}.",
+]
+SUBJECT_MATTERS = [
+    "Die Entwicklung und der Vertrieb von Software sowie die Erbringung damit verbundener Dienstleistungen.",
+    "Der Erwerb, die Verwaltung und die Veräußerung von Grundbesitz.",
+    "Der Handel mit Waren aller Art, soweit dieser nicht einer besonderen Erlaubnis bedarf.",
+    "Die Beteiligung an anderen Unternehmen sowie die Übernahme der persönlichen Haftung und der Geschäftsführung.",
+    "Die Planung, Errichtung und der Betrieb von Anlagen zur Erzeugung erneuerbarer Energien.",
+]
+
+DOCUMENT = """<?xml version="1.0" encoding="UTF-8"?>
+<tns:nachricht.reg.0400003 xmlns:tns="http://www.xjustiz.de" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+<tns:nachrichtenkopf>
+<tns:aktenzeichen.absender>{register_reference}</tns:aktenzeichen.absender>
+<tns:auswahl_absender><tns:absender.gericht listVersionID="11"><code>{court}</code></tns:absender.gericht></tns:auswahl_absender>
+<tns:erstellungszeitpunkt>{created}</tns:erstellungszeitpunkt>
+</tns:nachrichtenkopf>
+<tns:grunddaten>
+<tns:verfahrensdaten>
+<tns:instanzdaten><tns:aktenzeichen><tns:auswahl_aktenzeichen>{aktenzeichen}</tns:auswahl_aktenzeichen></tns:aktenzeichen></tns:instanzdaten>
+{beteiligungen}
+</tns:verfahrensdaten>
+</tns:grunddaten>
+<tns:fachdatenRegister>
+<tns:basisdatenRegister>
+<tns:rechtstraeger>
+{designation}<tns:angabenZurRechtsform><tns:rechtsform listVersionID="3.4"><code>{legal_form}</code></tns:rechtsform></tns:angabenZurRechtsform>
+<tns:sitz><tns:ort>{city}</tns:ort></tns:sitz>
+{anschrift}</tns:rechtstraeger>
+{satzungsdatum}{gegenstand}</tns:basisdatenRegister>
+{auszug}</tns:fachdatenRegister>
+</tns:nachricht.reg.0400003>
+"""
+
+
+def _date(rng, start_year=1950, end_year=2023):
+    return f"{rng.randint(start_year, end_year)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+
+
+def _staat():
+    return '<tns:staat><tns:auswahl_staat><tns:staat listVersionID="5"><code>DE</code></tns:staat></tns:auswahl_staat></tns:staat>'
+
+
+def _company_name(rng, legal_form):
+    words = rng.sample(NAME_WORDS, rng.randint(1, 3))
+    return f"{' '.join(words)} {LEGAL_FORMS[legal_form]}"
+
+
+def _rolle(rng, roles, role_number):
+    rolle = (
+        f"<tns:rolle><tns:rollennummer>{role_number}</tns:rollennummer>"
+        f'<tns:rollenbezeichnung listVersionID="3.5"><code>{rng.choice(roles)}</code></tns:rollenbezeichnung></tns:rolle>'
+    )
+    # Some participants carry several roles, which xmltodict turns into a list
+    if rng.random() < 0.1:
+        rolle += rolle
+    return rolle
+
+
+def _person(rng, role_number):
+    city, _ = rng.choice(CITIES)
+    geburt = f"<tns:geburt><tns:geburtsdatum>{_date(rng, 1940, 2000)}</tns:geburtsdatum></tns:geburt>" if rng.random() < 0.9 else ""
+    geschlecht = f'<tns:geschlecht listVersionID="2.1"><code>{rng.choice("123")}</code></tns:geschlecht>' if rng.random() < 0.8 else ""
+    anschrift = f"<tns:anschrift><tns:ort>{city}</tns:ort>{_staat()}</tns:anschrift>" if rng.random() < 0.9 else ""
+    return (
+        f"<tns:beteiligung>{_rolle(rng, PERSON_ROLES, role_number)}"
+        "<tns:beteiligter><tns:auswahl_beteiligter><tns:natuerlichePerson>"
+        f"<tns:vollerName><tns:vorname>{rng.choice(FIRST_NAMES)}</tns:vorname>"
+        f"<tns:nachname>{rng.choice(LAST_NAMES)}</tns:nachname></tns:vollerName>"
+        f"{geburt}{geschlecht}{anschrift}"
+        "</tns:natuerlichePerson></tns:auswahl_beteiligter></tns:beteiligter></tns:beteiligung>"
+    )
+
+
+def _organization(rng, role_number, name=None, legal_form=None, roles=ORGANIZATION_ROLES):
+    legal_form = legal_form or rng.choice(list(LEGAL_FORMS))
+    name = name or _company_name(rng, legal_form)
+    city, _ = rng.choice(CITIES)
+    anschrift = f"<tns:anschrift>{_staat()}</tns:anschrift>" if rng.random() < 0.7 else ""
+    return (
+        f"<tns:beteiligung>{_rolle(rng, roles, role_number)}"
+        "<tns:beteiligter><tns:auswahl_beteiligter><tns:organisation>"
+        f"<tns:bezeichnung><tns:bezeichnung.aktuell>{escape(name)}</tns:bezeichnung.aktuell></tns:bezeichnung>"
+        f'<tns:angabenZurRechtsform><tns:rechtsform listVersionID="3.4"><code>{legal_form}</code></tns:rechtsform></tns:angabenZurRechtsform>'
+        f"<tns:sitz><tns:ort>{city}</tns:ort></tns:sitz>{anschrift}"
+        "</tns:organisation></tns:auswahl_beteiligter></tns:beteiligter></tns:beteiligung>"
+    )
+
+
+def _participant_count(rng):
+    # Mostly small companies, a long tail of large ones (e.g. KGs with many limited partners)
+    roll = rng.random()
+    if roll < 0.05:
+        return 0
+    if roll < 0.35:
+        return 1
+    if roll < 0.98:
+        return rng.randint(2, 8)
+    return rng.randint(50, 500)
+
+
+def _entry_text(rng):
+    city, postal_code = rng.choice(CITIES)
+    phrases = rng.choices(ENTRY_PHRASES, k=rng.randint(1, 8))
+    return " ".join(
+        phrase.format(
+            date=_date(rng),
+            person=f"{rng.choice(LAST_NAMES)}, {rng.choice(FIRST_NAMES)}",
+            city=city,
+            street=rng.choice(STREETS),
+            number=rng.randint(1, 200),
+            postal_code=postal_code,
+            amount=rng.randint(1, 500) * 1000,
+            amount2=rng.randint(500, 5000) * 1000,
+        )
+        for phrase in phrases
+    )
+
+
+def _entries(rng):
+    count = rng.choice([0, 1, 1, 2, 3, 4, 5, 8, 12, 20])
+    return [
+        "<tns:eintragungstext>"
+        f"<tns:spalte>{rng.choice([2, 3, 4, 5, 6])}</tns:spalte>"
+        f"<tns:position>{position}</tns:position>"
+        f"<tns:laufendeNummer>{position}</tns:laufendeNummer>"
+        f'<tns:eintragungsart listVersionID="2.0"><code>{rng.choice("123")}</code></tns:eintragungsart>'
+        f"<tns:text>{escape(_entry_text(rng))}</tns:text>"
+        "</tns:eintragungstext>"
+        for position in range(1, count + 1)
+    ]
+
+
+def _auszug(entries):
+    if not entries:
+        return ""
+    return "<tns:auszug>\n" + "\n".join(entries) + "\n</tns:auszug>\n"
+
+
+def _anschrift(street, house_number, postal_code, city):
+    return (
+        '<tns:anschrift><tns:anschriftstyp listVersionID="3.0"><code>1</code></tns:anschriftstyp>'
+        f"<tns:strasse>{street}</tns:strasse><tns:hausnummer>{house_number}</tns:hausnummer>"
+        f"<tns:postleitzahl>{postal_code}</tns:postleitzahl><tns:ort>{city}</tns:ort>{_staat()}</tns:anschrift>\n"
+    )
+
+
+def company_document(seed, index, snapshot=0):
+    """
+    Builds one register extract.
+
+    The company data only depends on seed and index, so the snapshots of a company
+    differ in the details that change over time, not in its identity. Snapshot 0 is
+    the newest, older ones are derived from it like real extracts: they lack the
+    latest register entries, and now and then a participant or the address differs.
+
+    Returns:
+        tuple: The register directory, the company directory and the XML text.
+    """
+    rng = random.Random(f"{seed}-{index}")
+    court = rng.choice(COURTS)
+    legal_form = rng.choice(list(LEGAL_FORMS))
+    register = REGISTERS[legal_form]
+    number = 1000 + index
+    addition = "B" if court == "F1103R" and register == "HRB" else ""
+    name = _company_name(rng, legal_form)
+    city, postal_code = rng.choice(CITIES)
+
+    rng = random.Random(f"{seed}-{index}-0")
+    if rng.random() < 0.9:
+        aktenzeichen = (
+            "<tns:aktenzeichen.strukturiert>"
+            f'<tns:register listVersionID="1.0"><code>{register}</code></tns:register>'
+            f"<tns:laufendeNummer>{number}</tns:laufendeNummer>"
+            + (f"<tns:zusatz>{addition}</tns:zusatz>" if addition else "")
+            + "</tns:aktenzeichen.strukturiert>"
+        )
+    else:
+        aktenzeichen = f"<tns:aktenzeichen.strukturiert><tns:aktenzeichen.freitext>{register} {number} {addition or 'X'}</tns:aktenzeichen.freitext></tns:aktenzeichen.strukturiert>"
+
+    beteiligungen = []
+    # Some extracts only name the company as the Rechtsträger participant
+    designation_in_participants = rng.random() < 0.05
+    if designation_in_participants:
+        beteiligungen.append(_organization(rng, 1, name=name, legal_form=legal_form, roles=["287"]))
+    for role_number in range(len(beteiligungen) + 1, len(beteiligungen) + 1 + _participant_count(rng)):
+        if rng.random() < 0.85:
+            beteiligungen.append(_person(rng, role_number))
+        else:
+            beteiligungen.append(_organization(rng, role_number))
+
+    designation = (
+        ""
+        if designation_in_participants
+        else f"<tns:bezeichnung><tns:bezeichnung.aktuell>{escape(name)}</tns:bezeichnung.aktuell></tns:bezeichnung>\n"
+    )
+    address = (rng.choice(STREETS), rng.randint(1, 200)) if rng.random() < 0.9 else None
+    satzungsdatum = (
+        f"<tns:satzungsdatum><tns:aktuellesSatzungsdatum>{_date(rng)}</tns:aktuellesSatzungsdatum></tns:satzungsdatum>\n"
+        if register == "HRB"
+        else ""
+    )
+    gegenstand = f"<tns:gegenstand>{escape(rng.choice(SUBJECT_MATTERS))}</tns:gegenstand>\n" if rng.random() < 0.95 else ""
+    entries = _entries(rng)
+
+    # Step back from the newest snapshot to the requested one
+    first_changeable = 1 if designation_in_participants else 0
+    for step in range(1, snapshot + 1):
+        rng = random.Random(f"{seed}-{index}-{step}")
+        del entries[len(entries) - min(len(entries), rng.randint(0, 2)) :]
+        if len(beteiligungen) > first_changeable and rng.random() < 0.3:
+            position = rng.randrange(first_changeable, len(beteiligungen))
+            beteiligungen[position] = _person(rng, position + 1)
+        if address is not None and rng.random() < 0.2:
+            address = (rng.choice(STREETS), rng.randint(1, 200))
+    anschrift = _anschrift(*address, postal_code, city) if address is not None else ""
+
+    document = DOCUMENT.format(
+        register_reference=f"{register} {number} {addition}".strip(),
+        court=court,
+        created=f"{2024 - snapshot}-03-11T13:59:19",
+        aktenzeichen=aktenzeichen,
+        beteiligungen="\n".join(beteiligungen),
+        designation=designation,
+        legal_form=legal_form,
+        city=city,
+        anschrift=anschrift,
+        satzungsdatum=satzungsdatum,
+        gegenstand=gegenstand,
+        auszug=_auszug(entries),
+    )
+    company_dir = name.replace("/", "-")
+    return str(number), company_dir, document
+
+
+def _write_range(arguments):
+    root, seed, start, stop, snapshots = arguments
+    written = 0
+    for index in range(start, stop):
+        rng = random.Random(f"{seed}-{index}-snapshots")
+        for snapshot in range(rng.randint(1, snapshots)):
+            register_dir, company_dir, document = company_document(seed, index, snapshot)
+            folder = os.path.join(root, register_dir, company_dir, "si")
+            os.makedirs(folder, exist_ok=True)
+            timestamp = f"{2024 - snapshot}-03-11T13-59-19"
+            with open(os.path.join(folder, f"{timestamp}.xml"), "w", encoding="utf-8") as file:
+                file.write(document)
+            written += 1
+    return written
+
+
+def write_corpus(root, companies, seed=42, snapshots=1, workers=1, chunk_size=1000):
+    """
+    Writes a corpus of `companies` companies with up to `snapshots` extracts each.
+
+    Returns:
+        int: The number of files written.
+    """
+    chunks = [
+        (root, seed, start, min(start + chunk_size, companies), snapshots)
+        for start in range(0, companies, chunk_size)
+    ]
+    if workers <= 1:
+        return sum(_write_range(chunk) for chunk in chunks)
+    with Pool(workers) as pool:
+        return sum(pool.imap_unordered(_write_range, chunks))
+
+
+def _pack_register_dir(root, register_dir, packing):
+    archive = os.path.join(root, f"{register_dir}.{packing}")
+    folder = os.path.join(root, register_dir)
+    if packing == "zip":
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zip_file:
+            for path in sorted(glob.glob(f"{glob.escape(folder)}/*/si/*")):
+                zip_file.write(path, os.path.relpath(path, root))
+    elif packing == "tar.zst":
+        import zstandard
+
+        with open(archive, "wb") as file, zstandard.ZstdCompressor().stream_writer(file) as stream:
+            with tarfile.open(fileobj=stream, mode="w|") as tar:
+                tar.add(folder, arcname=register_dir)
+    else:
+        with tarfile.open(archive, "w:gz" if packing == "tar.gz" else "w") as tar:
+            tar.add(folder, arcname=register_dir)
+    shutil.rmtree(folder)
+
+
+def pack_corpus(root, packing):
+    """
+    Compresses every extract of a corpus, or packs every register directory into an
+    archive in its place.
+
+    Args:
+        root (str): The corpus folder.
+        packing (str): One of PACKINGS.
+
+    Returns:
+        int: The size of the corpus in bytes.
+    """
+    if packing in ("gz", "zst"):
+        if packing == "zst":
+            import zstandard
+
+            compress = zstandard.ZstdCompressor().compress
+        else:
+            compress = gzip.compress
+        for path in glob.glob(f"{glob.escape(root)}/*/*/si/*.xml"):
+            with open(path, "rb") as file:
+                data = file.read()
+            with open(f"{path}.{packing}", "wb") as file:
+                file.write(compress(data))
+            os.remove(path)
+    else:
+        for register_dir in sorted(os.listdir(root)):
+            if os.path.isdir(os.path.join(root, register_dir)):
+                _pack_register_dir(root, register_dir, packing)
+    return sum(
+        os.path.getsize(os.path.join(folder, name)) for folder, _, names in os.walk(root) for name in names
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", help="Output folder, used as DOWNLOAD_FOLDER")
+    parser.add_argument("--companies", type=int, default=1000)
+    parser.add_argument("--snapshots", type=int, default=1, help="Maximum number of si extracts per company")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--pack", choices=PACKINGS, help="Compress the extracts or archive the register directories")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    files = write_corpus(args.root, args.companies, args.seed, args.snapshots, args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {files} files for {args.companies} companies to {args.root} in {elapsed:.1f} s")
+    if args.pack:
+        size = pack_corpus(args.root, args.pack)
+        print(f"Packed the corpus as {args.pack}, {size / (1024 * 1024):.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Request coalescing and admission control for the expensive admin and analytics routes.
+
+SingleFlightMiddleware lets concurrent identical GET requests to a coalesced route
+share one run of the endpoint: the first request runs it, the others wait for it and
+get a copy of its response. ConcurrencyLimitMiddleware caps the requests running per
+route template, queues a bounded number of further ones and answers the rest with
+429, so full directory walks and ingests cannot take all worker threads from the
+lookup endpoints.
+
+Both work per API worker process.
+"""
+import asyncio
+import logging
+import os
+
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+
+from hr_api.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Requests running at once per route template, 0 lifts the limit
+ADMIN_CONCURRENCY_LIMIT = int(os.getenv("ADMIN_CONCURRENCY_LIMIT", "1"))
+ANALYTICS_CONCURRENCY_LIMIT = int(os.getenv("ANALYTICS_CONCURRENCY_LIMIT", "2"))
+# Requests waiting per route template before further ones get a 429
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "8"))
+# Seconds a queued request waits for its turn before it gets a 429
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+
+ADMISSION_LIMITS = {
+    "/admin/": ADMIN_CONCURRENCY_LIMIT,
+    "/analytics/": ANALYTICS_CONCURRENCY_LIMIT,
+}
+
+COALESCED_REQUESTS = Counter(
+    "hr_api_coalesced_requests_total",
+    "Requests answered with the response of an identical request in flight.",
+    ("route",),
+)
+ADMISSION_REJECTED = Counter(
+    "hr_api_admission_rejected_total",
+    "Requests answered with 429 because their route was at its concurrency limit.",
+    ("route", "reason"),
+)
+ADMISSION_QUEUED = Gauge(
+    "hr_api_admission_queued_requests",
+    "Requests waiting for their route to drop below its concurrency limit.",
+    ("route",),
+)
+
+
+def matching_route(scope):
+    """
+    Returns the route a request will be routed to, or None.
+
+    The router only stores the matched route in the scope after the middlewares ran,
+    so it is matched here the same way.
+    """
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route
+    return None
+
+
+def route_template(scope):
+    """
+    Returns the template of the route a request will be routed to, or None.
+    """
+    route = matching_route(scope)
+    return route.path if route is not None else None
+
+
+class SingleFlightMiddleware:
+    """
+    ASGI middleware sharing one endpoint run between concurrent identical GET requests.
+
+    Requests are identical when they have the same path and query string. Only the
+    routes passed in are coalesced, their responses must not depend on request headers.
+    """
+
+    def __init__(self, app, routes=()):
+        self.app = app
+        self.routes = frozenset(routes)
+        # Static part of the templates, to pass other requests on without matching them
+        self.prefixes = tuple({route.split("{")[0] for route in self.routes})
+        self.in_flight = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or not scope["path"].startswith(self.prefixes):
+            await self.app(scope, receive, send)
+            return
+        route = route_template(scope)
+        if route not in self.routes:
+            await self.app(scope, receive, send)
+            return
+
+        key = (scope["path"], scope["query_string"])
+        leader = self.in_flight.get(key)
+        if leader is not None:
+            COALESCED_REQUESTS.inc(route=route)
+            messages, error = await asyncio.shield(leader)
+            if error is not None:
+                raise error
+            for message in messages:
+                await send(message)
+            return
+
+        flight = self.in_flight[key] = asyncio.get_running_loop().create_future()
+        messages = []
+
+        async def send_wrapper(message):
+            messages.append(message)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as exception:
+            # Followers re-raise it, a result instead of set_exception avoids the
+            # "never retrieved" warning when there are none
+            flight.set_result((messages, exception))
+            raise
+        else:
+            flight.set_result((messages, None))
+        finally:
+            del self.in_flight[key]
+
+
+class _RouteLimit:
+    def __init__(self, limit):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.waiting = 0
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    ASGI middleware limiting the requests running per route template.
+
+    Args:
+        limits (dict): The concurrency limit of the routes under each path prefix.
+        queue_size (int): Requests waiting per route before further ones are rejected.
+        queue_timeout (float): Seconds a request waits before it is rejected.
+    """
+
+    def __init__(self, app, limits=None, queue_size=ADMISSION_QUEUE_SIZE, queue_timeout=ADMISSION_QUEUE_TIMEOUT):
+        self.app = app
+        self.limits = {prefix: limit for prefix, limit in (limits or ADMISSION_LIMITS).items() if limit > 0}
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.routes = {}
+
+    def _route_limit(self, scope):
+        path = scope["path"]
+        for prefix, limit in self.limits.items():
+            if path.startswith(prefix):
+                route = route_template(scope)
+                if route is None:
+                    return None, None
+                if route not in self.routes:
+                    self.routes[route] = _RouteLimit(limit)
+                return route, self.routes[route]
+        return None, None
+
+    async def _reject(self, scope, receive, send, route, reason):
+        ADMISSION_REJECTED.inc(route=route, reason=reason)
+        response = JSONResponse(
+            {"detail": f"Too many concurrent requests to {route}, retry later"},
+            status_code=429,
+            headers={"Retry-After": str(max(1, round(self.queue_timeout)))},
+        )
+        await response(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route, limit = self._route_limit(scope)
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        if limit.semaphore.locked():
+            if limit.waiting >= self.queue_size:
+                await self._reject(scope, receive, send, route, "queue_full")
+                return
+            limit.waiting += 1
+            ADMISSION_QUEUED.inc(route=route)
+            try:
+                await asyncio.wait_for(limit.semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                await self._reject(scope, receive, send, route, "queue_timeout")
+                return
+            finally:
+                limit.waiting -= 1
+                ADMISSION_QUEUED.dec(route=route)
+        else:
+            await limit.semaphore.acquire()
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limit.semaphore.release()
@@ -0,0 +1,230 @@
+from enum import Enum
+
+from sqlalchemy import func, insert, literal, select, delete, update
+from sqlalchemy.orm import Session
+
+import hr_api.models as models
+
+# Number of leading postal code digits forming a region
+POSTAL_REGION_LENGTH = 2
+
+
+class CompanyFacet(str, Enum):
+    legal_form_code = "legal_form_code"
+    court_sender_code = "court_sender_code"
+    state = "state"
+    postal_region = "postal_region"
+
+
+class ParticipantType(str, Enum):
+    persons = "persons"
+    organizations = "organizations"
+
+
+PARTICIPANT_TABLES = {
+    ParticipantType.persons: models.ParticipantPersons,
+    ParticipantType.organizations: models.ParticipantOrganizations,
+}
+
+# Code table columns providing the label of a facet value
+FACET_LABELS = {
+    CompanyFacet.legal_form_code: (models.Rechtsform.code, models.Rechtsform.wert),
+    CompanyFacet.court_sender_code: (
+        models.Gerichtscode.XJustiz_Id,
+        models.Gerichtscode.Registergericht,
+    ),
+}
+
+
+def refresh_aggregates(db: Session, generation: int):
+    """
+    Recomputes the aggregate tables from the data tables.
+
+    Called at the end of an ingest run, so the statistics endpoints never scan
+    the data tables themselves.
+
+    Args:
+        db (Session): A writer session.
+        generation (int): The ingest generation the aggregates belong to.
+    """
+    db.execute(delete(models.CompanyFacets))
+    db.execute(delete(models.ParticipantRoleFacets))
+
+    postal_region = func.substr(models.Companies.postal_code, 1, POSTAL_REGION_LENGTH)
+    db.execute(
+        insert(models.CompanyFacets).from_select(
+            [
+                "legal_form_code",
+                "court_sender_code",
+                "state",
+                "postal_region",
+                "companies",
+                "generation",
+            ],
+            select(
+                models.Companies.legal_form_code,
+                models.Companies.court_sender_code,
+                models.Companies.state,
+                postal_region,
+                func.count(),
+                literal(generation),
+            ).group_by(
+                models.Companies.legal_form_code,
+                models.Companies.court_sender_code,
+                models.Companies.state,
+                postal_region,
+            ),
+        )
+    )
+
+    for participant_type, table in PARTICIPANT_TABLES.items():
+        db.execute(
+            insert(models.ParticipantRoleFacets).from_select(
+                ["participant_type", "role_name_code", "participants", "generation"],
+                select(
+                    literal(participant_type.value),
+                    table.role_name_code,
+                    func.count(),
+                    literal(generation),
+                ).group_by(table.role_name_code),
+            )
+        )
+    db.commit()
+
+
+def add_company(db: Session, company):
+    """
+    Counts a company added outside of an ingest in its row of company_facets.
+
+    Called in the transaction adding the company, so the counts agree with the
+    companies table until the next ingest recomputes them. Before the first ingest
+    there are no aggregates to update, count_companies then counts the companies
+    table itself.
+
+    Args:
+        db (Session): The writer session adding the company.
+        company (Company): The company.
+    """
+    if not has_aggregates(db):
+        return
+    postal_code = company.postal_code
+    values = {
+        "legal_form_code": company.legal_form_code,
+        "court_sender_code": company.court_sender_code,
+        "state": company.state,
+        "postal_region": postal_code[:POSTAL_REGION_LENGTH] if postal_code is not None else None,
+    }
+    # IS also matches the facet rows of companies without a value
+    matching = [getattr(models.CompanyFacets, name).is_(value) for name, value in values.items()]
+    result = db.execute(
+        update(models.CompanyFacets).where(*matching).values(companies=models.CompanyFacets.companies + 1)
+    )
+    if result.rowcount == 0:
+        generation = db.execute(select(func.max(models.CompanyFacets.generation))).scalar()
+        db.execute(insert(models.CompanyFacets).values(**values, companies=1, generation=generation))
+
+
+def _facet_filters(stmt, filters):
+    for facet, value in filters.items():
+        if value is not None:
+            stmt = stmt.where(getattr(models.CompanyFacets, facet.value) == value)
+    return stmt
+
+
+def has_aggregates(db: Session):
+    return db.execute(select(models.CompanyFacets.id).limit(1)).first() is not None
+
+
+def count_companies(db: Session, filters: dict):
+    """
+    Counts the companies matching a combination of facet values.
+
+    Args:
+        db (Session): The database session.
+        filters (dict): Facet values keyed by CompanyFacet, None values are ignored.
+
+    Returns:
+        int: The number of matching companies.
+    """
+    if not has_aggregates(db):
+        # No ingest has run yet, count the companies table directly
+        stmt = select(func.count()).select_from(models.Companies)
+        for facet, value in filters.items():
+            if value is None:
+                continue
+            if facet == CompanyFacet.postal_region:
+                column = func.substr(models.Companies.postal_code, 1, POSTAL_REGION_LENGTH)
+            else:
+                column = getattr(models.Companies, facet.value)
+            stmt = stmt.where(column == value)
+        return db.execute(stmt).scalar()
+
+    stmt = select(func.coalesce(func.sum(models.CompanyFacets.companies), 0))
+    return db.execute(_facet_filters(stmt, filters)).scalar()
+
+
+def company_distribution(db: Session, facet: CompanyFacet, filters: dict):
+    """
+    Counts the companies per value of a facet, under a combination of other facet values.
+
+    Args:
+        db (Session): The database session.
+        facet (CompanyFacet): The facet to group by.
+        filters (dict): Facet values keyed by CompanyFacet, None values are ignored.
+
+    Returns:
+        list: Dictionaries with the facet value and label and the number of companies,
+            ordered by the number of companies.
+    """
+    column = getattr(models.CompanyFacets, facet.value)
+    total = func.sum(models.CompanyFacets.companies).label("companies")
+    stmt = _facet_filters(select(column, total).group_by(column), filters)
+    stmt = stmt.order_by(total.desc())
+    rows = db.execute(stmt).fetchall()
+
+    labels = {}
+    if facet in FACET_LABELS:
+        code, label = FACET_LABELS[facet]
+        labels = dict(db.execute(select(code, label)).fetchall())
+
+    return [
+        {
+            facet.value: {"value": row[0], "label": labels.get(row[0])},
+            "companies": row.companies,
+        }
+        for row in rows
+    ]
+
+
+def participant_role_distribution(db: Session, participant_type: ParticipantType):
+    """
+    Counts the participants of a type per role.
+
+    Args:
+        db (Session): The database session.
+        participant_type (ParticipantType): persons or organizations.
+
+    Returns:
+        list: Dictionaries with the role code, its label and the number of participants.
+    """
+    rows = db.execute(
+        select(
+            models.ParticipantRoleFacets.role_name_code,
+            models.Rollenbezeichnung.wert,
+            models.ParticipantRoleFacets.participants,
+        )
+        .outerjoin(
+            models.Rollenbezeichnung,
+            models.ParticipantRoleFacets.role_name_code == models.Rollenbezeichnung.code,
+        )
+        .where(models.ParticipantRoleFacets.participant_type == participant_type.value)
+        .order_by(models.ParticipantRoleFacets.participants.desc())
+    ).fetchall()
+
+    return [
+        {
+            "role_name_code": {"value": row[0], "label": row[1]},
+            "participants": row[2],
+        }
+        for row in rows
+    ]
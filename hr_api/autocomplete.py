@@ -0,0 +1,164 @@
+"""
+Type-ahead on company names from an in-memory sorted index.
+
+Every API worker keeps the names of all companies in a sorted list of lookup keys
+(see hr_api.names.company_name_key): one key per name and one per word the name
+continues with, so "sued" finds "Alpha Grün Süd KG". A prefix is found with a binary
+search, the matches are ranked by how well they match. The index is built on the
+first request and rebuilt in the background when the readers see a new finished
+ingest run, the old one answers until the new one is ready.
+"""
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+
+from sqlalchemy import select
+
+import hr_api.models as models
+from hr_api.database import SessionLocal, reader_database
+from hr_api.names import company_name_key
+
+logger = logging.getLogger(__name__)
+
+# Index entries looked at per query, bounds the latency of very short prefixes
+AUTOCOMPLETE_SCAN_LIMIT = 2000
+
+
+class NameIndex:
+    """
+    Sorted lookup keys of the company names of one database and generation.
+    """
+
+    def __init__(self, version, companies):
+        self.version = version
+        self.company_numbers = []
+        self.designations = []
+        self.name_keys = []
+        entries = []
+        for company_number, designation in companies:
+            if not designation:
+                continue
+            company = len(self.company_numbers)
+            self.company_numbers.append(company_number)
+            self.designations.append(designation)
+            name_key = company_name_key(designation)
+            self.name_keys.append(name_key)
+            words = name_key.split()
+            for word in range(len(words)):
+                entries.append((" ".join(words[word:]), company, word))
+        entries.sort()
+        self.keys = [key for key, _, _ in entries]
+        self.companies = array("I", (company for _, company, _ in entries))
+        self.words = array("H", (min(word, 65535) for _, _, word in entries))
+
+    def __len__(self):
+        return len(self.company_numbers)
+
+    def complete(self, prefix, limit=10):
+        """
+        Returns the companies whose name starts with a prefix, or has a word that does.
+
+        Names starting with the prefix rank before names with a later word starting
+        with it, exact names before longer ones, and shorter names before longer ones.
+        """
+        query = company_name_key(prefix)
+        if not query:
+            return []
+
+        best = {}
+        start = bisect_left(self.keys, query)
+        for position in range(start, min(start + AUTOCOMPLETE_SCAN_LIMIT, len(self.keys))):
+            key = self.keys[position]
+            if not key.startswith(query):
+                break
+            company = self.companies[position]
+            word = self.words[position]
+            name_key = self.name_keys[company]
+            rank = (word > 0, name_key != query, len(name_key), self.designations[company])
+            if company not in best or rank < best[company]:
+                best[company] = rank
+
+        ranked = sorted(best.items(), key=lambda item: item[1])[:limit]
+        return [
+            {
+                "company_number": self.company_numbers[company],
+                "current_designation": self.designations[company],
+                "match": "exact" if not rank[1] else "word" if rank[0] else "prefix",
+            }
+            for company, rank in ranked
+        ]
+
+
+_index = None
+_lock = threading.Lock()
+_rebuild = None
+
+
+def data_version(db):
+    """
+    Returns what the index was built from: the database the readers use and the
+    generation of its latest finished ingest run.
+
+    Not the latest generation, which an ingest adds when it starts: a rebuild during
+    the run would read half-loaded tables and keep them after the run.
+    """
+    generation = db.execute(
+        select(models.IngestRuns.generation)
+        .where(models.IngestRuns.status == "finished")
+        .order_by(models.IngestRuns.generation.desc())
+        .limit(1)
+    ).scalar()
+    return reader_database()["path"], generation
+
+
+def build_index(db):
+    version = data_version(db)
+    companies = db.execute(select(models.Companies.company_number, models.Companies.current_designation))
+    index = NameIndex(version, companies)
+    logger.info(f"Built the company name index of generation {version[1]} with {len(index)} names")
+    return index
+
+
+def _rebuild_in_background():
+    global _index
+    try:
+        with SessionLocal() as db:
+            _index = build_index(db)
+    except Exception:
+        logger.exception("Could not rebuild the company name index")
+
+
+def refresh_in_background():
+    """
+    Starts a rebuild of the index unless one is running.
+    """
+    global _rebuild
+    with _lock:
+        if _rebuild is None or not _rebuild.is_alive():
+            _rebuild = threading.Thread(target=_rebuild_in_background, name="autocomplete-index", daemon=True)
+            _rebuild.start()
+
+
+def get_index(db):
+    """
+    Returns the index of the current generation, or the previous one while it is rebuilt.
+    """
+    global _index
+    index = _index
+    if index is None:
+        # Wait for the build started at startup instead of building a second index
+        rebuild = _rebuild
+        if rebuild is not None:
+            rebuild.join()
+        with _lock:
+            if _index is None:
+                _index = build_index(db)
+            return _index
+    if index.version != data_version(db):
+        refresh_in_background()
+    return index
+
+
+def complete(db, prefix, limit=10):
+    return get_index(db).complete(prefix, limit)
@@ -0,0 +1,201 @@
+"""
+Per-company change events recorded by the ingest, served by /changes.
+
+refresh_db replaces all rows, so the ingest keeps a fingerprint of every company
+in `company_fingerprints`: a CRC32 per company field, one over its participants and
+one over its register entries. Each ingested company is compared with its stored
+fingerprint and an `inserted` or `updated` event with the changed fields is written
+to `company_changes`; companies the run did not see again get a `deleted` event.
+Unchanged companies get no event, neither does a new extract file with the same
+content. The event ids only grow, so they are the cursor of the feed.
+
+Fingerprints start with FINGERPRINT_VERSION. One of another version can not be
+compared, it is replaced without an event.
+"""
+import json
+import logging
+import struct
+import zlib
+
+from sqlalchemy import delete, insert, literal, select
+
+import hr_api.models as models
+from hr_api.schemas import Company
+
+logger = logging.getLogger(__name__)
+
+# The link to OpenCorporates is derived from the company number, the file is not content
+COMPANY_FIELDS = tuple(name for name in Company.model_fields if name not in ("opencorporates", "file_path"))
+FINGERPRINT_FIELDS = COMPANY_FIELDS + ("participants", "entries")
+# Increase with any change of the fields or of how they are checksummed
+FINGERPRINT_VERSION = 1
+FINGERPRINT_FORMAT = struct.Struct(f"<B{len(FINGERPRINT_FIELDS)}I")
+
+
+def _checksum(value):
+    return zlib.crc32(repr(value).encode("utf-8"))
+
+
+def _rows_checksum(rows):
+    # The order of participants and entries in the extract is not a change
+    return _checksum(sorted(repr([value for name, value in row if name != "file_path"]) for row in rows))
+
+
+def fingerprint(company, parties, entries):
+    """
+    Returns the fingerprint of a company as stored in company_fingerprints.
+
+    Args:
+        company (Company): The company as extracted from the register file.
+        parties (list): Its ParticipantPerson and ParticipantOrganization items.
+        entries (list): Its RegisterEntry items.
+
+    Returns:
+        bytes: FINGERPRINT_VERSION and one CRC32 per field of FINGERPRINT_FIELDS.
+    """
+    checksums = [_checksum(getattr(company, name)) for name in COMPANY_FIELDS]
+    checksums.append(_rows_checksum(parties))
+    checksums.append(_rows_checksum(entries))
+    return FINGERPRINT_FORMAT.pack(FINGERPRINT_VERSION, *checksums)
+
+
+def changed_fields(previous, current):
+    """
+    Returns the fields whose checksums differ between two fingerprints.
+
+    Returns:
+        list: The changed fields of FINGERPRINT_FIELDS, None when the previous
+            fingerprint is of another version and can not be compared.
+    """
+    # Fingerprints before versioning had no version byte and another size
+    if previous is None or len(previous) != FINGERPRINT_FORMAT.size or previous[0] != FINGERPRINT_VERSION:
+        return None
+    return [
+        name
+        for name, before, after in zip(
+            FINGERPRINT_FIELDS, FINGERPRINT_FORMAT.unpack(previous)[1:], FINGERPRINT_FORMAT.unpack(current)[1:]
+        )
+        if before != after
+    ]
+
+
+def record_company(db, company, parties, entries, generation):
+    """
+    Compares an ingested company with its fingerprint and adds its change event.
+
+    The event and the new fingerprint are added to the session and committed with
+    the company rows.
+
+    Args:
+        db (Session): The writer session.
+        company (Company): The company as extracted from the register file.
+        parties (list): Its participants.
+        entries (list): Its register entries.
+        generation (int): The ingest generation.
+
+    Returns:
+        str: The change type, or None when the company did not change.
+    """
+    current = fingerprint(company, parties, entries)
+    # The company rows are flushed with the commit, not by this lookup
+    with db.no_autoflush:
+        stored = db.get(models.CompanyFingerprints, company.company_number)
+
+    if stored is None:
+        change_type, fields = "inserted", None
+        db.add(
+            models.CompanyFingerprints(
+                company_number=company.company_number, generation=generation, fingerprint=current
+            )
+        )
+    else:
+        # A fingerprint of another version is only replaced
+        fields = changed_fields(stored.fingerprint, current)
+        change_type = "updated" if fields else None
+        stored.generation = generation
+        stored.fingerprint = current
+
+    if change_type is not None:
+        db.add(
+            models.CompanyChanges(
+                generation=generation,
+                company_number=company.company_number,
+                change_type=change_type,
+                changed_fields=json.dumps(fields) if fields else None,
+            )
+        )
+    return change_type
+
+
+def record_deletions(db, generation):
+    """
+    Adds a deleted event for every company the ingest generation did not see.
+
+    Only call it after a complete run, a failed one would report the companies it
+    did not get to as deleted.
+
+    Returns:
+        int: The number of deleted companies.
+    """
+    fingerprints = models.CompanyFingerprints
+    missing = fingerprints.generation != generation
+    result = db.execute(
+        insert(models.CompanyChanges).from_select(
+            ["generation", "company_number", "change_type"],
+            select(literal(generation), fingerprints.company_number, literal("deleted"))
+            .where(missing)
+            .order_by(fingerprints.company_number),
+        )
+    )
+    db.execute(delete(fingerprints).where(missing))
+    db.commit()
+    logger.info(f"Ingest generation {generation} deleted {result.rowcount} companies")
+    return result.rowcount
+
+
+def read_changes(db, since=0, cursor=0, limit=1000):
+    """
+    Returns one page of the change feed.
+
+    Args:
+        db (Session): The database session.
+        since (int): Only return events of generations after this one.
+        cursor (int): The next_cursor of the previous page, 0 for the first one.
+        limit (int): The maximum number of events.
+
+    Returns:
+        dict: The events, the cursor of the next page (None on the last one) and the
+            latest finished generation, which is the `since` of the next sync.
+    """
+    changes = db.execute(
+        select(
+            models.CompanyChanges.id,
+            models.CompanyChanges.generation,
+            models.CompanyChanges.company_number,
+            models.CompanyChanges.change_type,
+            models.CompanyChanges.changed_fields,
+        )
+        .where(models.CompanyChanges.generation > since, models.CompanyChanges.id > cursor)
+        .order_by(models.CompanyChanges.id)
+        .limit(limit)
+    ).all()
+    generation = db.execute(
+        select(models.IngestRuns.generation)
+        .where(models.IngestRuns.status == "finished")
+        .order_by(models.IngestRuns.generation.desc())
+        .limit(1)
+    ).scalar()
+    return {
+        "changes": [
+            {
+                "id": change.id,
+                "generation": change.generation,
+                "company_number": change.company_number,
+                "change_type": change.change_type,
+                "changed_fields": json.loads(change.changed_fields) if change.changed_fields else None,
+            }
+            for change in changes
+        ],
+        "next_cursor": changes[-1].id if len(changes) == limit else None,
+        "generation": generation,
+    }
@@ -0,0 +1,222 @@
+import logging
+import os
+import shutil
+from enum import Enum
+
+from sqlalchemy import Integer, select
+
+import hr_api.models as models
+import hr_api.compression as compression
+
+logger = logging.getLogger(__name__)
+
+# Unset disables columnar snapshots
+COLUMNAR_SNAPSHOT_FOLDER = os.getenv("COLUMNAR_SNAPSHOT_FOLDER")
+COLUMNAR_SNAPSHOT_FORMATS = [
+    snapshot_format.strip()
+    for snapshot_format in os.getenv("COLUMNAR_SNAPSHOT_FORMATS", "parquet").split(",")
+    if snapshot_format.strip()
+]
+# Number of generations kept on disk, 0 keeps all of them
+COLUMNAR_SNAPSHOT_KEEP = int(os.getenv("COLUMNAR_SNAPSHOT_KEEP", "3"))
+COLUMNAR_BATCH_SIZE = 50000
+
+COLUMNAR_TABLES = {
+    "companies": models.Companies,
+    "entries": models.Entries,
+    "participant_persons": models.ParticipantPersons,
+    "participant_organizations": models.ParticipantOrganizations,
+    # Resolves the source_file_id of the other tables
+    "source_files": models.SourceFiles,
+}
+
+# Columns stored in an encoded form in SQLite, decoded into the snapshots
+COLUMN_DECODERS = {
+    "entries": {"text": compression.decompress_text},
+}
+
+# Low-cardinality columns stored dictionary-encoded
+DICTIONARY_COLUMNS = {"state", "location"}
+
+
+class ColumnarTable(str, Enum):
+    companies = "companies"
+    entries = "entries"
+    participant_persons = "participant_persons"
+    participant_organizations = "participant_organizations"
+    source_files = "source_files"
+
+
+class ColumnarFormat(str, Enum):
+    parquet = "parquet"
+    arrow = "arrow"
+
+
+MEDIA_TYPES = {
+    ColumnarFormat.parquet: "application/vnd.apache.parquet",
+    ColumnarFormat.arrow: "application/vnd.apache.arrow.stream",
+}
+
+FILE_EXTENSIONS = {
+    "parquet": "parquet",
+    # Arrow IPC stream format, which allows a new dictionary per record batch
+    "arrow": "arrows",
+}
+
+
+def is_dictionary_column(column):
+    return column.name.endswith("_code") or column.name in DICTIONARY_COLUMNS
+
+
+def snapshot_path(generation, table_name, snapshot_format):
+    return os.path.join(
+        COLUMNAR_SNAPSHOT_FOLDER,
+        str(generation),
+        f"{table_name}.{FILE_EXTENSIONS[snapshot_format]}",
+    )
+
+
+def _arrow_schema(pa, table):
+    fields = []
+    for column in table.columns:
+        if isinstance(column.type, Integer):
+            arrow_type = pa.int64()
+        elif is_dictionary_column(column):
+            arrow_type = pa.dictionary(pa.int32(), pa.string())
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+
+def _record_batch(pa, schema, rows, decoders):
+    arrays = []
+    for field, values in zip(schema, zip(*rows)):
+        decoder = decoders.get(field.name)
+        if decoder is not None:
+            values = [decoder(value) for value in values]
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _open_writer(pa, path, schema, snapshot_format):
+    if snapshot_format == "parquet":
+        import pyarrow.parquet as pq
+
+        return pq.ParquetWriter(path, schema, compression="zstd")
+    return pa.ipc.new_stream(path, schema)
+
+
+def write_table_snapshot(db, generation, table_name, snapshot_format):
+    """
+    Writes one table of a generation to a columnar file, batch by batch.
+
+    Args:
+        db (Session): The writer session of the ingest. The API readers may still
+            read the snapshot of the previous generation.
+        generation (int): The ingest generation to write.
+        table_name (str): A key of COLUMNAR_TABLES.
+        snapshot_format (str): parquet or arrow.
+
+    Returns:
+        int: The number of rows written.
+    """
+    import pyarrow as pa
+
+    table = COLUMNAR_TABLES[table_name].__table__
+    schema = _arrow_schema(pa, table)
+    decoders = COLUMN_DECODERS.get(table_name, {})
+    path = snapshot_path(generation, table_name, snapshot_format)
+    tmp_path = f"{path}.tmp"
+
+    row_count = 0
+    writer = _open_writer(pa, tmp_path, schema, snapshot_format)
+    try:
+        result = db.execute(
+            select(*table.columns).where(table.c.generation == generation),
+            execution_options={"stream_results": True, "yield_per": COLUMNAR_BATCH_SIZE},
+        )
+        for rows in result.partitions():
+            writer.write_batch(_record_batch(pa, schema, rows, decoders))
+            row_count += len(rows)
+    finally:
+        writer.close()
+    os.replace(tmp_path, path)
+    return row_count
+
+
+def prune_snapshots():
+    if COLUMNAR_SNAPSHOT_KEEP <= 0:
+        return
+    generations = sorted(list_snapshot_generations(), reverse=True)
+    for generation in generations[COLUMNAR_SNAPSHOT_KEEP:]:
+        shutil.rmtree(os.path.join(COLUMNAR_SNAPSHOT_FOLDER, str(generation)))
+
+
+def write_columnar_snapshot(db, generation):
+    """
+    Writes Parquet/Arrow files for all data tables of an ingest generation.
+
+    Does nothing unless COLUMNAR_SNAPSHOT_FOLDER is set. Failures are logged and do
+    not fail the ingest.
+
+    Args:
+        db (Session): The writer session of the ingest.
+        generation (int): The ingest generation to write.
+    """
+    if not COLUMNAR_SNAPSHOT_FOLDER:
+        return
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        logger.error("pyarrow is not installed, skipping the columnar snapshot")
+        return
+
+    os.makedirs(os.path.join(COLUMNAR_SNAPSHOT_FOLDER, str(generation)), exist_ok=True)
+    for snapshot_format in COLUMNAR_SNAPSHOT_FORMATS:
+        for table_name in COLUMNAR_TABLES:
+            try:
+                row_count = write_table_snapshot(db, generation, table_name, snapshot_format)
+            except Exception:
+                logger.exception(
+                    f"Failed to write the {snapshot_format} snapshot of {table_name} for generation {generation}"
+                )
+                continue
+            logger.info(
+                f"Wrote {row_count} rows of {table_name} to the {snapshot_format} snapshot of generation {generation}"
+            )
+    prune_snapshots()
+
+
+def list_snapshot_generations():
+    if not COLUMNAR_SNAPSHOT_FOLDER or not os.path.isdir(COLUMNAR_SNAPSHOT_FOLDER):
+        return []
+    return [int(name) for name in os.listdir(COLUMNAR_SNAPSHOT_FOLDER) if name.isdigit()]
+
+
+def list_snapshots():
+    """
+    Lists the columnar files available per generation.
+
+    Returns:
+        list: One dictionary per generation with the available tables and formats.
+    """
+    snapshots = []
+    for generation in sorted(list_snapshot_generations(), reverse=True):
+        files = []
+        for snapshot_format in FILE_EXTENSIONS:
+            for table_name in COLUMNAR_TABLES:
+                path = snapshot_path(generation, table_name, snapshot_format)
+                if os.path.exists(path):
+                    files.append(
+                        {
+                            "table": table_name,
+                            "format": snapshot_format,
+                            "size": os.path.getsize(path),
+                        }
+                    )
+        snapshots.append({"generation": generation, "files": files})
+    return snapshots
@@ -0,0 +1,194 @@
+"""
+zstd compression of the register entry texts with a dictionary trained per ingest generation.
+
+After an ingest run, a dictionary is trained on a sample of the new entry texts and
+stored in `compression_dictionaries`, and the texts are rewritten as zstd frames.
+The frames carry the id of their dictionary, so texts written by older generations
+stay readable. Texts are only decompressed when a response or an export actually
+renders them; rows written without compression are plain strings and pass through.
+"""
+import logging
+import os
+import random
+import threading
+
+from sqlalchemy import bindparam, delete, select, update
+
+import hr_api.models as models
+from hr_api.database import engine
+
+logger = logging.getLogger(__name__)
+
+ENTRY_TEXT_COMPRESSION = os.getenv("ENTRY_TEXT_COMPRESSION", "true").lower() in ("1", "true", "yes")
+ENTRY_TEXT_COMPRESSION_LEVEL = int(os.getenv("ENTRY_TEXT_COMPRESSION_LEVEL", "9"))
+ENTRY_TEXT_DICTIONARY_SIZE = int(os.getenv("ENTRY_TEXT_DICTIONARY_SIZE", str(112 * 1024)))
+# Number of entry texts the dictionary is trained on
+ENTRY_TEXT_DICTIONARY_SAMPLES = int(os.getenv("ENTRY_TEXT_DICTIONARY_SAMPLES", "20000"))
+COMPRESSION_BATCH_SIZE = 5000
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+    # Compression is on by default when zstandard is installed, only warn when it was asked for
+    if ENTRY_TEXT_COMPRESSION and os.getenv("ENTRY_TEXT_COMPRESSION"):
+        logger.warning("zstandard is not installed, register entry texts are stored uncompressed")
+
+# Dictionary contents by zstd dictionary id, shared by all threads
+_dictionaries = {}
+# ZstdDecompressor objects must not be shared between threads
+_local = threading.local()
+
+
+def _load_dictionary(dict_id):
+    # Read by the API from the database it serves. train_dictionary adds the
+    # dictionary it trains, so the ingest never asks readers that may still be on
+    # the snapshot of the previous generation.
+    data = _dictionaries.get(dict_id)
+    if data is None:
+        with engine.connect() as connection:
+            data = connection.execute(
+                select(models.CompressionDictionaries.dictionary).where(
+                    models.CompressionDictionaries.dict_id == dict_id
+                )
+            ).scalar()
+        if data is None:
+            raise LookupError(f"Unknown compression dictionary {dict_id}")
+        _dictionaries[dict_id] = data
+    return data
+
+
+def _decompressor(dict_id):
+    decompressors = getattr(_local, "decompressors", None)
+    if decompressors is None:
+        decompressors = _local.decompressors = {}
+    decompressor = decompressors.get(dict_id)
+    if decompressor is None:
+        dictionary = zstandard.ZstdCompressionDict(_load_dictionary(dict_id)) if dict_id else None
+        decompressor = decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=dictionary)
+    return decompressor
+
+
+def decompress_text(value):
+    """
+    Returns the text of a stored entry, decompressing it when it is a zstd frame.
+    """
+    if not isinstance(value, bytes):
+        return value
+    if zstandard is None:
+        raise RuntimeError("zstandard is required to read compressed register entry texts")
+    dict_id = zstandard.get_frame_parameters(value).dict_id
+    return _decompressor(dict_id).decompress(value).decode("utf-8")
+
+
+def _sample_texts(db, generation):
+    texts = db.execute(
+        select(models.Entries.text).where(
+            models.Entries.generation == generation, models.Entries.text.is_not(None)
+        )
+    ).scalars()
+    # Reservoir sample, the entries are read once without loading them all
+    sample = []
+    rng = random.Random(generation)
+    for seen, text in enumerate(texts):
+        if isinstance(text, bytes):
+            continue
+        if len(sample) < ENTRY_TEXT_DICTIONARY_SAMPLES:
+            sample.append(text.encode("utf-8"))
+        else:
+            position = rng.randint(0, seen)
+            if position < ENTRY_TEXT_DICTIONARY_SAMPLES:
+                sample[position] = text.encode("utf-8")
+    return sample
+
+
+def train_dictionary(db, generation):
+    """
+    Trains and stores a dictionary on the entry texts of a generation.
+
+    Returns:
+        ZstdCompressionDict: The dictionary, or None when there are too few texts to train on.
+    """
+    samples = _sample_texts(db, generation)
+    try:
+        dictionary = zstandard.train_dictionary(ENTRY_TEXT_DICTIONARY_SIZE, samples)
+    except zstandard.ZstdError as exception:
+        logger.warning(f"Could not train a compression dictionary on {len(samples)} texts: {exception}")
+        return None
+    db.add(
+        models.CompressionDictionaries(
+            dict_id=dictionary.dict_id(),
+            generation=generation,
+            dictionary=dictionary.as_bytes(),
+        )
+    )
+    _dictionaries[dictionary.dict_id()] = dictionary.as_bytes()
+    # refresh_db replaces all entries, so the dictionaries of older generations are unused
+    db.execute(
+        delete(models.CompressionDictionaries).where(
+            models.CompressionDictionaries.generation != generation
+        )
+    )
+    db.commit()
+    return dictionary
+
+
+def compress_entries(db, generation):
+    """
+    Rewrites the entry texts of a generation as zstd frames.
+
+    Texts are compressed with a dictionary trained on the same generation, or without
+    one when there are too few of them. Texts that do not get smaller stay plain.
+
+    Args:
+        db (Session): The writer session.
+        generation (int): The ingest generation to compress.
+
+    Returns:
+        int: The number of texts compressed.
+    """
+    if not ENTRY_TEXT_COMPRESSION or zstandard is None:
+        return 0
+
+    dictionary = train_dictionary(db, generation)
+    compressor = zstandard.ZstdCompressor(
+        level=ENTRY_TEXT_COMPRESSION_LEVEL,
+        dict_data=dictionary,
+        # The frames are self-contained, the dictionary id is all they need
+        write_content_size=True,
+        write_checksum=False,
+    )
+
+    compressed = 0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(models.Entries.id, models.Entries.text)
+            .where(models.Entries.generation == generation, models.Entries.id > last_id)
+            .order_by(models.Entries.id)
+            .limit(COMPRESSION_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        updates = []
+        for entry_id, text in rows:
+            if not isinstance(text, str):
+                continue
+            encoded = text.encode("utf-8")
+            frame = compressor.compress(encoded)
+            if len(frame) < len(encoded):
+                updates.append({"entry_id": entry_id, "text": frame})
+        if updates:
+            db.execute(
+                update(models.Entries.__table__)
+                .where(models.Entries.__table__.c.id == bindparam("entry_id"))
+                .values(text=bindparam("text")),
+                updates,
+            )
+            compressed += len(updates)
+        db.commit()
+
+    logger.info(f"Compressed {compressed} register entry texts of generation {generation}")
+    return compressed
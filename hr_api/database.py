@@ -1,5 +1,9 @@
-from sqlalchemy import create_engine
+import sqlite3
+from urllib.parse import quote
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.ext.declarative import declarative_base
 
 
@@ -11,10 +15,141 @@ load_dotenv()
 DB_LOCATION = os.getenv("DB_LOCATION", "/root/structured_information.db")
 SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_LOCATION}"
 
+# Connection tuning, see https://www.sqlite.org/pragma.html
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "WAL")
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Negative values are KiB, positive values are pages
+DB_CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", str(-64 * 1024)))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "8"))
+DB_READ_POOL_OVERFLOW = int(os.getenv("DB_READ_POOL_OVERFLOW", "0"))
+DB_READ_POOL_TIMEOUT = float(os.getenv("DB_READ_POOL_TIMEOUT", "30"))
+
+# Pragmas reported by database_stats()
+STATS_PRAGMAS = (
+    "journal_mode",
+    "synchronous",
+    "mmap_size",
+    "cache_size",
+    "page_size",
+    "page_count",
+    "freelist_count",
+    "wal_autocheckpoint",
+    "busy_timeout",
+)
+
+
+def _apply_pragmas(dbapi_connection, writer):
+    cursor = dbapi_connection.cursor()
+    try:
+        if writer:
+            # The journal mode is persisted in the database file, so only the writer sets it
+            cursor.execute(f"PRAGMA journal_mode={DB_JOURNAL_MODE}")
+            cursor.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size={DB_CACHE_SIZE}")
+        cursor.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    finally:
+        cursor.close()
+
+
+# Single dedicated connection for ingestion and other writes
+writer_engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    pool_size=1,
+    max_overflow=0,
+)
+
+# Database file read by the API, switched to a published snapshot by hr_api.db_snapshots
+_reader_database = {"path": DB_LOCATION, "immutable": False}
+
+
+def _connect_reader():
+    # API readers open the file through a read-only URI so they can never take the write
+    # lock. Snapshots never change once published, so SQLite may skip locking entirely.
+    uri = f"file:{quote(_reader_database['path'])}?mode=ro"
+    if _reader_database["immutable"]:
+        uri += "&immutable=1"
+    return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+
+# Sized pool of read-only connections for the API
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    "sqlite://",
+    creator=_connect_reader,
+    # An in-memory URL would default to a single connection per thread
+    poolclass=QueuePool,
+    pool_size=DB_READ_POOL_SIZE,
+    max_overflow=DB_READ_POOL_OVERFLOW,
+    pool_timeout=DB_READ_POOL_TIMEOUT,
 )
 
+
+@event.listens_for(writer_engine, "connect")
+def _on_writer_connect(dbapi_connection, connection_record):
+    _apply_pragmas(dbapi_connection, writer=True)
+
+
+@event.listens_for(engine, "connect")
+def _on_reader_connect(dbapi_connection, connection_record):
+    _apply_pragmas(dbapi_connection, writer=False)
+
+
+def use_reader_database(path, immutable=False):
+    """
+    Points the API readers at another database file.
+
+    Connections checked out at the time finish their work on the previous file and
+    are closed when they are returned, the idle ones are closed now and new ones open
+    the new file.
+
+    Args:
+        path (str): The database file.
+        immutable (bool): Whether the file never changes, e.g. a published snapshot.
+    """
+    _reader_database.update(path=path, immutable=immutable)
+    engine.dispose()
+
+
+def reader_database():
+    return dict(_reader_database)
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+WriterSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=writer_engine)
 
 Base = declarative_base()
+
+
+def _pool_stats(pool):
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "status": pool.status(),
+    }
+
+
+def database_stats():
+    """
+    Collects connection pool and pragma statistics for tuning.
+
+    Returns:
+        dict: Pool statistics for the reader and writer engines and the pragma
+            values seen by a reader connection.
+    """
+    pragmas = {}
+    with engine.connect() as connection:
+        for pragma in STATS_PRAGMAS:
+            pragmas[pragma] = connection.exec_driver_sql(f"PRAGMA {pragma}").scalar()
+
+    return {
+        "database": DB_LOCATION,
+        "reader_database": reader_database(),
+        "reader_pool": _pool_stats(engine.pool),
+        "writer_pool": _pool_stats(writer_engine.pool),
+        "pragmas": pragmas,
+    }
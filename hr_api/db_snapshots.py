@@ -0,0 +1,200 @@
+"""
+Immutable per-generation database snapshots for the API workers.
+
+With DB_SNAPSHOT_FOLDER set, every successful ingest publishes a compacted copy
+of the database (`VACUUM INTO`) as `<folder>/generation-<n>.db` and then points
+the `CURRENT` file at it. API workers read the snapshot the pointer names, opened
+`immutable=1` so SQLite skips locking and change detection, and never touch the
+file the ingest writes to. Each worker polls the pointer and switches to a new
+generation without restarting; `POST /admin/db-snapshot/reload` switches one
+worker immediately.
+
+The folder may be shared between nodes, e.g. over NFS or synced with rsync, as
+long as the snapshot file is in place before the pointer.
+"""
+import asyncio
+import glob
+import logging
+import os
+import re
+import sqlite3
+import time
+
+from dotenv import load_dotenv
+
+from hr_api.database import DB_LOCATION, reader_database, use_reader_database, writer_engine
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Unset serves DB_LOCATION directly, as without snapshots
+DB_SNAPSHOT_FOLDER = os.getenv("DB_SNAPSHOT_FOLDER")
+# Number of published snapshots kept, the current one included
+DB_SNAPSHOT_KEEP = int(os.getenv("DB_SNAPSHOT_KEEP", "3"))
+# Seconds between checks of the pointer file by the API workers, 0 disables polling
+DB_SNAPSHOT_POLL_INTERVAL = float(os.getenv("DB_SNAPSHOT_POLL_INTERVAL", "5"))
+# Seconds a replaced snapshot is kept beyond DB_SNAPSHOT_KEEP, at least two poll
+# intervals, so workers that did not poll the pointer yet can still open it
+DB_SNAPSHOT_GRACE_PERIOD = max(float(os.getenv("DB_SNAPSHOT_GRACE_PERIOD", "300")), 2 * DB_SNAPSHOT_POLL_INTERVAL)
+
+POINTER_FILE = "CURRENT"
+SNAPSHOT_NAME = re.compile(r"generation-(\d+)\.db$")
+
+
+def snapshot_path(generation):
+    return os.path.join(DB_SNAPSHOT_FOLDER, f"generation-{generation}.db")
+
+
+def list_snapshots():
+    """
+    Returns the generations of the published snapshots, oldest first.
+    """
+    generations = []
+    for path in glob.glob(os.path.join(DB_SNAPSHOT_FOLDER, "generation-*.db")):
+        match = SNAPSHOT_NAME.search(path)
+        if match:
+            generations.append(int(match.group(1)))
+    return sorted(generations)
+
+
+def read_pointer():
+    """
+    Returns the generation the pointer file names, or None when nothing is published.
+    """
+    try:
+        with open(os.path.join(DB_SNAPSHOT_FOLDER, POINTER_FILE), encoding="utf-8") as file:
+            return int(file.read().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_pointer(generation):
+    path = os.path.join(DB_SNAPSHOT_FOLDER, POINTER_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        file.write(f"{generation}\n")
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def publish_snapshot(generation):
+    """
+    Writes a compacted copy of the database for a generation and points the workers at it.
+
+    Args:
+        generation (int): The ingest generation the database now holds.
+
+    Returns:
+        str: The path of the snapshot, or None when snapshots are disabled.
+    """
+    if not DB_SNAPSHOT_FOLDER:
+        return None
+    os.makedirs(DB_SNAPSHOT_FOLDER, exist_ok=True)
+
+    path = snapshot_path(generation)
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    with writer_engine.connect() as connection:
+        connection.exec_driver_sql("VACUUM INTO ?", (tmp_path,))
+
+    # Readers open the snapshot immutable, so it must not need a WAL or a journal
+    snapshot = sqlite3.connect(tmp_path)
+    try:
+        snapshot.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        snapshot.close()
+    with open(tmp_path, "rb") as file:
+        os.fsync(file.fileno())
+
+    os.replace(tmp_path, path)
+    _write_pointer(generation)
+    logger.info(f"Published database snapshot {path}")
+
+    prune_snapshots(generation)
+    return path
+
+
+def prune_snapshots(current):
+    """
+    Deletes the snapshots beyond the newest DB_SNAPSHOT_KEEP that were replaced more
+    than DB_SNAPSHOT_GRACE_PERIOD ago.
+
+    A snapshot counts as replaced when the next newer one was written. Workers in
+    other processes or on other nodes may not have polled the pointer yet and still
+    open new connections to the snapshot they serve, so the previous snapshot is
+    always kept.
+
+    Args:
+        current (int): The generation just published.
+    """
+    if DB_SNAPSHOT_KEEP <= 0:
+        return
+    generations = list_snapshots()
+    replaced_before = time.time() - DB_SNAPSHOT_GRACE_PERIOD
+    for generation, newer in zip(generations[: -max(DB_SNAPSHOT_KEEP, 2)], generations[1:]):
+        if generation == current:
+            continue
+        try:
+            replaced_at = os.path.getmtime(snapshot_path(newer))
+        except FileNotFoundError:
+            continue
+        if replaced_at < replaced_before:
+            # Workers still on the generation keep reading their open file after it is unlinked
+            os.remove(snapshot_path(generation))
+
+
+def current_snapshot_generation():
+    """
+    Returns the generation the API readers are on, or None when they read DB_LOCATION.
+    """
+    match = SNAPSHOT_NAME.search(reader_database()["path"])
+    return int(match.group(1)) if match else None
+
+
+def switch_to_current():
+    """
+    Points the API readers at the snapshot named by the pointer file, if it changed.
+
+    Returns:
+        int: The generation served, or None when no snapshot is published.
+    """
+    if not DB_SNAPSHOT_FOLDER:
+        return None
+    generation = read_pointer()
+    if generation is None:
+        return current_snapshot_generation()
+    if generation != current_snapshot_generation():
+        path = snapshot_path(generation)
+        if not os.path.exists(path):
+            logger.error(f"The database snapshot pointer names {path}, which does not exist")
+            return current_snapshot_generation()
+        use_reader_database(path, immutable=True)
+        logger.info(f"Serving database snapshot {path}")
+    return generation
+
+
+async def watch_pointer():
+    """
+    Switches the API readers whenever the pointer file names a new generation.
+    """
+    while True:
+        await asyncio.sleep(DB_SNAPSHOT_POLL_INTERVAL)
+        try:
+            switch_to_current()
+        except Exception:
+            logger.exception("Could not switch to the current database snapshot")
+
+
+def snapshot_status():
+    return {
+        "enabled": bool(DB_SNAPSHOT_FOLDER),
+        "database": DB_LOCATION,
+        "serving": reader_database(),
+        "serving_generation": current_snapshot_generation(),
+        "published_generation": read_pointer() if DB_SNAPSHOT_FOLDER else None,
+        "available_generations": list_snapshots() if DB_SNAPSHOT_FOLDER else [],
+    }
@@ -0,0 +1,168 @@
+import csv
+import io
+import json
+import zlib
+from enum import Enum
+from typing import Optional
+
+from sqlalchemy import select
+
+import hr_api.models as models
+import hr_api.sources as sources
+import hr_api.compression as compression
+from hr_api.database import engine
+
+# Number of rows fetched from the cursor and encoded per chunk
+EXPORT_BATCH_SIZE = 5000
+
+EXPORT_TABLES = {
+    "companies": models.Companies,
+    "register-entries": models.Entries,
+    "participant-persons": models.ParticipantPersons,
+    "participant-organizations": models.ParticipantOrganizations,
+}
+
+
+class ExportDataset(str, Enum):
+    companies = "companies"
+    register_entries = "register-entries"
+    participant_persons = "participant-persons"
+    participant_organizations = "participant-organizations"
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv; charset=utf-8",
+}
+
+
+def export_columns(table):
+    """
+    Returns the selected columns of an export and a function turning a row into the exported tuple.
+
+    The source file reference is exported as its URL in `file_path`, and companies
+    get their `opencorporates` URL, like in the read endpoints.
+    """
+    position = [column.name for column in table.columns].index("source_file_id")
+    columns = [column for column in table.columns if column.name != "source_file_id"]
+    names = [column.name for column in columns]
+    if table.name == "companies":
+        company_number = names.index("company_number")
+        names[position:position] = ["file_path", "opencorporates"]
+
+        def export_row(row):
+            urls = (sources.file_url(row[-1]), sources.opencorporates_url(row[company_number]))
+            return (*row[:position], *urls, *row[position:-1])
+
+    elif table.name == "entries":
+        names[position:position] = ["file_path"]
+        text = names.index("text")
+
+        def export_row(row):
+            row = (*row[:position], sources.file_url(row[-1]), *row[position:-1])
+            return (*row[:text], compression.decompress_text(row[text]), *row[text + 1:])
+
+    else:
+        names[position:position] = ["file_path"]
+
+        def export_row(row):
+            return (*row[:position], sources.file_url(row[-1]), *row[position:-1])
+
+    return columns + [models.SourceFiles.path], tuple(names), export_row
+
+
+def iter_batches(dataset: ExportDataset, generation: Optional[int] = None):
+    """
+    Streams the rows of an export dataset in batches through a server-side cursor.
+
+    The connection is owned by the generator, so it stays open for as long as the
+    response is being streamed and is returned to the pool afterwards.
+
+    Args:
+        dataset (ExportDataset): The dataset to export.
+        generation (int, optional): Only export rows written by this ingest generation.
+
+    Yields:
+        tuple: The column names first, then lists of row tuples.
+    """
+    table = EXPORT_TABLES[dataset.value].__table__
+    columns, names, export_row = export_columns(table)
+    stmt = select(*columns).outerjoin(
+        models.SourceFiles, table.c.source_file_id == models.SourceFiles.id
+    )
+    if generation is not None:
+        stmt = stmt.where(table.c.generation == generation)
+
+    yield names
+
+    with engine.connect() as connection:
+        result = connection.execution_options(
+            stream_results=True, yield_per=EXPORT_BATCH_SIZE
+        ).execute(stmt)
+        for partition in result.partitions():
+            yield [export_row(row) for row in partition]
+
+
+def encode_ndjson(batches):
+    columns = next(batches)
+    for rows in batches:
+        yield "".join(
+            json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n"
+            for row in rows
+        ).encode("utf-8")
+
+
+def encode_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(next(batches))
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only when the export is empty
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_stream(
+    dataset: ExportDataset,
+    export_format: ExportFormat,
+    generation: Optional[int] = None,
+    gzip: bool = False,
+):
+    """
+    Builds the byte stream for an export in constant memory.
+
+    Args:
+        dataset (ExportDataset): The dataset to export.
+        export_format (ExportFormat): NDJSON or CSV.
+        generation (int, optional): Only export rows written by this ingest generation.
+        gzip (bool): Whether to gzip the stream.
+
+    Returns:
+        generator: A generator of encoded byte chunks.
+    """
+    batches = iter_batches(dataset, generation)
+    if export_format == ExportFormat.csv:
+        chunks = encode_csv(batches)
+    else:
+        chunks = encode_ndjson(batches)
+    if gzip:
+        chunks = gzip_chunks(chunks)
+    return chunks
@@ -0,0 +1,187 @@
+"""
+The register extracts in DOWNLOAD_FOLDER, plain, compressed or packed into archives.
+
+DOWNLOAD_FOLDER holds a directory per register number with a directory per company
+and its `si` extracts, e.g. 1031/Handels e.K./si/2023-03-11T13-59-19.xml. An extract
+may also be compressed as .xml.gz, or as .xml.zst with the `compression` extra, and a
+register directory may be packed into a tar or zip archive in its place, with member
+paths relative to DOWNLOAD_FOLDER:
+
+    tar -C $DOWNLOAD_FOLDER -czf $DOWNLOAD_FOLDER/1031.tar.gz 1031 && rm -r $DOWNLOAD_FOLDER/1031
+
+Extracts are decompressed and read out of archives in memory, nothing is unpacked to
+disk. An archive member gets the path it would have when unpacked, so the stored
+source paths do not depend on how a register directory is packed.
+
+Tar archives, compressed ones in particular, can only be read front to back. They
+are read in one pass, which expects the files of a company one after another, as
+`tar` writes a directory.
+"""
+import glob
+import gzip
+import logging
+import os
+import tarfile
+import zipfile
+from typing import Callable, NamedTuple
+
+from hr_api.metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+EXTRACT_SUFFIXES = (".xml", ".xhtml")
+COMPRESSION_SUFFIXES = (".gz", ".zst")
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz", ".tar.zst")
+ARCHIVE_SUFFIXES = TAR_SUFFIXES + (".zip",)
+
+
+class ExtractFile(NamedTuple):
+    """
+    A register extract and how to read it.
+
+    Args:
+        path (str): The file, or the path an archive member has when unpacked.
+        read (Callable): Returns the decompressed XML as bytes.
+    """
+
+    path: str
+    read: Callable[[], bytes]
+
+
+def is_extract(name):
+    """
+    Tells whether a file name is a register extract, plain or compressed.
+    """
+    if name.endswith(".zst") and zstandard is None:
+        return False
+    for suffix in COMPRESSION_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[: -len(suffix)]
+            break
+    return name.endswith(EXTRACT_SUFFIXES)
+
+
+def decompress(data, name):
+    """
+    Decompresses the content of an extract by the suffix of its file name.
+
+    Args:
+        data (bytes): The content of the file.
+        name (str): The file name.
+
+    Returns:
+        bytes: The XML.
+    """
+    if name.endswith(".gz"):
+        return gzip.decompress(data)
+    if name.endswith(".zst"):
+        # Frames written by streaming compressors do not carry their size
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+
+def read_file(path):
+    with open(path, "rb") as file:
+        return decompress(file.read(), path)
+
+
+def _member_parts(name):
+    """
+    Returns the path components of an archive member of the
+    `register/company/si/extract` layout, None for any other member.
+    """
+    parts = [part for part in name.split("/") if part not in ("", ".")]
+    if len(parts) != 4 or parts[2] != "si" or not is_extract(parts[3]):
+        return None
+    return parts
+
+
+def _tar_companies(archive, folder, stage_totals):
+    if archive.endswith(".zst"):
+        if zstandard is None:
+            logger.warning(f"Skipped {archive}, reading .tar.zst archives needs zstandard")
+            return
+        stream = zstandard.ZstdDecompressor().stream_reader(open(archive, "rb"), closefd=True)
+    else:
+        stream = open(archive, "rb")
+
+    with stream, tarfile.open(fileobj=stream, mode="r|*") as tar:
+        key, extracts = None, []
+        seen = set()
+        for member in tar:
+            parts = _member_parts(member.name) if member.isfile() else None
+            if parts is None:
+                continue
+            member_key = tuple(parts[:2])
+            if member_key != key:
+                if extracts:
+                    yield extracts
+                if member_key in seen:
+                    logger.warning(f"The files of {'/'.join(member_key)} are not stored together in {archive}")
+                seen.add(member_key)
+                key, extracts = member_key, []
+            with stage_timer("file_read", stage_totals):
+                data = tar.extractfile(member).read()
+            extracts.append(
+                ExtractFile(
+                    os.path.join(folder, *parts),
+                    # Bind the member's content and name now, the loop moves on
+                    lambda data=data, name=member.name: decompress(data, name),
+                )
+            )
+        if extracts:
+            yield extracts
+
+
+def _zip_companies(archive, folder):
+    with zipfile.ZipFile(archive) as zip_file:
+        companies = {}
+        for name in zip_file.namelist():
+            parts = _member_parts(name)
+            if parts is not None:
+                companies.setdefault(tuple(parts[:2]), []).append((name, os.path.join(folder, *parts)))
+        for members in companies.values():
+            yield [
+                ExtractFile(path, lambda name=name: decompress(zip_file.read(name), name))
+                for name, path in members
+            ]
+
+
+def company_extracts(folder, stage_totals=None):
+    """
+    Yields the extracts of every company in a download folder, from its directories
+    first and then from its archives.
+
+    The extracts of a company have to be read before the next company is taken, as
+    archives are closed once all their companies are yielded.
+
+    Args:
+        folder (str): The download folder.
+        stage_totals (dict, optional): Accumulates the seconds per ingest stage.
+
+    Yields:
+        list: The ExtractFile of each extract of a company, in no particular order.
+    """
+    with stage_timer("directory_scan", stage_totals):
+        company_dirs = glob.glob(f"{folder}/*/*/")
+        archives = sorted(
+            path for path in glob.glob(f"{folder}/*") if path.endswith(ARCHIVE_SUFFIXES) and os.path.isfile(path)
+        )
+    if zstandard is None and glob.glob(f"{folder}/*/*/si/*.zst"):
+        logger.warning("zstandard is not installed, the .zst extracts are left out")
+    for company_dir in company_dirs:
+        with stage_timer("directory_scan", stage_totals):
+            file_paths = [path for path in glob.glob(f"{company_dir}si/*") if is_extract(path)]
+        if file_paths:
+            yield [ExtractFile(path, lambda path=path: read_file(path)) for path in file_paths]
+
+    for archive in archives:
+        if archive.endswith(TAR_SUFFIXES):
+            yield from _tar_companies(archive, folder, stage_totals)
+        else:
+            yield from _zip_companies(archive, folder)
@@ -0,0 +1,284 @@
+"""
+Fuzzy matching of company names with a trigram index.
+
+Every ingest run writes the lookup key of every company name (see
+hr_api.names.company_name_key, which also maps spelled out legal forms to their
+abbreviation) to `company_names`, and for every trigram of those keys the ids of
+the names containing it to `name_trigrams`. A query name is split into trigrams;
+its rarest ones select candidates by the number of trigrams they share, and the
+candidates are scored by trigram similarity (shared trigrams over all trigrams of
+both names, as pg_trgm does).
+"""
+import logging
+import os
+import sys
+from array import array
+from collections import Counter
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+import hr_api.models as models
+from hr_api.names import company_name_parts
+
+logger = logging.getLogger(__name__)
+
+# Company ids counted per query name: its rarest trigrams are used to find candidates
+# until their postings reach this, the others only count when the candidates are scored
+FUZZY_MAX_POSTINGS = int(os.getenv("FUZZY_MAX_POSTINGS", "20000"))
+# Candidates scored per query name
+FUZZY_CANDIDATES = int(os.getenv("FUZZY_CANDIDATES", "100"))
+# Trigrams used per query name however frequent they are, at least
+MIN_QUERY_TRIGRAMS = 3
+# Best score below which the candidates are searched again with more trigrams
+FUZZY_RETRY_SCORE = float(os.getenv("FUZZY_RETRY_SCORE", "0.6"))
+INSERT_BATCH_SIZE = 10000
+# Ids looked up per query
+LOOKUP_CHUNK_SIZE = 500
+
+
+def trigrams(name_key):
+    """
+    Returns the trigrams of a lookup key, each word padded like pg_trgm does.
+    """
+    result = set()
+    for word in name_key.split():
+        padded = f"  {word} "
+        result.update(padded[position : position + 3] for position in range(len(padded) - 2))
+    return result
+
+
+def similarity(first, second):
+    if not first or not second:
+        return 0.0
+    shared = len(first & second)
+    return shared / (len(first) + len(second) - shared)
+
+
+def _pack(ids):
+    if sys.byteorder == "big":
+        ids.byteswap()
+    return ids.tobytes()
+
+
+def _unpack(data):
+    ids = array("I")
+    ids.frombytes(data)
+    if sys.byteorder == "big":
+        ids.byteswap()
+    return ids
+
+
+def refresh_name_index(db: Session, generation: int):
+    """
+    Rebuilds the company names and their trigram index from the companies table.
+
+    Args:
+        db (Session): A writer session.
+        generation (int): The ingest generation the index belongs to.
+
+    Returns:
+        int: The number of names indexed.
+    """
+    db.execute(delete(models.CompanyNames))
+    db.execute(delete(models.NameTrigrams))
+
+    rows = db.execute(
+        select(models.Companies.company_number, models.Companies.current_designation).order_by(
+            models.Companies.company_number
+        )
+    ).all()
+    postings = {}
+    names = []
+    company_id = 0
+    for company_number, designation in rows:
+        if not designation:
+            continue
+        company_id += 1
+        name_key, legal_form = company_name_parts(designation)
+        names.append(
+            {
+                "id": company_id,
+                "company_number": company_number,
+                "current_designation": designation,
+                "name_key": name_key,
+                "legal_form": legal_form,
+                "generation": generation,
+            }
+        )
+        for trigram in trigrams(name_key):
+            ids = postings.get(trigram)
+            if ids is None:
+                ids = postings[trigram] = array("I")
+            ids.append(company_id)
+        if len(names) >= INSERT_BATCH_SIZE:
+            db.execute(insert(models.CompanyNames), names)
+            names = []
+    if names:
+        db.execute(insert(models.CompanyNames), names)
+
+    batch = []
+    for trigram, ids in postings.items():
+        batch.append({"trigram": trigram, "companies": len(ids), "company_ids": _pack(ids), "generation": generation})
+        if len(batch) >= INSERT_BATCH_SIZE:
+            db.execute(insert(models.NameTrigrams), batch)
+            batch = []
+    if batch:
+        db.execute(insert(models.NameTrigrams), batch)
+    db.commit()
+    logger.info(f"Indexed {company_id} company names with {len(postings)} trigrams")
+    return company_id
+
+
+def _chunks(values):
+    values = list(values)
+    for start in range(0, len(values), LOOKUP_CHUNK_SIZE):
+        yield values[start : start + LOOKUP_CHUNK_SIZE]
+
+
+def _most_shared(counts):
+    """
+    Returns the FUZZY_CANDIDATES company ids sharing the most trigrams with a query.
+    """
+    if len(counts) <= FUZZY_CANDIDATES:
+        return list(counts)
+    # Cheaper than sorting all ids: find the lowest count that still yields enough of
+    # them from the histogram of the counts, and only sort the ids above it
+    histogram = Counter(counts.values())
+    threshold = 0
+    taken = 0
+    for shared in sorted(histogram, reverse=True):
+        threshold = shared
+        taken += histogram[shared]
+        if taken >= FUZZY_CANDIDATES:
+            break
+    above = [(shared, company_id) for company_id, shared in counts.items() if shared >= threshold]
+    above.sort(reverse=True)
+    return [company_id for _, company_id in above[:FUZZY_CANDIDATES]]
+
+
+def _select_trigrams(grams, frequencies, required):
+    """
+    Returns the rarest trigrams of a query name, at least `required` of them and
+    more while their postings stay within FUZZY_MAX_POSTINGS.
+    """
+    chosen = []
+    postings_counted = 0
+    for count, gram in sorted((frequencies[gram], gram) for gram in grams if gram in frequencies):
+        if len(chosen) >= required and postings_counted + count > FUZZY_MAX_POSTINGS:
+            break
+        chosen.append(gram)
+        postings_counted += count
+    return chosen
+
+
+def _load_postings(db, grams, postings):
+    for chunk in _chunks(set(grams) - postings.keys()):
+        for trigram, company_ids in db.execute(
+            select(models.NameTrigrams.trigram, models.NameTrigrams.company_ids).where(
+                models.NameTrigrams.trigram.in_(chunk)
+            )
+        ):
+            postings[trigram] = _unpack(company_ids)
+
+
+def _load_companies(db, company_ids, companies):
+    for chunk in _chunks(set(company_ids) - companies.keys()):
+        for company_id, company_number, designation, name_key, legal_form in db.execute(
+            select(
+                models.CompanyNames.id,
+                models.CompanyNames.company_number,
+                models.CompanyNames.current_designation,
+                models.CompanyNames.name_key,
+                models.CompanyNames.legal_form,
+            ).where(models.CompanyNames.id.in_(chunk))
+        ):
+            companies[company_id] = (company_number, designation, trigrams(name_key), legal_form)
+
+
+def _candidates(grams, postings):
+    counts = Counter()
+    for gram in grams:
+        counts.update(postings[gram])
+    return _most_shared(counts)
+
+
+def _score(grams, legal_form, company_ids, companies):
+    scored = []
+    for company_id in company_ids:
+        company_number, designation, company_grams, company_legal_form = companies[company_id]
+        # Among equally similar names, the one with the same legal form comes first
+        scored.append(
+            (-similarity(grams, company_grams), company_legal_form != legal_form, designation, company_number)
+        )
+    scored.sort()
+    return scored
+
+
+def match_names(db: Session, names, limit=5, min_score=0.3):
+    """
+    Finds the companies whose names are most similar to each of the given names.
+
+    Candidates are first taken from the rarest trigrams of a name. When none of them
+    scores FUZZY_RETRY_SCORE, the rarest trigrams were probably the misspelled ones,
+    and the search is repeated with at least half of the trigrams.
+
+    Args:
+        db (Session): The database session.
+        names (list): The company names to match, e.g. from a CRM.
+        limit (int): The number of candidates per name.
+        min_score (float): The lowest similarity returned, between 0 and 1.
+
+    Returns:
+        list: Per name its candidates, best first, with company number, name and score.
+    """
+    query_parts = [company_name_parts(name) for name in names]
+    query_trigrams = [trigrams(name_key) for name_key, _ in query_parts]
+
+    frequencies = {}
+    for chunk in _chunks(set().union(*query_trigrams)):
+        for trigram, companies in db.execute(
+            select(models.NameTrigrams.trigram, models.NameTrigrams.companies).where(
+                models.NameTrigrams.trigram.in_(chunk)
+            )
+        ):
+            frequencies[trigram] = companies
+
+    postings = {}
+    companies = {}
+    selected = [_select_trigrams(grams, frequencies, MIN_QUERY_TRIGRAMS) for grams in query_trigrams]
+    _load_postings(db, set().union(*selected), postings)
+    candidates = [_candidates(grams, postings) for grams in selected]
+    _load_companies(db, set().union(*candidates), companies)
+    scored = [
+        _score(grams, legal_form, company_ids, companies)
+        for (_, legal_form), grams, company_ids in zip(query_parts, query_trigrams, candidates)
+    ]
+
+    retry = [index for index, ranked in enumerate(scored) if not ranked or -ranked[0][0] < FUZZY_RETRY_SCORE]
+    if retry:
+        selected = {
+            index: _select_trigrams(
+                query_trigrams[index], frequencies, max(MIN_QUERY_TRIGRAMS, (len(query_trigrams[index]) + 1) // 2)
+            )
+            for index in retry
+        }
+        _load_postings(db, set().union(*selected.values()), postings)
+        candidates = {index: _candidates(grams, postings) for index, grams in selected.items()}
+        _load_companies(db, set().union(*candidates.values()), companies)
+        for index, company_ids in candidates.items():
+            scored[index] = _score(query_trigrams[index], query_parts[index][1], company_ids, companies)
+
+    results = []
+    for name, ranked in zip(names, scored):
+        results.append(
+            {
+                "name": name,
+                "candidates": [
+                    {"company_number": company_number, "current_designation": designation, "score": round(-score, 3)}
+                    for score, _, designation, company_number in ranked[:limit]
+                    if -score >= min_score
+                ],
+            }
+        )
+    return results
@@ -0,0 +1,208 @@
+"""
+Company history from every register extract of a company.
+
+An ingest normally reads only the newest `si` extract of a company. With
+INGEST_HISTORY it also reads the older ones and writes a `company_history` row per
+extract. The newest extract's state stays in the data tables as always. Every older
+extract only stores what differs from the next newer one: the company fields with
+another value, and the participants and register entries added or removed. This
+reverse delta is a few fields for most extracts, so the history stays small next to
+the data tables.
+
+`state_as_of` rebuilds the state of a company at a date from its current rows,
+undoing the changes of the newer extracts, newest first. Participants and entries are
+kept in a canonical order, so a removed row is stored as its position in the newer
+extract's rows instead of as its values.
+"""
+import json
+import os
+import re
+from collections import Counter
+from datetime import timedelta
+
+from sqlalchemy import select
+
+import hr_api.compression as compression
+import hr_api.models as models
+from hr_api.schemas import Company, ParticipantOrganization, ParticipantPerson, RegisterEntry
+
+INGEST_HISTORY = os.getenv("INGEST_HISTORY", "false").lower() in ("1", "true", "yes")
+
+EXTRACT_TIME = re.compile(r"(\d{4}-\d{2}-\d{2})T(\d{2})-(\d{2})-(\d{2})")
+
+# The file of an extract is a row of its own, the link to OpenCorporates is derived
+COMPANY_FIELDS = tuple(name for name in Company.model_fields if name not in ("file_path", "opencorporates"))
+# The values of a participant or entry row, without the company and the file it belongs to
+ROW_FIELDS = {
+    part: tuple(name for name in schema.model_fields if name not in ("company_number", "file_path"))
+    for part, schema in (
+        ("participant_persons", ParticipantPerson),
+        ("participant_organizations", ParticipantOrganization),
+        ("entries", RegisterEntry),
+    )
+}
+ROW_MODELS = {
+    "participant_persons": models.ParticipantPersons,
+    "participant_organizations": models.ParticipantOrganizations,
+    "entries": models.Entries,
+}
+
+
+def extracted_at(file_path):
+    """
+    Returns the creation time of a register extract from its file name.
+
+    Args:
+        file_path (str): The file, e.g. .../si/2023-03-11T13-59-19.xml.
+
+    Returns:
+        str: The ISO time, e.g. 2023-03-11T13:59:19.
+    """
+    date, hours, minutes, seconds = EXTRACT_TIME.search(file_path).groups()
+    return f"{date}T{hours}:{minutes}:{seconds}"
+
+
+def _sorted_rows(rows):
+    return sorted(rows, key=lambda row: tuple((value is None, value or "") for value in row))
+
+
+def extract_state(company, parties, entries):
+    """
+    Returns the state of a company in one extract, as compared by `reverse_delta`.
+
+    Args:
+        company (Company): The company as extracted from the register file.
+        parties (list): Its ParticipantPerson and ParticipantOrganization items.
+        entries (list): Its RegisterEntry items.
+
+    Returns:
+        dict: The company fields, and the participants and entries as sorted tuples.
+    """
+    items = {
+        "participant_persons": [party for party in parties if isinstance(party, ParticipantPerson)],
+        "participant_organizations": [party for party in parties if isinstance(party, ParticipantOrganization)],
+        "entries": entries,
+    }
+    state = {"company": {name: getattr(company, name) for name in COMPANY_FIELDS}}
+    for part, fields in ROW_FIELDS.items():
+        state[part] = _sorted_rows(tuple(getattr(item, name) for name in fields) for item in items[part])
+    return state
+
+
+def reverse_delta(newer, older):
+    """
+    Returns the changes turning the state of a newer extract into an older one.
+
+    Returns:
+        dict: The older values of the changed company fields under "company", and per
+            changed part the positions of the rows only the newer extract has under
+            "removed" and the rows only the older one has under "added".
+    """
+    delta = {}
+    fields = {name: value for name, value in older["company"].items() if newer["company"][name] != value}
+    if fields:
+        delta["company"] = fields
+    for part in ROW_FIELDS:
+        if newer[part] == older[part]:
+            continue
+        remaining = Counter(older[part])
+        removed = []
+        for position, row in enumerate(newer[part]):
+            if remaining[row]:
+                remaining[row] -= 1
+            else:
+                removed.append(position)
+        delta[part] = {"removed": removed, "added": list(remaining.elements())}
+    return delta
+
+
+def apply_delta(rows, delta):
+    """
+    Applies the changes of one part of a reverse delta to the sorted rows of a newer extract.
+    """
+    removed = set(delta["removed"])
+    kept = [row for position, row in enumerate(rows) if position not in removed]
+    return _sorted_rows(kept + [tuple(row) for row in delta["added"]])
+
+
+def history_row(company_number, file_path, source_file_id, generation, changes=None):
+    """
+    Returns the company_history row of an extract.
+
+    Args:
+        company_number (str): The company number of the newest extract.
+        file_path (str): The file of the extract.
+        source_file_id (int): Its source_files row.
+        generation (int): The ingest generation.
+        changes (dict, optional): The reverse delta from the next newer extract,
+            None for the newest.
+    """
+    return models.CompanyHistory(
+        company_number=company_number,
+        extracted_at=extracted_at(file_path),
+        source_file_id=source_file_id,
+        changes=json.dumps(changes, ensure_ascii=False, separators=(",", ":")) if changes is not None else None,
+        generation=generation,
+    )
+
+
+def _current_rows(db, company_number, part):
+    if part == "company":
+        row = db.execute(
+            select(*(getattr(models.Companies, name) for name in COMPANY_FIELDS)).where(
+                models.Companies.company_number == company_number
+            )
+        ).first()
+        return dict(zip(COMPANY_FIELDS, row)) if row is not None else None
+    model = ROW_MODELS[part]
+    rows = db.execute(
+        select(*(getattr(model, name) for name in ROW_FIELDS[part])).where(model.company_number == company_number)
+    ).tuples()
+    if part == "entries":
+        text = ROW_FIELDS[part].index("text")
+        rows = (row[:text] + (compression.decompress_text(row[text]),) + row[text + 1 :] for row in rows)
+    return _sorted_rows(rows)
+
+
+def state_as_of(db, company_number, as_of, part):
+    """
+    Rebuilds one part of the state of a company at the end of a day.
+
+    Args:
+        db (Session): The database session.
+        company_number (str): The company number.
+        as_of (date): The day.
+        part (str): company, participant_persons, participant_organizations or entries.
+
+    Returns:
+        list: The rows of the part as dicts of table columns, with the source file of
+            the extract in effect. Empty when the first extract is newer than the day.
+            None when the company has no history.
+    """
+    history = db.execute(
+        select(
+            models.CompanyHistory.extracted_at,
+            models.CompanyHistory.source_file_id,
+            models.CompanyHistory.changes,
+            models.CompanyHistory.generation,
+        )
+        .where(models.CompanyHistory.company_number == company_number)
+        .order_by(models.CompanyHistory.extracted_at.desc())
+    ).all()
+    if not history:
+        return None
+
+    # Extract times are ISO times, which compare like times
+    end = (as_of + timedelta(days=1)).isoformat()
+    state = _current_rows(db, company_number, part)
+    for time, source_file_id, changes, generation in history:
+        if changes is not None:
+            delta = json.loads(changes).get(part)
+            if delta is not None:
+                state = {**state, **delta} if part == "company" else apply_delta(state, delta)
+        if time < end:
+            stored = {"company_number": company_number, "source_file_id": source_file_id, "generation": generation}
+            if part == "company":
+                return [{**stored, **state}] if state is not None else []
+            return [{**dict(zip(ROW_FIELDS[part], row)), **stored} for row in state]
+    return []
@@ -0,0 +1,642 @@
+"""
+Ingest of the downloaded register extracts into the database.
+
+Kept apart from the API, so the API workers never import the XML parser or the
+HTTP client. Run it as its own process:
+
+    python -m hr_api.ingest
+
+which creates the schema, fills the code tables and ingests DOWNLOAD_FOLDER.
+/admin/refresh-db and /admin/refresh-metatables run the same code on demand.
+"""
+import argparse
+import fcntl
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import requests
+import xmltodict
+from dotenv import load_dotenv
+from sqlalchemy import MetaData, Table, text
+from sqlalchemy.exc import IntegrityError
+
+import hr_api.aggregates as aggregates
+import hr_api.changes as changes
+import hr_api.columnar as columnar
+import hr_api.compression as compression
+import hr_api.db_snapshots as db_snapshots
+import hr_api.extract_files as extract_files
+import hr_api.fuzzy as fuzzy
+import hr_api.history as history
+import hr_api.listing as listing
+import hr_api.models as models
+import hr_api.registers as registers
+import hr_api.sources as sources
+from hr_api.database import DB_LOCATION, WriterSessionLocal, writer_engine
+from hr_api.metrics import INGEST_FILES, stage_timer
+from hr_api.schemas import Company, ParticipantOrganization, ParticipantPerson, RegisterEntry
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+DOWNLOAD_FOLDER = os.getenv("DOWNLOAD_FOLDER")
+# Held while the database is written to, by every API worker and ingest process
+INGEST_LOCK_FILE = os.getenv("INGEST_LOCK_FILE", f"{DB_LOCATION}.ingest.lock")
+
+# XJustiz code lists loaded into the code tables of the same name
+CODE_LIST_URLS = [
+    (
+        "geschlecht",
+        "https://www.xrepository.de/api/xrepository/urn:xoev-de:xjustiz:codeliste:gds.geschlecht_2.1/download/GDS.Geschlecht_2.1.json",
+    ),
+    (
+        "rechtsform",
+        "https://www.xrepository.de/api/xrepository/urn:xoev-de:xjustiz:codeliste:gds.rechtsform_3.4/download/GDS.Rechtsform_3.4.json",
+    ),
+    (
+        "gerichtscode",
+        "https://www.xrepository.de/api/xrepository/urn:xoev-de:xgewerbeanzeige:codeliste:registergerichte_11/download/Registergerichte_11.json",
+    ),
+    (
+        "rollenbezeichnung",
+        "https://www.xrepository.de/api/xrepository/urn:xoev-de:xjustiz:codeliste:gds.rollenbezeichnung_3.5/download/GDS.Rollenbezeichnung_3.5.json",
+    ),
+    (
+        "eintragungsart",
+        "https://www.xrepository.de/api/xrepository/urn:xoev-de:xjustiz:codeliste:reg.eintragungsart_2.0/download/REG.Eintragungsart_2.0.json",
+    ),
+    (
+        "anschriftstyp",
+        "https://www.xrepository.de/api/xrepository/urn:xoev-de:xjustiz:codeliste:gds.anschriftstyp_3.0/download/GDS.Anschriftstyp_3.0.json",
+    ),
+]
+
+
+class IngestRunning(RuntimeError):
+    """
+    Raised when another process holds the ingest lock of the database.
+    """
+
+
+@contextmanager
+def ingest_lock():
+    """
+    Holds INGEST_LOCK_FILE, so one ingest or code table refresh writes to the
+    database at a time across processes.
+
+    Raises:
+        IngestRunning: Another process holds the lock.
+    """
+    with open(INGEST_LOCK_FILE, "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise IngestRunning(f"Another process is writing to {DB_LOCATION}") from None
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def init_schema():
+    """
+    Creates the missing tables and indexes. Existing tables are not altered otherwise.
+    """
+    models.Base.metadata.create_all(bind=writer_engine)
+    # create_all skips existing tables, including indexes added to them later
+    for table in models.Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=writer_engine, checkfirst=True)
+
+
+def refresh_code_tables():
+    """
+    Fills the empty code tables from the XJustiz code lists on xrepository.de.
+
+    Tables that already have rows are left alone, so this only goes to the network
+    for a fresh database.
+    """
+    metadata = MetaData()
+
+    for name, url in CODE_LIST_URLS:
+        table = Table(name, metadata, autoload_with=writer_engine)
+        with WriterSessionLocal() as session:
+            if session.query(table).count() > 0:
+                logger.info(f"Data already exists in the table: {name}, skipping URL.")
+                continue
+
+            try:
+                response = requests.get(url, timeout=30)
+            except requests.RequestException as exception:
+                logger.error(f"Failed to retrieve JSON data from the URL: {url} ({exception})")
+                continue
+            if response.status_code != 200:
+                logger.error(f"Failed to retrieve JSON data from the URL: {url}")
+                continue
+            json_data = response.json()
+            columns = [column["spaltennameTechnisch"] for column in json_data["spalten"]]
+
+            # Convert each list in data to a dictionary using columns for keys
+            for item in json_data["daten"]:
+                try:
+                    session.execute(table.insert().values(**dict(zip(columns, item))))
+                    session.commit()
+                except IntegrityError:
+                    session.rollback()
+                    continue
+
+
+def extract_company_info(data_dict, latest_file_path):
+    # Extract the required information
+    company = data_dict.get("tns:nachricht.reg.0400003", {})
+    nachrichtenkopf = company.get("tns:nachrichtenkopf", {})
+    auswahl_absender = nachrichtenkopf.get("tns:auswahl_absender", {})
+    absender_gericht = auswahl_absender.get("tns:absender.gericht", {})
+    court_sender_code = absender_gericht.get("code")
+
+    fachdatenRegister = company.get("tns:fachdatenRegister", {})
+    basisdatenRegister = fachdatenRegister.get("tns:basisdatenRegister", {})
+    satzungsdatum = basisdatenRegister.get("tns:satzungsdatum", {})
+    current_statute_date = satzungsdatum.get("tns:aktuellesSatzungsdatum")
+
+    rechtstraeger = basisdatenRegister.get("tns:rechtstraeger", {})
+    bezeichnung = rechtstraeger.get("tns:bezeichnung", {})
+    current_designation = bezeichnung.get("tns:bezeichnung.aktuell")
+
+    angabenZurRechtsform = rechtstraeger.get("tns:angabenZurRechtsform", {})
+    rechtsform = angabenZurRechtsform.get("tns:rechtsform", {}) if isinstance(angabenZurRechtsform, dict) else {}
+    legal_form_code = rechtsform.get("code") if isinstance(rechtsform, dict) else None
+
+    sitz = rechtstraeger.get("tns:sitz", {}) if rechtstraeger else {}
+    location = sitz.get("tns:ort")
+
+    anschrift = rechtstraeger.get("tns:anschrift", {})
+    if isinstance(anschrift, list):
+        anschrift = anschrift[0] if anschrift else {}
+    anschriftstyp = anschrift.get("tns:anschriftstyp", {})
+    address_type_code = anschriftstyp.get("code")
+
+    street = anschrift.get("tns:strasse")
+    house_number = anschrift.get("tns:hausnummer")
+    postal_code = anschrift.get("tns:postleitzahl")
+    city = anschrift.get("tns:ort")
+
+    staat = anschrift.get("tns:staat", {})
+    auswahl_staat = staat.get("tns:auswahl_staat", {})
+    staat = auswahl_staat.get("tns:staat", {})
+    state = staat.get("code")
+
+    subject_matter = basisdatenRegister.get("tns:gegenstand")
+
+    grunddaten = company.get("tns:grunddaten", {})
+    verfahrensdaten = grunddaten.get("tns:verfahrensdaten", {})
+    instanzdaten = verfahrensdaten.get("tns:instanzdaten", {})
+    aktenzeichen = instanzdaten.get("tns:aktenzeichen", {})
+    auswahl_aktenzeichen = aktenzeichen.get("tns:auswahl_aktenzeichen", {})
+    aktenzeichen_strukturiert = auswahl_aktenzeichen.get(
+        "tns:aktenzeichen.strukturiert", {}
+    )
+    register = aktenzeichen_strukturiert.get("tns:register", {})
+    register_code = register.get("code")
+    register_number = aktenzeichen_strukturiert.get("tns:laufendeNummer")
+    register_number_addition = aktenzeichen_strukturiert.get("tns:zusatz")
+
+    if not register_number:
+        register_number = aktenzeichen_strukturiert.get("tns:aktenzeichen.freitext")
+        if not register_number:
+            register_number = (
+                data_dict.get("tns:nachricht.reg.0400003", {})
+                .get("tns:nachrichtenkopf", {})
+                .get("tns:aktenzeichen.absender")
+            )
+        # Free-text file numbers like "HRB 12345 B", parsed as the resolver does
+        reference = registers.parse_reference(register_number)
+        if reference:
+            register_code = reference.register_code
+            register_number = reference.register_number
+            register_number_addition = reference.register_number_addition
+
+    if register_number_addition:
+        company_number = f"{court_sender_code}_{register_code}{register_number}{register_number_addition}"
+    else:
+        company_number = f"{court_sender_code}_{register_code}{register_number}"
+
+    # Merge all the information into a single dictionary
+    company = Company(
+        court_sender_code=court_sender_code,
+        current_statute_date=current_statute_date,
+        current_designation=current_designation,
+        legal_form_code=legal_form_code,
+        location=location,
+        address_type_code=address_type_code,
+        street=street,
+        house_number=house_number,
+        postal_code=postal_code,
+        city=city,
+        state=state,
+        subject_matter=subject_matter,
+        register_code=register_code,
+        register_number=register_number,
+        register_number_addition=register_number_addition,
+        company_number=company_number,
+        file_path=latest_file_path,
+        opencorporates=sources.opencorporates_url(company_number),
+    )
+
+    return company
+
+
+def extract_parties(data_dict, company_number, latest_file_path):
+    # Extract the people and organizations under tns:beteiligung
+    company = data_dict.get("tns:nachricht.reg.0400003", {})
+    grunddaten = company.get("tns:grunddaten", {})
+    verfahrensdaten = grunddaten.get("tns:verfahrensdaten", {})
+    beteiligung = verfahrensdaten.get("tns:beteiligung", [])
+    # A single participant is parsed as a dict instead of a list
+    if isinstance(beteiligung, dict):
+        beteiligung = [beteiligung]
+
+    parties = []
+    for participant in beteiligung:
+        roles = participant.get("tns:rolle", {})
+        # If roles is a list, take the first one
+        if isinstance(roles, list):
+            role = roles[0]
+        else:
+            role = roles
+        role_number = role.get("tns:rollennummer")
+        rollenbezeichnung = role.get("tns:rollenbezeichnung", {})
+        role_name_code = (
+            rollenbezeichnung.get("code") if rollenbezeichnung else None
+        )
+        beteiligter = participant.get("tns:beteiligter", {})
+        auswahl_beteiligter = beteiligter.get("tns:auswahl_beteiligter", {})
+        if "tns:natuerlichePerson" in auswahl_beteiligter:
+            person_info = auswahl_beteiligter.get("tns:natuerlichePerson", {})
+            vollerName = person_info.get("tns:vollerName", {})
+            first_name = vollerName.get("tns:vorname")
+            last_name = vollerName.get("tns:nachname")
+            geburt = person_info.get("tns:geburt", {})
+            birth_date = geburt.get("tns:geburtsdatum") if geburt else None
+            geschlecht = person_info.get("tns:geschlecht", {})
+            gender_code = geschlecht.get("code") if geschlecht else None
+            anschrift = person_info.get("tns:anschrift", {})
+            city = anschrift.get("tns:ort") 
+            staat = anschrift.get("tns:staat", {})
+            auswahl_staat = staat.get("tns:auswahl_staat", {})
+            staat = auswahl_staat.get("tns:staat", {})
+            state_code = staat.get("code") if staat else None
+
+            parties.append(
+                ParticipantPerson(
+                    role_number=role_number,
+                    role_name_code=role_name_code,
+                    first_name=first_name,
+                    last_name=last_name,
+                    birth_date=birth_date,
+                    gender_code=gender_code,
+                    city=city,
+                    state_code=state_code,
+                    company_number=company_number,
+                    file_path=latest_file_path,
+                )
+            )
+        elif "tns:organisation" in auswahl_beteiligter:
+            org_info = auswahl_beteiligter.get("tns:organisation", {})
+            bezeichnung = org_info.get("tns:bezeichnung", {}) if org_info else {}
+            name = bezeichnung.get("tns:bezeichnung.aktuell") if bezeichnung else None
+            angabenZurRechtsform = org_info.get("tns:angabenZurRechtsform", {})
+            rechtsform = angabenZurRechtsform.get("tns:rechtsform", {}) if angabenZurRechtsform else {}
+            legal_form_code = rechtsform.get("code") if rechtsform else None
+            sitz = org_info.get("tns:sitz", {}) if org_info else {}
+            city = sitz.get("tns:ort") if sitz else None
+            anschrift = org_info.get("tns:anschrift", {}) if org_info else {}
+            staat = anschrift.get("tns:staat", {}) if anschrift else {}
+            auswahl_staat = staat.get("tns:auswahl_staat", {}) if staat else {}
+            staat = auswahl_staat.get("tns:staat", {}) if auswahl_staat else {}
+            state_code = staat.get("code") if staat else None
+            parties.append(
+                ParticipantOrganization(
+                    role_number=role_number,
+                    role_name_code=role_name_code,
+                    name=name,
+                    legal_form_code=legal_form_code,
+                    city=city,
+                    state_code=state_code,
+                    company_number=company_number,
+                    file_path=latest_file_path,
+                )
+            )
+
+    return parties
+
+
+def extract_entries(data_dict, company_number, latest_file_path):
+    # Extract the tns:eintragungstext
+    company = data_dict.get("tns:nachricht.reg.0400003", {})
+    fachdatenRegister = company.get("tns:fachdatenRegister", {})
+    auszug = fachdatenRegister.get("tns:auszug", {})
+    eintragungstext = auszug.get("tns:eintragungstext", [])
+    # A single entry is parsed as a dict instead of a list
+    if isinstance(eintragungstext, dict):
+        eintragungstext = [eintragungstext]
+
+    entries = []
+    for entry in eintragungstext:
+        if isinstance(entry, dict):
+            column = entry.get("tns:spalte")
+            position = entry.get("tns:position")
+            running_number = entry.get("tns:laufendeNummer")
+            eintragungsart = entry.get("tns:eintragungsart", {})
+            entry_type_code = eintragungsart.get("code")
+            text = entry.get("tns:text")
+            entries.append(
+                RegisterEntry(
+                    column=column,
+                    position=position,
+                    running_number=running_number,
+                    entry_type_code=entry_type_code,
+                    text=text,
+                    company_number=company_number,
+                    file_path=latest_file_path,
+                )
+            )
+    return entries
+
+
+def parse_extract(extract_file, stage_totals=None):
+    """
+    Reads a register extract and extracts its company, participants and entries.
+
+    Args:
+        extract_file (ExtractFile): The extract, see hr_api.extract_files.
+        stage_totals (dict, optional): Accumulates the seconds per ingest stage.
+
+    Returns:
+        tuple: The Company, its participants and its register entries, or None when
+            the file is no register extract.
+
+    Raises:
+        TypeError: The extract does not have the expected structure.
+    """
+    with stage_timer("file_read", stage_totals):
+        xml_data = extract_file.read()
+
+    # Parse the XML data
+    with stage_timer("xml_parse", stage_totals):
+        data_dict = xmltodict.parse(xml_data)
+
+    if "tns:nachricht.reg.0400003" not in data_dict:
+        return None
+    # Rows reference the file by id, the URL is built when a response is rendered
+    path = sources.source_path(extract_file.path)
+    with stage_timer("extract_company_info", stage_totals):
+        company = extract_company_info(data_dict, path)
+    with stage_timer("extract_parties", stage_totals):
+        parties = extract_parties(data_dict, company.company_number, path)
+    with stage_timer("extract_entries", stage_totals):
+        entries = extract_entries(data_dict, company.company_number, path)
+
+    if company.current_designation is None:
+        for party in parties:
+            if isinstance(party, ParticipantOrganization):
+                if party.role_name_code == "287":  # ["287","Rechtsträger(in)",""]
+                    company.current_designation = party.name
+                    break
+    return company, parties, entries
+
+
+def older_extracts(older_files, latest, stage_totals, counts):
+    """
+    Parses the older extracts of a company for its history, newest first.
+
+    Args:
+        older_files (list): The older ExtractFiles, newest first.
+        latest (tuple): The company, participants and entries of the newest extract.
+        stage_totals (dict): Accumulates the seconds per ingest stage.
+        counts (dict): The file counts of the ingest run. Every file is counted as
+            seen, the ones that could not be parsed as failed or skipped.
+
+    Returns:
+        list: The file path and reverse delta of every older extract that could be parsed.
+    """
+    extracts = []
+    newer = history.extract_state(*latest)
+    for extract_file in older_files:
+        counts["files_seen"] += 1
+        try:
+            extract = parse_extract(extract_file, stage_totals)
+        except TypeError:
+            logger.warning(f"Left the older extract {extract_file.path} out of the company history")
+            INGEST_FILES.inc(status="failed")
+            counts["files_failed"] += 1
+            continue
+        if extract is None:
+            logger.warning(f"Left the older extract {extract_file.path} out of the company history")
+            INGEST_FILES.inc(status="skipped")
+            counts["files_skipped"] += 1
+            continue
+        with stage_timer("history", stage_totals):
+            older = history.extract_state(*extract)
+            extracts.append((extract_file.path, history.reverse_delta(newer, older)))
+        newer = older
+    return extracts
+
+
+def run_ingest(db):
+    """
+    Refreshes the database by deleting existing data and adding new data from XML files.
+
+    The run is recorded in the ingest_runs table, see /admin/ingest-runs, and the
+    companies it inserted, updated or deleted in company_changes, see /changes. With
+    INGEST_HISTORY, the older extracts of every company are stored as changes in
+    company_history, see hr_api.history.
+
+    Args:
+        db (Session): The database session.
+
+    Returns:
+        dict: A dictionary containing a message indicating the number of companies added to the database.
+    """
+    db.execute(text("DELETE FROM companies"))
+    db.execute(text("DELETE FROM entries"))
+    db.execute(text("DELETE FROM participant_organizations"))
+    db.execute(text("DELETE FROM participant_persons"))
+    db.execute(text("DELETE FROM company_history"))
+    db.execute(text("DELETE FROM source_files"))
+
+    generation = models.Generations(created_at=datetime.now(timezone.utc).isoformat())
+    db.add(generation)
+    db.commit()
+    generation = generation.generation
+
+    started = time.perf_counter()
+    ingest_run = models.IngestRuns(
+        generation=generation,
+        status="running",
+        started_at=datetime.now(timezone.utc).isoformat(),
+    )
+    db.add(ingest_run)
+    db.commit()
+    ingest_run_id = ingest_run.id
+
+    counts = {
+        "files_seen": 0,
+        "files_parsed": 0,
+        "files_skipped": 0,
+        "files_failed": 0,
+        "companies_inserted": 0,
+        "participants_inserted": 0,
+        "entries_inserted": 0,
+    }
+    stage_totals = {}
+
+    def finish_run(status):
+        ingest_run = db.get(models.IngestRuns, ingest_run_id)
+        ingest_run.status = status
+        ingest_run.finished_at = datetime.now(timezone.utc).isoformat()
+        ingest_run.duration_seconds = round(time.perf_counter() - started, 3)
+        ingest_run.stage_seconds = json.dumps({stage: round(seconds, 3) for stage, seconds in stage_totals.items()})
+        for key, value in counts.items():
+            setattr(ingest_run, key, value)
+        db.commit()
+
+    try:
+        # Plain, compressed and archived extracts alike, see hr_api.extract_files
+        for company_files in extract_files.company_extracts(DOWNLOAD_FOLDER, stage_totals):
+            # Sort the files by date and time in descending order
+            company_files.sort(key=lambda extract_file: history.extracted_at(extract_file.path), reverse=True)
+
+            # Pick the latest file
+            latest_file_path = company_files[0].path
+            counts["files_seen"] += 1
+
+            try:
+                extract = parse_extract(company_files[0], stage_totals)
+            except TypeError:
+                logger.error(f"TypeError adding data to the database for {latest_file_path}")
+                INGEST_FILES.inc(status="failed")
+                counts["files_failed"] += 1
+                continue
+            if extract is None:
+                logger.warning(f"File {latest_file_path} does not contain the required data")
+                INGEST_FILES.inc(status="skipped")
+                counts["files_skipped"] += 1
+                continue
+            company, parties, entries = extract
+
+            older = older_extracts(company_files[1:], extract, stage_totals, counts) if history.INGEST_HISTORY else []
+            # The newest extract and the older ones stored with it
+            parsed_files = 1 + len(older)
+            file_path = sources.source_path(latest_file_path)
+            try:
+                source_file_id = sources.add_source_file(db, file_path, generation)
+                stored = {"source_file_id": source_file_id, "generation": generation}
+                db.add(models.Companies(**company.model_dump(exclude={"file_path", "opencorporates"}), **stored))
+
+                for party in parties:
+                    party_values = party.model_dump(exclude={"file_path"})
+                    if isinstance(party, ParticipantPerson):
+                        db.add(models.ParticipantPersons(**party_values, **stored))
+                    elif isinstance(party, ParticipantOrganization):
+                        db.add(models.ParticipantOrganizations(**party_values, **stored))
+
+                for entry_item in entries:
+                    entry_values = entry_item.model_dump(exclude={"file_path"})
+                    db.add(models.Entries(**entry_values, **stored))
+
+                if history.INGEST_HISTORY:
+                    number = company.company_number
+                    db.add(history.history_row(number, latest_file_path, source_file_id, generation))
+                    for older_path, delta in older:
+                        older_id = sources.add_source_file(db, sources.source_path(older_path), generation)
+                        db.add(history.history_row(number, older_path, older_id, generation, delta))
+
+                with stage_timer("changes", stage_totals):
+                    changes.record_company(db, company, parties, entries, generation)
+
+                with stage_timer("db_flush", stage_totals):
+                    db.commit()
+            except IntegrityError:
+                db.rollback()
+                logger.error(f"IntegrityError adding data to the database for {latest_file_path}")
+                INGEST_FILES.inc(parsed_files, status="failed")
+                counts["files_failed"] += parsed_files
+                continue
+
+            INGEST_FILES.inc(parsed_files, status="processed")
+            counts["files_parsed"] += parsed_files
+            counts["companies_inserted"] += 1
+            counts["participants_inserted"] += len(parties)
+            counts["entries_inserted"] += len(entries)
+
+            db.close()
+
+        with stage_timer("changes", stage_totals):
+            changes.record_deletions(db, generation)
+        with stage_timer("compress_entries", stage_totals):
+            compression.compress_entries(db, generation)
+        with stage_timer("aggregates", stage_totals):
+            aggregates.refresh_aggregates(db, generation)
+        with stage_timer("statistics", stage_totals):
+            listing.refresh_statistics(db)
+        with stage_timer("register_keys", stage_totals):
+            registers.refresh_register_keys(db, generation)
+        with stage_timer("name_index", stage_totals):
+            fuzzy.refresh_name_index(db, generation)
+        with stage_timer("columnar_snapshot", stage_totals):
+            columnar.write_columnar_snapshot(db, generation)
+    except Exception:
+        db.rollback()
+        finish_run("failed")
+        raise
+
+    finish_run("finished")
+
+    # After the run is recorded, so the snapshot includes its ingest_runs row
+    try:
+        with stage_timer("db_snapshot"):
+            db_snapshots.publish_snapshot(generation)
+    except Exception:
+        logger.exception(f"Could not publish the database snapshot of generation {generation}")
+
+    return {
+        "message": f"Added {counts['companies_inserted']} companies to the database..",
+        "ingest_run": ingest_run_id,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingests the register extracts in DOWNLOAD_FOLDER.")
+    parser.add_argument(
+        "--skip-code-tables", action="store_true", help="Do not fill empty code tables from xrepository.de"
+    )
+    parser.add_argument(
+        "--code-tables-only", action="store_true", help="Only create the schema and fill the code tables"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    with ingest_lock():
+        init_schema()
+        if not args.skip_code_tables:
+            refresh_code_tables()
+        if args.code_tables_only:
+            return
+
+        db = WriterSessionLocal()
+        try:
+            result = run_ingest(db)
+        finally:
+            db.close()
+    logger.info(result["message"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+SQL statement instrumentation: per-request statement counts and DB time, and a slow-query log.
+"""
+import contextvars
+import logging
+import os
+import time
+
+from sqlalchemy import event
+
+from hr_api.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Statements slower than this are logged together with their query plan
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+EXPLAIN_SLOW_QUERIES = os.getenv("EXPLAIN_SLOW_QUERIES", "true").lower() in ("1", "true", "yes")
+
+DB_QUERY_SECONDS = Histogram(
+    "hr_api_db_query_duration_seconds",
+    "Duration of SQL statements.",
+    ("engine",),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+DB_SLOW_QUERIES = Counter(
+    "hr_api_db_slow_queries_total",
+    "SQL statements slower than SLOW_QUERY_MS.",
+    ("engine",),
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "hr_api_db_queries_per_request",
+    "Number of SQL statements issued per HTTP request.",
+    ("route",),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 500),
+)
+DB_SECONDS_PER_REQUEST = Histogram(
+    "hr_api_db_time_per_request_seconds",
+    "Total SQL statement time per HTTP request.",
+    ("route",),
+)
+
+
+class QueryStats:
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+# Set per request by QueryStatsMiddleware. Holds a mutable object so statements run
+# in worker threads, which see a copy of the context, still add to the same stats.
+_query_stats = contextvars.ContextVar("query_stats", default=None)
+
+_instrumented_engines = set()
+
+
+def explain_query_plan(cursor, statement, parameters):
+    try:
+        plan_cursor = cursor.connection.cursor()
+        try:
+            plan_cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            return "\n".join(str(row[-1]) for row in plan_cursor.fetchall())
+        finally:
+            plan_cursor.close()
+    except Exception as exception:
+        return f"unavailable ({exception})"
+
+
+def instrument_engine(engine, name):
+    """
+    Registers the statement timing hooks on an engine.
+
+    Args:
+        engine (Engine): The engine to instrument.
+        name (str): The engine label used in the metrics, e.g. reader or writer.
+    """
+    # Every app created by main.create_app instruments the same engines
+    if engine in _instrumented_engines:
+        return
+    _instrumented_engines.add(engine)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+        DB_QUERY_SECONDS.observe(elapsed, engine=name)
+
+        stats = _query_stats.get()
+        if stats is not None:
+            stats.count += 1
+            stats.seconds += elapsed
+
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            DB_SLOW_QUERIES.inc(engine=name)
+            plan = ""
+            if EXPLAIN_SLOW_QUERIES and not executemany and statement.lstrip().upper().startswith("SELECT"):
+                plan = "\n" + explain_query_plan(cursor, statement, parameters)
+            logger.warning(f"Slow query ({elapsed * 1000:.1f} ms on {name}): {statement}{plan}")
+
+
+class QueryStatsMiddleware:
+    """
+    ASGI middleware counting the SQL statements and DB time of each request.
+
+    The totals are returned in the X-DB-Queries and X-DB-Time-Ms response headers
+    and recorded per route in the metrics.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-db-queries", str(stats.count).encode()),
+                    (b"x-db-time-ms", f"{stats.seconds * 1000:.2f}".encode()),
+                ]
+            await send(message)
+
+        context_token = _query_stats.set(stats)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _query_stats.reset(context_token)
+            route = scope.get("route")
+            route = route.path if route is not None else "unmatched"
+            DB_QUERIES_PER_REQUEST.observe(stats.count, route=route)
+            DB_SECONDS_PER_REQUEST.observe(stats.seconds, route=route)
@@ -0,0 +1,302 @@
+"""
+Filtered and sorted listing of companies.
+
+Every filter of /companies/ is an equality or a range on an indexed column of the
+companies table (see the indexes of models.Companies), and every sort column has an
+index ending in the company number, the tie breaker. SQLite then answers a listing
+by searching one index instead of scanning the table; `unindexed_listings` checks
+this against the query plan of every combination of filters and sorts.
+
+Which index is best depends on how many companies match. SQLite estimates that from
+the average number of rows per value in sqlite_stat1, written by `refresh_statistics`
+at the end of an ingest, and walks the index of the sort column when the filters
+match many companies. For rare combinations of common values, e.g. OHGs in a GnR
+register at one court, that walk would read most of the table, so a listing whose
+filters match at most LISTING_SORT_ROWS companies searches a filter index and sorts
+the matches instead. The matches are counted with the WHERE clause of the listing,
+stopping after LISTING_SORT_ROWS + 1, so the walk is left to listings where about
+every LISTING_SORT_ROWS-th row of the sort index or more fills the page.
+"""
+import itertools
+import os
+from datetime import date
+from enum import Enum
+from typing import NamedTuple, Optional
+
+from sqlalchemy import func, literal, select, text
+from sqlalchemy.orm import Session
+
+import hr_api.models as models
+
+# Matching companies up to which a listing is sorted instead of walking the sort index
+LISTING_SORT_ROWS = int(os.getenv("LISTING_SORT_ROWS", "20000"))
+
+
+class CompanySort(str, Enum):
+    company_number = "company_number"
+    current_designation = "current_designation"
+    current_statute_date = "current_statute_date"
+    postal_code = "postal_code"
+    city = "city"
+
+
+class SortOrder(str, Enum):
+    asc = "asc"
+    desc = "desc"
+
+
+class CompanyFilters(NamedTuple):
+    legal_form_code: Optional[str] = None
+    court_sender_code: Optional[str] = None
+    city: Optional[str] = None
+    postal_code: Optional[str] = None
+    state: Optional[str] = None
+    register_code: Optional[str] = None
+    statute_date_from: Optional[date] = None
+    statute_date_to: Optional[date] = None
+
+
+# Filters compared for equality, by their column
+EQUALITY_FILTERS = ("legal_form_code", "court_sender_code", "city", "state", "register_code")
+# The filters on each sort column, whose index is then searched in sort order
+SORT_FILTERS = {
+    CompanySort.current_statute_date: ("statute_date_from", "statute_date_to"),
+    CompanySort.postal_code: ("postal_code",),
+    CompanySort.city: ("city",),
+}
+
+
+def postal_code_range(prefix):
+    """
+    Returns the bounds of the postal codes starting with a prefix, e.g. ("10", "11").
+
+    A range is searched in the postal code index, unlike LIKE, which SQLite only
+    optimizes with case sensitive matching.
+    """
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def filter_conditions(filters: CompanyFilters):
+    """
+    Returns the WHERE conditions of a listing.
+    """
+    conditions = [
+        getattr(models.Companies, name) == getattr(filters, name)
+        for name in EQUALITY_FILTERS
+        if getattr(filters, name) is not None
+    ]
+    if filters.postal_code:
+        lower, upper = postal_code_range(filters.postal_code)
+        conditions += [models.Companies.postal_code >= lower, models.Companies.postal_code < upper]
+    # Statute dates are stored as ISO dates, which compare like dates
+    if filters.statute_date_from is not None:
+        conditions.append(models.Companies.current_statute_date >= filters.statute_date_from.isoformat())
+    if filters.statute_date_to is not None:
+        conditions.append(models.Companies.current_statute_date <= filters.statute_date_to.isoformat())
+    return conditions
+
+
+def filters_sort_column(filters: CompanyFilters, sort: CompanySort):
+    """
+    Tells whether a listing filters on its sort column, so that searching the index
+    of the sort column returns the matches in order.
+    """
+    return any(getattr(filters, name) is not None for name in SORT_FILTERS.get(sort, ()))
+
+
+def count_matches(db: Session, filters: CompanyFilters, limit: int = LISTING_SORT_ROWS):
+    """
+    Counts the companies matching the filters, up to a limit.
+
+    Args:
+        db (Session): The database session.
+        filters (CompanyFilters): The filters of a listing.
+        limit (int): The count after which to stop.
+
+    Returns:
+        int: The number of matching companies, limit + 1 when there are more.
+    """
+    matches = select(literal(1)).select_from(models.Companies).where(*filter_conditions(filters)).limit(limit + 1)
+    return db.execute(select(func.count()).select_from(matches.subquery())).scalar_one()
+
+
+def list_companies(
+    filters: CompanyFilters,
+    sort: CompanySort = CompanySort.company_number,
+    order: SortOrder = SortOrder.asc,
+    skip: int = 0,
+    limit: int = 100,
+    sort_matches: bool = False,
+    query=None,
+):
+    """
+    Builds the query of a page of companies.
+
+    Args:
+        filters (CompanyFilters): The filters, all of which a company has to match.
+        sort (CompanySort): The column to sort by, companies with the same value are
+            sorted by company number.
+        order (SortOrder): asc or desc.
+        skip (int): The number of companies to skip.
+        limit (int): The number of companies to return.
+        sort_matches (bool): Search a filter index and sort the matches, instead of
+            letting SQLite walk the index of the sort column.
+        query (Select, optional): The columns to return, selected from the companies table.
+            Defaults to all columns with the file path.
+
+    Returns:
+        Select: The page of companies.
+    """
+    columns = [getattr(models.Companies, sort.value)]
+    if sort != CompanySort.company_number:
+        columns.append(models.Companies.company_number)
+        if sort_matches:
+            # An expression instead of the column keeps SQLite from ordering by its index
+            columns = [column.concat("") for column in columns]
+    if order == SortOrder.desc:
+        columns = [column.desc() for column in columns]
+    if query is None:
+        query = select(
+            *(column for column in models.Companies.__table__.columns if column.name != "source_file_id"),
+            models.SourceFiles.path.label("file_path"),
+        ).outerjoin(models.SourceFiles, models.Companies.source_file_id == models.SourceFiles.id)
+    return query.where(*filter_conditions(filters)).order_by(*columns).offset(skip).limit(limit)
+
+
+def listing_query(
+    db: Session,
+    filters: CompanyFilters,
+    sort: CompanySort = CompanySort.company_number,
+    order: SortOrder = SortOrder.asc,
+    skip: int = 0,
+    limit: int = 100,
+    query=None,
+):
+    """
+    Builds the query of a page of companies, sorting the matches when the filters
+    match at most LISTING_SORT_ROWS companies and the index of the sort column is not
+    searched anyway. See list_companies.
+    """
+    sort_matches = (
+        sort != CompanySort.company_number
+        and any(value is not None for value in filters)
+        and not filters_sort_column(filters, sort)
+        and count_matches(db, filters) <= LISTING_SORT_ROWS
+    )
+    return list_companies(filters, sort, order, skip, limit, sort_matches, query)
+
+
+def refresh_statistics(db: Session):
+    """
+    Counts the rows per value in the indexes of the companies table for the query planner.
+
+    Not sampled with analysis_limit: a sample sees at most as many rows per value as
+    it reads, which makes common values like a legal form look selective.
+
+    Args:
+        db (Session): A writer session.
+    """
+    db.execute(text("ANALYZE companies"))
+    db.commit()
+
+
+def query_plan(db: Session, statement):
+    """
+    Returns the details of SQLite's query plan of a statement, one per step.
+    """
+    compiled = statement.compile(bind=db.get_bind(), compile_kwargs={"literal_binds": True})
+    rows = db.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}")
+    return [row[-1] for row in rows]
+
+
+# Typical values for the plan check. sqlite_stat1 holds no statistics per value, so
+# the plans only depend on them through count_matches.
+_SAMPLE_FILTERS = CompanyFilters(
+    legal_form_code="GMBH",
+    court_sender_code="F1103R",
+    city="Berlin",
+    postal_code="10",
+    state="DE",
+    register_code="HRB",
+    statute_date_from=date(2000, 1, 1),
+    statute_date_to=date(2010, 12, 31),
+)
+# Filters that can be combined, the statute date bounds count as one
+_FILTER_GROUPS = (
+    ("legal_form_code",),
+    ("court_sender_code",),
+    ("city",),
+    ("postal_code",),
+    ("state",),
+    ("register_code",),
+    ("statute_date_from", "statute_date_to"),
+)
+
+
+def filter_combinations():
+    """
+    Yields every combination of filters, with sample values.
+    """
+    for size in range(len(_FILTER_GROUPS) + 1):
+        for groups in itertools.combinations(_FILTER_GROUPS, size):
+            names = [name for group in groups for name in group]
+            yield CompanyFilters(**{name: getattr(_SAMPLE_FILTERS, name) for name in names})
+
+
+def is_index_backed(plan):
+    """
+    Tells whether a listing plan searches an index of the companies table.
+
+    A SCAN step reads the table or an index from one end, even when it goes through
+    an index, so only plans whose every step on the companies table is an index
+    SEARCH count.
+    """
+    steps = [step for step in plan if step.startswith(("SCAN companies", "SEARCH companies"))]
+    return bool(steps) and all(step.startswith("SEARCH companies") and "INDEX" in step for step in steps)
+
+
+def walks_sort_index(db: Session, filters: CompanyFilters, sort: CompanySort):
+    """
+    Tells whether a listing may walk the index of its sort column by design: without
+    filters, or when the filters match more than LISTING_SORT_ROWS companies.
+    """
+    if not any(value is not None for value in filters):
+        return True
+    return (
+        sort != CompanySort.company_number
+        and not filters_sort_column(filters, sort)
+        and count_matches(db, filters) > LISTING_SORT_ROWS
+    )
+
+
+def unindexed_listings(db: Session):
+    """
+    Explains the listing of every combination of filters, sort column and order.
+
+    Listings that may walk the index of their sort column (see walks_sort_index)
+    are left out.
+
+    Args:
+        db (Session): The database session.
+
+    Returns:
+        list: The combinations whose plan does not search an index, with their plan.
+            Empty when every listing is index-backed.
+    """
+    failures = []
+    for filters in filter_combinations():
+        for sort in CompanySort:
+            if walks_sort_index(db, filters, sort):
+                continue
+            for order in SortOrder:
+                plan = query_plan(db, listing_query(db, filters, sort, order))
+                if not is_index_backed(plan):
+                    failures.append(
+                        {
+                            "filters": {name: value for name, value in filters._asdict().items() if value is not None},
+                            "sort": sort.value,
+                            "order": order.value,
+                            "plan": plan,
+                        }
+                    )
+    return failures
@@ -1,7 +1,41 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Float, Index, Integer, LargeBinary, String, ForeignKey
 from hr_api.database import Base
 
 
+class Generations(Base):
+    __tablename__ = "generations"
+    generation = Column(Integer, primary_key=True, autoincrement=True)
+    created_at = Column(String)
+
+
+class IngestRuns(Base):
+    __tablename__ = "ingest_runs"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    generation = Column(Integer, ForeignKey("generations.generation"), index=True)
+    status = Column(String)
+    started_at = Column(String)
+    finished_at = Column(String)
+    duration_seconds = Column(Float)
+    # Every extract file read, the older ones parsed for the history included. Each
+    # is counted once more as parsed, skipped or failed.
+    files_seen = Column(Integer)
+    files_parsed = Column(Integer)
+    files_skipped = Column(Integer)
+    files_failed = Column(Integer)
+    companies_inserted = Column(Integer)
+    participants_inserted = Column(Integer)
+    entries_inserted = Column(Integer)
+    # JSON object of the seconds spent per ingest stage
+    stage_seconds = Column(String)
+
+
+class SourceFiles(Base):
+    __tablename__ = "source_files"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    path = Column(String)
+    generation = Column(Integer, ForeignKey("generations.generation"), index=True)
+
+
 class Companies(Base):
     __tablename__ = "companies"
     court_sender_code = Column(String, ForeignKey("gerichtscode.XJustiz_Id"))
@@ -20,8 +54,21 @@ class Companies(Base):
     register_number = Column(String)
     register_number_addition = Column(String)
     company_number = Column(String, primary_key=True, index=True)
-    file_path = Column(String)
-    opencorporates = Column(String)
+    source_file_id = Column(Integer, ForeignKey("source_files.id"))
+    generation = Column(Integer, ForeignKey("generations.generation"), index=True)
+
+    # One index per filter and sort of /companies/, see hr_api.listing. Ending in the
+    # company number, they return filtered rows in listing order without sorting.
+    __table_args__ = (
+        Index("ix_companies_legal_form_code", "legal_form_code", "company_number"),
+        Index("ix_companies_court_sender_code", "court_sender_code", "company_number"),
+        Index("ix_companies_city", "city", "company_number"),
+        Index("ix_companies_postal_code", "postal_code", "company_number"),
+        Index("ix_companies_state", "state", "company_number"),
+        Index("ix_companies_register_code", "register_code", "company_number"),
+        Index("ix_companies_current_statute_date", "current_statute_date", "company_number"),
+        Index("ix_companies_current_designation", "current_designation", "company_number"),
+    )
 
 
 class ParticipantPersons(Base):
@@ -35,8 +82,9 @@ class ParticipantPersons(Base):
     gender_code = Column(String, ForeignKey("geschlecht.code"))
     city = Column(String)
     state_code = Column(String)
-    company_number = Column(String, ForeignKey("companies.company_number"))
-    file_path = Column(String)
+    company_number = Column(String, ForeignKey("companies.company_number"), index=True)
+    source_file_id = Column(Integer, ForeignKey("source_files.id"))
+    generation = Column(Integer, ForeignKey("generations.generation"), index=True)
 
 
 class ParticipantOrganizations(Base):
@@ -48,8 +96,16 @@ class ParticipantOrganizations(Base):
     legal_form_code = Column(String, ForeignKey("rechtsform.code"))
     city = Column(String)
     state_code = Column(String)
-    company_number = Column(String, ForeignKey("companies.company_number"))
-    file_path = Column(String)
+    company_number = Column(String, ForeignKey("companies.company_number"), index=True)
+    source_file_id = Column(Integer, ForeignKey("source_files.id"))
+    generation = Column(Integer, ForeignKey("generations.generation"), index=True)
+
+
+class CompressionDictionaries(Base):
+    __tablename__ = "compression_dictionaries"
+    dict_id = Column(Integer, primary_key=True, autoincrement=False)
+    generation = Column(Integer, ForeignKey("generations.generation"), index=True)
+    dictionary = Column(LargeBinary)
 
 
 class Entries(Base):
@@ -59,9 +115,45 @@ class Entries(Base):
     position = Column(String)
     running_number = Column(String)
     entry_type_code = Column(String, ForeignKey("eintragungsart.Schluessel"))
+    # Plain text, or a zstd frame when compressed, see hr_api.compression
     text = Column(String)
-    company_number = Column(String, ForeignKey("companies.company_number"))
-    file_path = Column(String)
+    company_number = Column(String, ForeignKey("companies.company_number"), index=True)
+    source_file_id = Column(Integer, ForeignKey("source_files.id"))
+    generation = Column(Integer, ForeignKey("generations.generation"), index=True)
+
+
+class CompanyFingerprints(Base):
+    __tablename__ = "company_fingerprints"
+    company_number = Column(String, primary_key=True)
+    generation = Column(Integer, ForeignKey("generations.generation"), index=True)
+    # hr_api.changes.FINGERPRINT_VERSION and one CRC32 per field of FINGERPRINT_FIELDS
+    fingerprint = Column(LargeBinary)
+
+
+class CompanyChanges(Base):
+    __tablename__ = "company_changes"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    generation = Column(Integer, ForeignKey("generations.generation"), index=True)
+    company_number = Column(String, index=True)
+    # inserted, updated or deleted
+    change_type = Column(String)
+    # JSON list of the changed fields of an update
+    changed_fields = Column(String)
+
+
+class CompanyHistory(Base):
+    __tablename__ = "company_history"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    company_number = Column(String)
+    # Creation time of the register extract, from its file name, e.g. 2023-03-11T13:59:19
+    extracted_at = Column(String)
+    source_file_id = Column(Integer, ForeignKey("source_files.id"))
+    # JSON changes from the next newer extract to this one, see hr_api.history.
+    # NULL for the newest extract, whose state is the one in the data tables.
+    changes = Column(String)
+    generation = Column(Integer, ForeignKey("generations.generation"), index=True)
+
+    __table_args__ = (Index("ix_company_history_company_number", "company_number", "extracted_at"),)
 
 
 class Geschlecht(Base):
@@ -106,3 +198,54 @@ class Anschriftstyp(Base):
     __tablename__ = "anschriftstyp"
     code = Column(String, primary_key=True)
     wert = Column(String)
+
+
+class CompanyFacets(Base):
+    __tablename__ = "company_facets"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    legal_form_code = Column(String, index=True)
+    court_sender_code = Column(String, index=True)
+    state = Column(String, index=True)
+    postal_region = Column(String, index=True)
+    companies = Column(Integer)
+    generation = Column(Integer)
+
+
+class ParticipantRoleFacets(Base):
+    __tablename__ = "participant_role_facets"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    participant_type = Column(String)
+    role_name_code = Column(String)
+    participants = Column(Integer)
+    generation = Column(Integer)
+
+
+class RegisterKeys(Base):
+    __tablename__ = "register_keys"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # Register code, number without leading zeros and addition, e.g. HRB12345B
+    key = Column(String, index=True)
+    court_sender_code = Column(String)
+    company_number = Column(String)
+    generation = Column(Integer)
+
+
+class CompanyNames(Base):
+    __tablename__ = "company_names"
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    company_number = Column(String)
+    current_designation = Column(String)
+    # See hr_api.names.company_name_parts
+    name_key = Column(String)
+    legal_form = Column(String)
+    generation = Column(Integer)
+
+
+class NameTrigrams(Base):
+    __tablename__ = "name_trigrams"
+    trigram = Column(String, primary_key=True)
+    # Number of company names containing the trigram
+    companies = Column(Integer)
+    # Little-endian uint32 ids of those company_names rows, ascending
+    company_ids = Column(LargeBinary)
+    generation = Column(Integer)
@@ -0,0 +1,107 @@
+"""
+Normalization of names for lookups, e.g. of register courts and company names.
+"""
+import re
+import unicodedata
+
+UMLAUTS = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+NON_ALPHANUMERIC = re.compile(r"[^0-9a-z]+")
+
+# Legal forms at the end of company names, normalized, longest first where one ends another
+LEGAL_FORMS = sorted(
+    (
+        "gmbh co kgaa", "gmbh co kg", "gmbh co ohg", "ag co kg", "se co kg", "ug haftungsbeschraenkt co kg",
+        "ug haftungsbeschraenkt", "gmbh", "ggmbh", "mbh", "ug", "ag", "se", "kgaa", "kg", "ohg", "gbr", "partg mbb",
+        "partg", "e k", "ek", "e kfm", "e kfr", "e v", "ev", "e g", "eg", "co kg", "ltd", "inc",
+    ),
+    key=len,
+    reverse=True,
+)
+
+# Spelled out legal forms, normalized, by their abbreviation in LEGAL_FORMS
+LEGAL_FORM_SPELLINGS = {
+    "gesellschaft mit beschraenkter haftung": "gmbh",
+    "gemeinnuetzige gmbh": "ggmbh",
+    "kommanditgesellschaft auf aktien": "kgaa",
+    "aktiengesellschaft": "ag",
+    "kommanditgesellschaft": "kg",
+    "offene handelsgesellschaft": "ohg",
+    "gesellschaft buergerlichen rechts": "gbr",
+    "unternehmergesellschaft": "ug",
+    "europaeische gesellschaft": "se",
+    "partnerschaftsgesellschaft": "partg",
+    "eingetragener kaufmann": "e k",
+    "eingetragene kauffrau": "e k",
+    "eingetragener verein": "e v",
+    "eingetragene genossenschaft": "e g",
+    "und co": "co",
+}
+SPELLED_LEGAL_FORM = re.compile(
+    r"\b(" + "|".join(sorted(LEGAL_FORM_SPELLINGS, key=len, reverse=True)) + r")\b"
+)
+
+
+def fold(value):
+    """
+    Returns a name lowercased, with umlauts spelled out and other accents removed.
+    """
+    value = value.lower().translate(UMLAUTS)
+    return unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode("ascii")
+
+
+def normalize_name(value):
+    """
+    Returns the lookup form of a name: folded, with runs of other characters as one space.
+
+    "Berlin (Charlottenburg)" and "berlin-charlottenburg" both become "berlin charlottenburg".
+    """
+    return NON_ALPHANUMERIC.sub(" ", fold(value)).strip()
+
+
+def split_legal_form(normalized):
+    """
+    Splits the legal form off a normalized company name, e.g. ("mueller", "gmbh co kg").
+
+    Returns:
+        tuple: The name without its legal form, and the legal form or None. Names that
+            are nothing but a legal form are returned unchanged.
+    """
+    stripped = normalized
+    while True:
+        for legal_form in LEGAL_FORMS:
+            if stripped.endswith(" " + legal_form):
+                stripped = stripped[: -len(legal_form) - 1]
+                break
+        else:
+            return stripped, normalized[len(stripped) + 1 :] or None
+
+
+def strip_legal_form(normalized):
+    """
+    Returns a normalized company name without its legal form, e.g. "mueller" for "mueller gmbh co kg".
+    """
+    return split_legal_form(normalized)[0]
+
+
+def abbreviate_legal_forms(normalized):
+    """
+    Replaces spelled out legal forms in a normalized name by their abbreviation.
+    """
+    return SPELLED_LEGAL_FORM.sub(lambda match: LEGAL_FORM_SPELLINGS[match.group(1)], normalized)
+
+
+def company_name_parts(name):
+    """
+    Returns the lookup form of a company name and its abbreviated legal form, see split_legal_form.
+    """
+    return split_legal_form(abbreviate_legal_forms(normalize_name(name)))
+
+
+def company_name_key(name):
+    """
+    Returns the lookup form of a company name: normalized and without its legal form.
+
+    "Müller Gesellschaft mit beschränkter Haftung & Co. KG" and "Müller GmbH & Co. KG"
+    both become "mueller".
+    """
+    return company_name_parts(name)[0]
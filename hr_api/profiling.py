@@ -0,0 +1,215 @@
+"""
+Opt-in profiling of single requests, including ingest runs triggered over HTTP.
+
+Profiling is only wired into the app when ADMIN_TOKEN is set. A request is then
+profiled when it carries `X-Admin-Token` and `X-Profile: cprofile` (deterministic,
+pstats output) or `X-Profile: sample` (stack sampling, folded stacks for flame
+graphs). The profile is stored in PROFILE_FOLDER and its id returned in the
+`X-Profile-Id` response header.
+"""
+import asyncio
+import contextvars
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from fastapi import Header, HTTPException
+from fastapi.routing import APIRoute
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+PROFILE_FOLDER = os.getenv("PROFILE_FOLDER", "profiles")
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+PROFILING_ENABLED = bool(ADMIN_TOKEN)
+
+PROFILE_MODES = ("cprofile", "sample")
+
+# File extensions of the stored profiles, the first one is served by /admin/profiles
+PROFILE_FILES = {
+    "cprofile": (".txt", ".prof"),
+    "sample": (".folded",),
+}
+
+_profile_request = contextvars.ContextVar("profile_request", default=None)
+
+
+def is_admin_token(token):
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def require_admin(x_admin_token: str = Header(None)):
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+class StackSampler:
+    """
+    Samples the stack of one thread at a fixed interval from a background thread.
+
+    The result is in the folded format (`frame;frame;frame count` per line) read by
+    flamegraph.pl, inferno and speedscope.
+    """
+
+    def __init__(self, thread_id, interval=PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _profile_path(profile_id, extension):
+    return os.path.join(PROFILE_FOLDER, f"{profile_id}{extension}")
+
+
+class Profile:
+    """
+    Runs a block of code under the deterministic or the sampling profiler and stores the result.
+    """
+
+    def __init__(self, mode, profile_id=None):
+        self.mode = mode
+        self.profile_id = profile_id or f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self._profiler = None
+
+    def __enter__(self):
+        if self.mode == "cprofile":
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._profiler = StackSampler(threading.get_ident())
+            self._profiler.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.mode == "cprofile":
+            self._profiler.disable()
+        else:
+            self._profiler.stop()
+        self.save()
+
+    def save(self):
+        os.makedirs(PROFILE_FOLDER, exist_ok=True)
+        if self.mode == "cprofile":
+            self._profiler.dump_stats(_profile_path(self.profile_id, ".prof"))
+            report = io.StringIO()
+            stats = pstats.Stats(self._profiler, stream=report)
+            stats.sort_stats("cumulative").print_stats(80)
+            stats.print_callees(30)
+            content = report.getvalue()
+        else:
+            content = self._profiler.folded()
+        with open(_profile_path(self.profile_id, PROFILE_FILES[self.mode][0]), "w", encoding="utf-8") as file:
+            file.write(content)
+
+
+def read_profile(profile_id):
+    """
+    Returns the stored report of a profile, or None when there is none.
+    """
+    if os.path.basename(profile_id) != profile_id:
+        return None
+    for extensions in PROFILE_FILES.values():
+        path = _profile_path(profile_id, extensions[0])
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                return file.read()
+    return None
+
+
+class ProfilingRoute(APIRoute):
+    """
+    Route class running the endpoint under a profiler when the request asked for it.
+
+    The endpoint itself is wrapped (rather than the whole ASGI call), so sync
+    endpoints are profiled in the worker thread they actually run in.
+    """
+
+    def get_route_handler(self):
+        call = self.dependant.call
+
+        if asyncio.iscoroutinefunction(call):
+
+            async def profiled_call(**kwargs):
+                profile = _profile_request.get()
+                if profile is None:
+                    return await call(**kwargs)
+                with profile:
+                    return await call(**kwargs)
+
+        else:
+
+            def profiled_call(**kwargs):
+                profile = _profile_request.get()
+                if profile is None:
+                    return call(**kwargs)
+                with profile:
+                    return call(**kwargs)
+
+        self.dependant.call = profiled_call
+        return super().get_route_handler()
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware marking requests with a valid X-Profile header for profiling.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        mode = headers.get(b"x-profile", b"").decode()
+        token = headers.get(b"x-admin-token", b"").decode()
+        if mode not in PROFILE_MODES or not is_admin_token(token):
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(mode)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile.profile_id.encode())
+                ]
+            await send(message)
+
+        context_token = _profile_request.set(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _profile_request.reset(context_token)
@@ -0,0 +1,217 @@
+"""
+Resolution of free-form register references to company numbers.
+
+Users know companies by references like "Amtsgericht Berlin (Charlottenburg) HRB 12345 B"
+or "HRB12345B", the API by company_number (`{court_sender_code}_{register_code}{number}{addition}`).
+Every ingest run fills `register_keys` with a normalized key per company, e.g.
+`HRB12345B`, and its court; a reference is parsed into the same key and the court
+named in it is looked up in the `gerichtscode` code table.
+"""
+import re
+from typing import NamedTuple, Optional
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+import hr_api.models as models
+from hr_api.database import reader_database
+from hr_api.names import normalize_name
+
+# XJustiz register codes by their upper case spelling
+REGISTER_CODES = {"HRA": "HRA", "HRB": "HRB", "GNR": "GnR", "GSR": "GsR", "PR": "PR", "VR": "VR"}
+# Words of one or two capitals that follow a register number but are no addition to it,
+# e.g. "HRB 12345 AG Köln" (Amtsgericht) or a legal form
+NON_ADDITIONS = ("AG", "EG", "EK", "EV", "KG", "SE", "UG")
+# The addition is upper case and a word of its own, "HRB 1234 in Köln" has none
+REFERENCE = re.compile(
+    r"\b(?P<register>HRA|HRB|GnR|GsR|PR|VR)\s*(?:Nr\.?\s*)?(?P<number>\d+)"
+    r"(?:\s*(?P<addition>(?!(?-i:" + "|".join(NON_ADDITIONS) + r")\b)(?-i:[A-Z]{1,2}))\b)?\b",
+    re.IGNORECASE,
+)
+COMPANY_NUMBER = re.compile(
+    r"^\s*(?P<court>[A-Z]\d{4}[A-Z]?)_(?P<register>HRA|HRB|GnR|GsR|PR|VR)(?P<number>\d+)(?P<addition>[A-Z]*)\s*$"
+)
+# Words around a court name in a reference, dropped from its start
+COURT_PREFIXES = {"amtsgericht", "ag", "registergericht", "handelsregister", "genossenschaftsregister",
+                  "partnerschaftsregister", "vereinsregister", "beim", "bei", "in", "des", "von"}
+# Keys looked up per query
+RESOLVE_CHUNK_SIZE = 500
+INSERT_BATCH_SIZE = 10000
+
+
+class RegisterReference(NamedTuple):
+    court: Optional[str]
+    register_code: str
+    register_number: str
+    register_number_addition: Optional[str]
+
+
+def register_key(register_code, register_number, register_number_addition=None):
+    """
+    Returns the normalized key of a register number, e.g. HRB12345B, or None.
+    """
+    if not register_code or not register_number or not register_number.isdigit():
+        return None
+    addition = (register_number_addition or "").strip().upper()
+    return f"{register_code.upper()}{int(register_number)}{addition}"
+
+
+def _court_name(text):
+    words = normalize_name(text).split()
+    while words and words[0] in COURT_PREFIXES:
+        words.pop(0)
+    return " ".join(words) or None
+
+
+def parse_reference(reference):
+    """
+    Parses a register reference like "Amtsgericht Köln HRB 1234" or a company number.
+
+    Args:
+        reference (str): The reference as written by a user.
+
+    Returns:
+        RegisterReference: The court as written (or its XJustiz code for a company
+            number) and the register number, or None when no register number is found.
+    """
+    match = COMPANY_NUMBER.match(reference)
+    if match:
+        return RegisterReference(
+            match.group("court"),
+            REGISTER_CODES[match.group("register").upper()],
+            match.group("number"),
+            match.group("addition") or None,
+        )
+
+    match = REFERENCE.search(reference)
+    if not match:
+        return None
+    court = _court_name(reference[: match.start()]) or _court_name(reference[match.end():])
+    return RegisterReference(
+        court,
+        REGISTER_CODES[match.group("register").upper()],
+        match.group("number"),
+        match.group("addition"),
+    )
+
+
+def refresh_register_keys(db: Session, generation: int):
+    """
+    Rebuilds the register key index from the companies table.
+
+    Args:
+        db (Session): A writer session.
+        generation (int): The ingest generation the index belongs to.
+    """
+    db.execute(delete(models.RegisterKeys))
+    rows = db.execute(
+        select(
+            models.Companies.court_sender_code,
+            models.Companies.register_code,
+            models.Companies.register_number,
+            models.Companies.register_number_addition,
+            models.Companies.company_number,
+        )
+    )
+    keys = []
+    for court_sender_code, register_code, register_number, register_number_addition, company_number in rows:
+        key = register_key(register_code, register_number, register_number_addition)
+        if key is not None:
+            keys.append(
+                {
+                    "key": key,
+                    "court_sender_code": court_sender_code,
+                    "company_number": company_number,
+                    "generation": generation,
+                }
+            )
+        if len(keys) >= INSERT_BATCH_SIZE:
+            db.execute(insert(models.RegisterKeys), keys)
+            keys = []
+    if keys:
+        db.execute(insert(models.RegisterKeys), keys)
+    db.commit()
+
+
+# Court codes by normalized court name, for the database and generation they were read from
+_courts = {"version": None, "codes": {}}
+
+
+def court_codes(db: Session):
+    """
+    Returns the XJustiz codes of the register courts by normalized name.
+
+    "Berlin (Charlottenburg)" is found as "berlin charlottenburg", "charlottenburg"
+    and "berlin", and every court by its code. Reloaded when the readers switch to
+    another database or an ingest run finishes.
+    """
+    generation = db.execute(
+        select(models.IngestRuns.generation)
+        .where(models.IngestRuns.status == "finished")
+        .order_by(models.IngestRuns.generation.desc())
+        .limit(1)
+    ).scalar()
+    version = (reader_database()["path"], generation)
+    if _courts["version"] == version:
+        return _courts["codes"]
+
+    codes = {}
+    for code, name in db.execute(select(models.Gerichtscode.XJustiz_Id, models.Gerichtscode.Registergericht)):
+        aliases = {normalize_name(code)}
+        if name:
+            aliases.add(normalize_name(name))
+            main, _, inner = name.partition("(")
+            aliases.update(normalize_name(part) for part in (main, inner) if part.strip(" )"))
+        for alias in aliases:
+            codes.setdefault(alias, set()).add(code)
+    _courts.update(version=version, codes=codes)
+    return codes
+
+
+def resolve_references(db: Session, references):
+    """
+    Resolves register references to company numbers.
+
+    Args:
+        db (Session): The database session.
+        references (list): The references as written by users.
+
+    Returns:
+        list: Per reference its status (resolved, ambiguous, not_found or unparsed), the
+            company number when resolved and the candidates when ambiguous.
+    """
+    courts = court_codes(db)
+    parsed = []
+    for reference in references:
+        parsed_reference = parse_reference(reference)
+        key = register_key(*parsed_reference[1:]) if parsed_reference else None
+        parsed.append((reference, parsed_reference, key))
+
+    candidates = {}
+    keys = list({key for _, _, key in parsed if key is not None})
+    for start in range(0, len(keys), RESOLVE_CHUNK_SIZE):
+        rows = db.execute(
+            select(models.RegisterKeys.key, models.RegisterKeys.court_sender_code, models.RegisterKeys.company_number)
+            .where(models.RegisterKeys.key.in_(keys[start : start + RESOLVE_CHUNK_SIZE]))
+        )
+        for key, court_sender_code, company_number in rows:
+            candidates.setdefault(key, []).append((court_sender_code, company_number))
+
+    results = []
+    for reference, parsed_reference, key in parsed:
+        result = {"reference": reference, "status": "unparsed", "company_number": None, "candidates": []}
+        if key is not None:
+            matches = candidates.get(key, [])
+            court = parsed_reference.court
+            # A court that is not in the code table does not narrow the matches down
+            if court and normalize_name(court) in courts:
+                allowed = courts[normalize_name(court)]
+                matches = [match for match in matches if match[0] in allowed]
+            if len(matches) == 1:
+                result.update(status="resolved", company_number=matches[0][1])
+            elif matches:
+                result.update(status="ambiguous", candidates=sorted(match[1] for match in matches))
+            else:
+                result["status"] = "not_found"
+        results.append(result)
+    return results
@@ -0,0 +1,300 @@
+"""
+Response compression and a cache of compressed responses for the read endpoints.
+
+ResponseCompressionMiddleware compresses responses with brotli or gzip, whichever
+the client prefers in Accept-Encoding (brotli needs the `fast` extra). Responses of
+the cached routes are additionally kept, already compressed, in a bounded LRU
+cache per encoding: a repeated request is answered from it without running the
+endpoint, its queries, the serialization or the compression.
+
+Cache entries are keyed by the data they were read from: the reader database and
+the generation of the latest finished ingest run, which is read again every
+RESPONSE_CACHE_POLL_INTERVAL seconds. Published snapshots never change, so their path
+alone identifies the data. Writes through the API, i.e. other than GET requests to a
+cached route, clear the cache.
+
+The cache lives per API worker process.
+"""
+import gzip
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select
+from starlette.concurrency import run_in_threadpool
+
+import hr_api.models as models
+from hr_api.admission import matching_route
+from hr_api.database import SessionLocal, reader_database
+from hr_api.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "true").lower() in ("1", "true", "yes")
+# Smaller bodies are sent as they are, compression would hardly save a packet
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv("RESPONSE_COMPRESSION_MIN_SIZE", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "5"))
+# Size of the compressed response cache per worker, 0 disables it
+RESPONSE_CACHE_MB = float(os.getenv("RESPONSE_CACHE_MB", "64"))
+# How long the data version is trusted before it is read again; a finished ingest
+# shows up in responses at most this much later
+RESPONSE_CACHE_POLL_INTERVAL = float(os.getenv("RESPONSE_CACHE_POLL_INTERVAL", "1"))
+# Largest share of the cache a single response may take
+MAX_ENTRY_SHARE = 8
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Encodings in order of preference when a client accepts several equally
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/x-ndjson")
+# Headers describing the request that produced a response, not kept for later requests
+REQUEST_HEADERS = (b"x-db-queries", b"x-db-time-ms", b"x-profile-id")
+
+RESPONSE_CACHE_REQUESTS = Counter(
+    "hr_api_response_cache_requests_total",
+    "Requests to cached routes by whether they were answered from the response cache.",
+    ("route", "result"),
+)
+RESPONSE_CACHE_BYTES = Gauge(
+    "hr_api_response_cache_bytes",
+    "Bytes of response bodies held by the response cache.",
+)
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    Picks the response encoding from an Accept-Encoding header.
+
+    Args:
+        accept_encoding (str): The header, e.g. "gzip, deflate, br;q=0.9".
+
+    Returns:
+        str: br, gzip or identity.
+    """
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, parameters = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        parameter = parameters.strip().lower()
+        if parameter.startswith("q="):
+            try:
+                weight = float(parameter[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding] = weight
+
+    best, best_weight = "identity", 0.0
+    for encoding in ENCODINGS:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0)
+    return body
+
+
+def data_version():
+    """
+    Returns what the responses are read from: the reader database and, unless it is an
+    immutable snapshot, the generation of its latest finished ingest run.
+    """
+    database = reader_database()
+    if database["immutable"]:
+        return (database["path"],)
+    with SessionLocal() as db:
+        generation = db.execute(
+            select(models.IngestRuns.generation)
+            .where(models.IngestRuns.status == "finished")
+            .order_by(models.IngestRuns.generation.desc())
+            .limit(1)
+        ).scalar()
+    return database["path"], generation
+
+
+class ResponseCache:
+    """
+    LRU cache of response bodies, bounded by their total size.
+
+    Only used from the event loop, so it needs no lock.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, status, headers, body):
+        if len(body) > self.capacity // MAX_ENTRY_SHARE:
+            return
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous[2])
+        self.entries[key] = (status, headers, body)
+        self.size += len(body)
+        while self.size > self.capacity:
+            _, (_, _, evicted) = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+        RESPONSE_CACHE_BYTES.set(self.size)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+        RESPONSE_CACHE_BYTES.set(0)
+
+
+def _header(headers, name):
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def encode_response(headers, body, encoding):
+    """
+    Returns the headers and body of a buffered response in an encoding.
+
+    Responses that are small, already encoded or not text are left as they are.
+    """
+    content_type = _header(headers, b"content-type") or ""
+    if (
+        encoding == "identity"
+        or len(body) < RESPONSE_COMPRESSION_MIN_SIZE
+        or _header(headers, b"content-encoding") is not None
+        or not content_type.startswith(COMPRESSIBLE_TYPES)
+    ):
+        encoded, encoding = body, None
+    else:
+        encoded = compress(body, encoding)
+    headers = [(key, value) for key, value in headers if key.lower() not in (b"content-length", b"vary")]
+    headers.append((b"content-length", str(len(encoded)).encode("latin-1")))
+    headers.append((b"vary", b"Accept-Encoding"))
+    if encoding is not None:
+        headers.append((b"content-encoding", encoding.encode("latin-1")))
+    return headers, encoded
+
+
+class ResponseCompressionMiddleware:
+    """
+    ASGI middleware compressing responses and caching those of some routes.
+
+    Streamed responses, e.g. exports and snapshot downloads, are passed on unchanged.
+
+    Args:
+        routes (tuple): The route templates whose GET responses are cached.
+        capacity_mb (float): The size of the cache, 0 disables it.
+    """
+
+    def __init__(self, app, routes=(), capacity_mb=RESPONSE_CACHE_MB):
+        self.app = app
+        self.routes = frozenset(routes)
+        # Static part of the templates, to pass other requests on without matching them
+        self.prefixes = tuple({route.split("{")[0] for route in self.routes})
+        self.cache = ResponseCache(int(capacity_mb * 1024 * 1024)) if capacity_mb > 0 else None
+        self.version = None
+        self.version_checked = 0.0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RESPONSE_COMPRESSION:
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = dict(scope["headers"])
+        encoding = negotiate_encoding(request_headers.get(b"accept-encoding", b"").decode("latin-1"))
+        route = template = None
+        if self.cache is not None and scope["path"].startswith(self.prefixes):
+            route = matching_route(scope)
+            template = route.path if route is not None else None
+        if template not in self.routes:
+            await self._compress(scope, receive, send, encoding)
+            return
+        if scope["method"] != "GET":
+            status = await self._compress(scope, receive, send, encoding)
+            if status is not None and status < 400:
+                self.cache.clear()
+            return
+        # Profiled requests have to run the endpoint, and their response is not for others
+        if b"x-profile" in request_headers:
+            RESPONSE_CACHE_REQUESTS.inc(route=template, result="bypass")
+            await self._compress(scope, receive, send, encoding)
+            return
+
+        key = (scope["path"], scope["query_string"], encoding, await self.data_version())
+        entry = self.cache.get(key)
+        if entry is not None:
+            RESPONSE_CACHE_REQUESTS.inc(route=template, result="hit")
+            # The router does not run, the metrics label the request with the route it sets
+            scope["route"] = route
+            status, headers, body = entry
+            await send({"type": "http.response.start", "status": status, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+            return
+        RESPONSE_CACHE_REQUESTS.inc(route=template, result="miss")
+        await self._compress(scope, receive, send, encoding, key)
+
+    async def data_version(self):
+        """
+        Returns the data version, read at most every RESPONSE_CACHE_POLL_INTERVAL
+        instead of with a query per request.
+        """
+        now = time.monotonic()
+        if self.version is None or now - self.version_checked >= RESPONSE_CACHE_POLL_INTERVAL:
+            self.version = await run_in_threadpool(data_version)
+            self.version_checked = now
+        return self.version
+
+    async def _compress(self, scope, receive, send, encoding, key=None):
+        """
+        Runs the app, compressing its response if it is sent in one piece, and caches
+        it under a key.
+
+        Returns:
+            int: The response status.
+        """
+        start = None
+        body = []
+        streaming = False
+
+        async def send_wrapper(message):
+            nonlocal start, streaming
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or streaming:
+                await send(message)
+                return
+            body.append(message.get("body", b""))
+            if message.get("more_body", False):
+                # The first chunk of a streamed response, send it as it comes
+                streaming = True
+                await send(start)
+                await send({"type": "http.response.body", "body": b"".join(body), "more_body": True})
+                return
+            headers, encoded = encode_response(start.get("headers", []), b"".join(body), encoding)
+            if key is not None and start["status"] == 200:
+                stored = [(name, value) for name, value in headers if name.lower() not in REQUEST_HEADERS]
+                self.cache.put(key, start["status"], stored, encoded)
+            await send({**start, "headers": headers})
+            await send({"type": "http.response.body", "body": encoded})
+
+        await self.app(scope, receive, send_wrapper)
+        return start["status"] if start is not None else None
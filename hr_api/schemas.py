@@ -0,0 +1,91 @@
+"""
+Request and ingest models of the register data.
+"""
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+
+class RegisterEntry(BaseModel):
+
+    column: Optional[str]
+    position: Optional[str]
+    running_number: Optional[str]
+    entry_type_code: Optional[str] = Field(
+        None,
+        description="https://www.xrepository.de/details/urn:xoev-de:xjustiz:codeliste:reg.eintragungsart",  # https://www.xrepository.de/api/xrepository/urn:xoev-de:xjustiz:codeliste:reg.eintragungsart_2.0/download/REG.Eintragungsart_2.0.json
+    )
+    text: Optional[str]
+    company_number: Optional[str]
+    file_path: str
+
+
+class ParticipantOrganization(BaseModel):
+
+    role_number: Optional[str]
+    role_name_code: Optional[str] = Field(
+        None,
+        description="https://www.xrepository.de/details/urn:xoev-de:xjustiz:codeliste:gds.rollenbezeichnung",  # https://www.xrepository.de/api/xrepository/urn:xoev-de:xjustiz:codeliste:gds.rollenbezeichnung_3.5/download/GDS.Rollenbezeichnung_3.5.json
+    )
+    name: Optional[str]
+    legal_form_code: Optional[str] = Field(
+        None,
+        description="https://www.xrepository.de/details/urn:xoev-de:xjustiz:codeliste:gds.rechtsform",  # https://www.xrepository.de/api/xrepository/urn:xoev-de:xjustiz:codeliste:gds.rechtsform_3.4/download/GDS.Rechtsform_3.4.json
+    )
+    city: Optional[str]
+    state_code: Optional[str]
+    company_number: Optional[str]
+    file_path: str
+
+
+class ParticipantPerson(BaseModel):
+
+    role_number: Optional[str]
+    role_name_code: Optional[str] = Field(
+        None,
+        description="https://www.xrepository.de/details/urn:xoev-de:xjustiz:codeliste:gds.rollenbezeichnung",  # https://www.xrepository.de/api/xrepository/urn:xoev-de:xjustiz:codeliste:gds.rollenbezeichnung_3.5/download/GDS.Rollenbezeichnung_3.5.json
+    )
+    first_name: Optional[str]
+    last_name: Optional[str]
+    birth_date: Optional[str]
+    gender_code: Optional[str] = Field(
+        None,
+        description="https://www.xrepository.de/details/urn:xoev-de:xjustiz:codeliste:gds.geschlecht",  # https://www.xrepository.de/api/xrepository/urn:xoev-de:xjustiz:codeliste:gds.geschlecht_2.1/download/GDS.Geschlecht_2.1.json
+    )
+    city: Optional[str]
+    state_code: Optional[str]
+    company_number: Optional[str]
+    file_path: str
+
+
+class Company(BaseModel):
+    court_sender_code: Optional[str] = Field(
+        None,
+        description="https://www.xrepository.de/details/urn:xoev-de:xunternehmen:codeliste:registergerichte",  # https://www.xrepository.de/api/xrepository/urn:xoev-de:xgewerbeanzeige:codeliste:registergerichte_11/download/Registergerichte_11.json
+    )
+    current_statute_date: Optional[str]
+    current_designation: Optional[str]
+    legal_form_code: Optional[str] = Field(
+        None,
+        description="https://www.xrepository.de/details/urn:xoev-de:xjustiz:codeliste:gds.rechtsform",  # https://www.xrepository.de/api/xrepository/urn:xoev-de:xjustiz:codeliste:gds.rechtsform_3.4/download/GDS.Rechtsform_3.4.json
+    )
+    location: Optional[str]
+    address_type_code: Optional[str] = Field(
+        None,
+        description="https://www.xrepository.de/details/urn:xoev-de:xjustiz:codeliste:gds.anschriftstyp",  # https://www.xrepository.de/api/xrepository/urn:xoev-de:xjustiz:codeliste:gds.anschriftstyp_3.0/download/GDS.Anschriftstyp_3.0.json
+    )
+    street: Optional[str]
+    house_number: Optional[str]
+    postal_code: Optional[str]
+    city: Optional[str]
+    state: Optional[str]
+    subject_matter: Optional[str]
+    register_code: Optional[str]
+    register_number: str
+    register_number_addition: Optional[str]
+    company_number: str
+    file_path: str
+    opencorporates: str = Field(
+        None,
+        description="The URL to the company's page on OpenCorporates",
+    )
@@ -0,0 +1,244 @@
+import json
+import logging
+import os
+from functools import lru_cache
+from operator import itemgetter
+from typing import Callable, NamedTuple
+
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import Column, func, select
+from sqlalchemy.sql.visitors import replacement_traverse
+
+logger = logging.getLogger(__name__)
+
+ORJSON_RESPONSES = os.getenv("ORJSON_RESPONSES", "false").lower() in ("1", "true", "yes")
+
+if ORJSON_RESPONSES:
+    try:
+        import orjson  # noqa: F401
+    except ImportError:
+        logger.warning("ORJSON_RESPONSES is set but orjson is not installed, using the default responses")
+        ORJSON_RESPONSES = False
+
+
+def code_field(name):
+    """
+    Marks a response field rendered as {"value": ..., "label": ...} from the
+    `{name}_value` and `{name}_label` columns of a row.
+    """
+    return (name, f"{name}_value", f"{name}_label")
+
+
+class ComputedField(NamedTuple):
+    name: str
+    column: str
+    function: Callable
+
+
+def computed_field(name, column, function):
+    """
+    Marks a response field computed from one column of a row, e.g. a URL built from a stored path.
+    """
+    return ComputedField(name, column, function)
+
+
+def field_name(field):
+    """
+    Returns the response name of a layout field.
+    """
+    if isinstance(field, ComputedField):
+        return field.name
+    if isinstance(field, tuple):
+        return field[0]
+    return field
+
+
+def field_columns(field):
+    """
+    Returns the result columns a layout field is rendered from.
+    """
+    if isinstance(field, ComputedField):
+        return (field.column,)
+    if isinstance(field, tuple):
+        return field[1:]
+    return (field,)
+
+
+def rows_source(model, rows):
+    """
+    Returns a subquery with the columns of a model's table over rows given as dicts,
+    to read them through a Projection like rows of the table.
+
+    The rows are passed as one JSON parameter and unpacked with json_each, so their
+    number is not limited by the number of SQL parameters.
+
+    Args:
+        model: The model whose table the rows stand in for.
+        rows (list): One dict per row, missing columns are NULL.
+
+    Returns:
+        Subquery: The rows, in the given order.
+    """
+    table = model.__table__
+    data = func.json_each(json.dumps(rows)).table_valued("value")
+    return (
+        select(*(func.json_extract(data.c.value, f'$."{name}"').label(name) for name in table.columns.keys()))
+        .select_from(data)
+        .subquery(f"{table.name}_rows")
+    )
+
+
+class Projection:
+    """
+    The columns and joins behind the response fields of a read endpoint.
+
+    Selects only what the requested fields are rendered from: a code table or the
+    source files are only joined when a requested field needs one of their columns.
+    The joins are outer joins, so the rows returned do not depend on the fields.
+
+    Args:
+        base: The model the endpoint reads.
+        layout (tuple): The response fields, see row_serializer.
+        columns (dict): The SQL expression of every result column by its label.
+        joins (dict): The join condition of every other model by the model.
+    """
+
+    def __init__(self, base, layout, columns, joins):
+        self.base = base
+        self.layout = layout
+        self.columns = columns
+        self.joins = joins
+        self.fields = tuple(field_name(field) for field in layout)
+
+    def select(self, fields=None, source=None):
+        """
+        Builds the select() of some response fields.
+
+        Args:
+            fields (str, optional): Comma separated response field names, all fields when None.
+            source (Subquery, optional): Read instead of the table of the base model, with
+                the same column names, e.g. from rows_source.
+
+        Returns:
+            tuple: The select() without a WHERE clause and the layout of the fields.
+
+        Raises:
+            ValueError: A field name is unknown.
+        """
+        layout = self.layout
+        if fields is not None:
+            requested = {name.strip() for name in fields.split(",") if name.strip()}
+            unknown = requested.difference(self.fields)
+            if unknown:
+                raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}; available: {', '.join(self.fields)}")
+            if not requested:
+                raise ValueError(f"No fields given; available: {', '.join(self.fields)}")
+            layout = tuple(field for field in self.layout if field_name(field) in requested)
+
+        labels = list(dict.fromkeys(label for field in layout for label in field_columns(field)))
+        expressions = [self.columns[label] for label in labels]
+        needed = {expression.class_ for expression in expressions}
+
+        def adapt(clause):
+            if source is None:
+                return clause
+            table = self.base.__table__
+            return replacement_traverse(
+                clause,
+                {},
+                lambda element: source.c[element.name]
+                if isinstance(element, Column) and element.table is table
+                else None,
+            )
+
+        stmt = select(*(adapt(expression.expression).label(label) for expression, label in zip(expressions, labels)))
+        stmt = stmt.select_from(self.base if source is None else source)
+        for model, onclause in self.joins.items():
+            if model in needed:
+                stmt = stmt.outerjoin(model, adapt(onclause))
+        return stmt, layout
+
+
+def _code_getter(value_position, label_position):
+    return lambda row: {"value": row[value_position], "label": row[label_position]}
+
+
+def _computed_getter(function, position):
+    return lambda row: function(row[position])
+
+
+@lru_cache(maxsize=128)
+def row_serializer(columns, layout):
+    """
+    Builds a function turning a result row into a response object.
+
+    The columns of all fields are read from the row tuple by position with a single
+    itemgetter, the few code and computed fields are filled in afterwards, so building
+    a response object costs one dict (plus one per code field) and no attribute
+    lookups on the Row.
+
+    Args:
+        columns (tuple): The column names of the result, in order.
+        layout (tuple): The response fields, a column name, a code_field() or a computed_field().
+
+    Returns:
+        function: A function taking a row tuple and returning a dict.
+    """
+    index = {name: position for position, name in enumerate(columns)}
+    names = []
+    positions = []
+    # Fields built from more than one column or by a function
+    getters = []
+    for field in layout:
+        if isinstance(field, ComputedField):
+            names.append(field.name)
+            positions.append(index[field.column])
+            getters.append((field.name, _computed_getter(field.function, index[field.column])))
+        elif isinstance(field, tuple):
+            name, value_column, label_column = field
+            names.append(name)
+            positions.append(index[value_column])
+            getters.append((name, _code_getter(index[value_column], index[label_column])))
+        else:
+            names.append(field)
+            positions.append(index[field])
+    names = tuple(names)
+    getters = tuple(getters)
+    # Two positions at least, itemgetter returns a tuple then
+    get_values = itemgetter(*positions, 0) if len(positions) == 1 else itemgetter(*positions)
+
+    def serialize_row(row):
+        # Filling in a field keeps its place in the dict
+        serialized = dict(zip(names, get_values(row)))
+        for name, getter in getters:
+            serialized[name] = getter(row)
+        return serialized
+
+    return serialize_row
+
+
+def serialize_result(result, layout):
+    """
+    Serializes a SQLAlchemy result into a list of response objects.
+
+    Args:
+        result (Result): The executed select().
+        layout (tuple): The response fields, a column name, a code_field() or a computed_field().
+
+    Returns:
+        list: One dict per row.
+    """
+    serialize_row = row_serializer(tuple(result.keys()), layout)
+    return [serialize_row(row) for row in result.tuples()]
+
+
+def list_response(content):
+    """
+    Returns the content as an orjson-rendered response when ORJSON_RESPONSES is on.
+
+    A Response returned from an endpoint bypasses jsonable_encoder and the stdlib
+    json module, which dominate the latency of large lists.
+    """
+    if ORJSON_RESPONSES:
+        return ORJSONResponse(content)
+    return content
@@ -0,0 +1,76 @@
+"""
+Source file references of the ingested rows.
+
+Rows point to a `source_files` row by id instead of storing the full download URL,
+and companies no longer store their OpenCorporates URL. Both URLs are built when a
+response is rendered, from FILESERVER_URL and OPENCORPORATES_URL.
+"""
+import os
+from functools import lru_cache
+from urllib.parse import quote, unquote
+
+from dotenv import load_dotenv
+
+import hr_api.models as models
+
+load_dotenv()
+
+FILESERVER_URL = os.getenv("FILESERVER_URL")
+OPENCORPORATES_URL = os.getenv("OPENCORPORATES_URL", "https://www.opencorporates.com/companies/de/")
+
+# Prefix removed from the downloaded file paths before they are stored
+DOWNLOAD_PREFIX = "/root/download/"
+
+
+def source_path(file_path):
+    """
+    Returns the path stored in source_files for a downloaded file.
+    """
+    return file_path.replace(DOWNLOAD_PREFIX, "")
+
+
+def source_path_from_url(url):
+    """
+    Returns the path stored in source_files for a file URL, e.g. from POST /companies/.
+
+    URLs outside FILESERVER_URL are stored as they are.
+    """
+    if url and FILESERVER_URL and url.startswith(FILESERVER_URL):
+        return unquote(url[len(FILESERVER_URL):])
+    return url
+
+
+@lru_cache(maxsize=65536)
+def file_url(path):
+    """
+    Builds the download URL of a stored source path.
+    """
+    if path is None:
+        return None
+    if "://" in path:
+        return path
+    return (FILESERVER_URL or "") + quote(path)
+
+
+def opencorporates_url(company_number):
+    if company_number is None:
+        return None
+    return f"{OPENCORPORATES_URL}{company_number}"
+
+
+def add_source_file(db, path, generation=None):
+    """
+    Adds a source file and returns its id.
+
+    Args:
+        db (Session): The database session.
+        path (str): The stored path, see source_path.
+        generation (int, optional): The ingest generation.
+
+    Returns:
+        int: The id of the source_files row.
+    """
+    source_file = models.SourceFiles(path=path, generation=generation)
+    db.add(source_file)
+    db.flush()
+    return source_file.id
@@ -1,30 +1,47 @@
-import re
-from typing import Optional
-from fastapi import FastAPI, Depends
-import sqlite3
-import requests
+import asyncio
 import logging
 import os
 import time
-from sqlalchemy import select
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy.sql import exists
-
-
-
-from pydantic import BaseModel, Field
-from hr_api.database import engine, SessionLocal
-import hr_api.models as models
-from sqlalchemy.orm import Session
-from sqlalchemy import Table, MetaData
-from contextlib import contextmanager
-from sqlalchemy.exc import IntegrityError
 import glob
-import os
+import json
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import Optional
+from fastapi import APIRouter, Body, FastAPI, Depends, HTTPException, Query
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from fastapi.routing import APIRoute
+import sqlite3
+from sqlalchemy import inspect, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
 from dotenv import load_dotenv
-import xmltodict
-from urllib.parse import quote
-from sqlalchemy import text
+from hr_api.database import (
+    engine,
+    writer_engine,
+    SessionLocal,
+    WriterSessionLocal,
+    database_stats,
+)
+import hr_api.models as models
+from hr_api.schemas import Company
+from hr_api.export import ExportDataset, ExportFormat, MEDIA_TYPES, export_stream
+import hr_api.columnar as columnar
+import hr_api.aggregates as aggregates
+import hr_api.changes as changes
+import hr_api.registers as registers
+import hr_api.autocomplete as autocomplete
+import hr_api.fuzzy as fuzzy
+import hr_api.history as history
+import hr_api.listing as listing
+from hr_api.serialization import Projection, code_field, computed_field, list_response, rows_source, serialize_result
+import hr_api.sources as sources
+import hr_api.compression as compression
+import hr_api.db_snapshots as db_snapshots
+from hr_api.metrics import CONTENT_TYPE, MetricsMiddleware, render_metrics
+import hr_api.profiling as profiling
+import hr_api.admission as admission
+from hr_api.instrumentation import QueryStatsMiddleware, instrument_engine
+from hr_api.response_cache import ResponseCompressionMiddleware
 
 logger = logging.getLogger(__name__)
 
@@ -32,12 +49,34 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 DOWNLOAD_FOLDER = os.getenv("DOWNLOAD_FOLDER")
-FILESERVER_URL = os.getenv("FILESERVER_URL")
-
-app = FastAPI()
-
-models.Base.metadata.create_all(bind=engine)
-
+CHANGES_PAGE_LIMIT = int(os.getenv("CHANGES_PAGE_LIMIT", "10000"))
+RESOLVE_BATCH_LIMIT = int(os.getenv("RESOLVE_BATCH_LIMIT", "10000"))
+AUTOCOMPLETE_LIMIT = 50
+MATCH_BATCH_LIMIT = int(os.getenv("MATCH_BATCH_LIMIT", "1000"))
+
+# Concurrent identical requests to these routes share one run, see hr_api.admission
+COALESCED_ROUTES = (
+    "/admin/refresh-db",
+    "/admin/refresh-metatables",
+    "/analytics/company-with-ownershiptable/count",
+    "/analytics/company/count",
+    "/analytics/ownership-tables/count",
+    "/analytics/register-numbers/count",
+)
+
+# GET responses of these routes are kept compressed per generation, see hr_api.response_cache
+CACHED_ROUTES = (
+    "/companies/",
+    "/companies/count",
+    "/companies/{company_number}",
+    "/register-entries/{company_number}",
+    "/participant-organizations/{company_number}",
+    "/participant-persons/{company_number}",
+    "/stats/companies/{facet}",
+    "/stats/participants/{participant_type}/roles",
+)
+
+router = APIRouter(route_class=profiling.ProfilingRoute if profiling.PROFILING_ENABLED else APIRoute)
 
 
 def get_db():
@@ -48,165 +87,287 @@ def get_db():
         db.close()
 
 
-@contextmanager
-def session_manager():
+def get_writer_db():
     try:
-        db = SessionLocal()
+        db = WriterSessionLocal()
         yield db
     finally:
         db.close()
 
 
+@router.get("/admin/refresh-metatables")
+def refresh_metatable():
+    from hr_api import ingest
 
+    try:
+        with ingest.ingest_lock():
+            ingest.refresh_code_tables()
+    except ingest.IngestRunning as exception:
+        raise HTTPException(status_code=409, detail=str(exception))
 
-@app.get("/admin/refresh-metatables")
-def refresh_metatable():
-    metadata = MetaData()
-
-    URLs = [
-        (
-            "geschlecht",
-            "https://www.xrepository.de/api/xrepository/urn:xoev-de:xjustiz:codeliste:gds.geschlecht_2.1/download/GDS.Geschlecht_2.1.json",
-        ),
-        (
-            "rechtsform",
-            "https://www.xrepository.de/api/xrepository/urn:xoev-de:xjustiz:codeliste:gds.rechtsform_3.4/download/GDS.Rechtsform_3.4.json",
-        ),
-        (
-            "gerichtscode",
-            "https://www.xrepository.de/api/xrepository/urn:xoev-de:xgewerbeanzeige:codeliste:registergerichte_11/download/Registergerichte_11.json",
-        ),
-        (
-            "rollenbezeichnung",
-            "https://www.xrepository.de/api/xrepository/urn:xoev-de:xjustiz:codeliste:gds.rollenbezeichnung_3.5/download/GDS.Rollenbezeichnung_3.5.json",
-        ),
-        (
-            "eintragungsart",
-            "https://www.xrepository.de/api/xrepository/urn:xoev-de:xjustiz:codeliste:reg.eintragungsart_2.0/download/REG.Eintragungsart_2.0.json",
-        ),
-        (
-            "anschriftstyp",
-            "https://www.xrepository.de/api/xrepository/urn:xoev-de:xjustiz:codeliste:gds.anschriftstyp_3.0/download/GDS.Anschriftstyp_3.0.json",
-        ),
-    ]
-
-    for entry in URLs:
-        
-        name = entry[0]
-        table = Table(name, metadata, autoload_with=engine)
-        with session_manager() as session:
-            if session.query(table).count() > 0:
-                logger.info(f"Data already exists in the table: {name}, skipping URL.")
-                continue
-        data = json_data["daten"]
-        columns = [column["spaltennameTechnisch"] for column in json_data["spalten"]]
-
-        # Convert each list in data to a dictionary using columns for keys
-        url = entry[1]
-        # Get the table object
-        response = requests.get(url, timeout=30)
-        if response.status_code == 200:
-            json_data = response.json()
-        else:
-            logger.error(f"Failed to retrieve JSON data from the URL: {url}")
-        # Insert data into the SQLite database
-        data_dicts = [dict(zip(columns, item)) for item in data]
-        for item in data_dicts:
-            # SQLAlchemy's insert function can take a dictionary directly
-            with session_manager() as session:
-                stmt = table.insert().values(**item)
-                try:
-                    session.execute(stmt)
-                    session.commit()
-                except IntegrityError:
-                    session.rollback()
-                    continue
-
-refresh_metatable()
-
-class RegisterEntry(BaseModel):
-
-    column: Optional[str]
-    position: Optional[str]
-    running_number: Optional[str]
-    entry_type_code: Optional[str] = Field(
-        None,
-        description="https://www.xrepository.de/details/urn:xoev-de:xjustiz:codeliste:reg.eintragungsart",  # https://www.xrepository.de/api/xrepository/urn:xoev-de:xjustiz:codeliste:reg.eintragungsart_2.0/download/REG.Eintragungsart_2.0.json
-    )
-    text: Optional[str]
-    company_number: Optional[str]
-    file_path: str
 
+@router.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    """
+    Returns the request and ingest metrics in the Prometheus text format.
+    """
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
 
-class ParticipantOrganization(BaseModel):
 
-    role_number: Optional[str]
-    role_name_code: Optional[str] = Field(
-        None,
-        description="https://www.xrepository.de/details/urn:xoev-de:xjustiz:codeliste:gds.rollenbezeichnung",  # https://www.xrepository.de/api/xrepository/urn:xoev-de:xjustiz:codeliste:gds.rollenbezeichnung_3.5/download/GDS.Rollenbezeichnung_3.5.json
-    )
-    name: Optional[str]
-    legal_form_code: Optional[str] = Field(
-        None,
-        description="https://www.xrepository.de/details/urn:xoev-de:xjustiz:codeliste:gds.rechtsform",  # https://www.xrepository.de/api/xrepository/urn:xoev-de:xjustiz:codeliste:gds.rechtsform_3.4/download/GDS.Rechtsform_3.4.json
-    )
-    city: Optional[str]
-    state_code: Optional[str]
-    company_number: Optional[str]
-    file_path: str
+@router.get("/admin/profiles/{profile_id}", dependencies=[Depends(profiling.require_admin)])
+def read_profile(profile_id: str):
+    """
+    Returns a stored request profile.
 
+    Profiles are recorded for requests sent with the `X-Profile: cprofile` or
+    `X-Profile: sample` header and a valid `X-Admin-Token`; the id is returned in the
+    `X-Profile-Id` response header. Sampled profiles are folded stacks, ready for
+    flamegraph.pl or speedscope.
 
-class ParticipantPerson(BaseModel):
+    Args:
+        profile_id (str): The id from the X-Profile-Id header.
 
-    role_number: Optional[str]
-    role_name_code: Optional[str] = Field(
-        None,
-        description="https://www.xrepository.de/details/urn:xoev-de:xjustiz:codeliste:gds.rollenbezeichnung",  # https://www.xrepository.de/api/xrepository/urn:xoev-de:xjustiz:codeliste:gds.rollenbezeichnung_3.5/download/GDS.Rollenbezeichnung_3.5.json
-    )
-    first_name: Optional[str]
-    last_name: Optional[str]
-    birth_date: Optional[str]
-    gender_code: Optional[str] = Field(
-        None,
-        description="https://www.xrepository.de/details/urn:xoev-de:xjustiz:codeliste:gds.geschlecht",  # https://www.xrepository.de/api/xrepository/urn:xoev-de:xjustiz:codeliste:gds.geschlecht_2.1/download/GDS.Geschlecht_2.1.json
-    )
-    city: Optional[str]
-    state_code: Optional[str]
-    company_number: Optional[str]
-    file_path: str
+    Returns:
+        PlainTextResponse: The pstats report or the folded stacks.
+    """
+    report = profiling.read_profile(profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(report)
 
 
-class Company(BaseModel):
-    court_sender_code: Optional[str] = Field(
-        None,
-        description="https://www.xrepository.de/details/urn:xoev-de:xunternehmen:codeliste:registergerichte",  # https://www.xrepository.de/api/xrepository/urn:xoev-de:xgewerbeanzeige:codeliste:registergerichte_11/download/Registergerichte_11.json
-    )
-    current_statute_date: Optional[str]
-    current_designation: Optional[str]
-    legal_form_code: Optional[str] = Field(
-        None,
-        description="https://www.xrepository.de/details/urn:xoev-de:xjustiz:codeliste:gds.rechtsform",  # https://www.xrepository.de/api/xrepository/urn:xoev-de:xjustiz:codeliste:gds.rechtsform_3.4/download/GDS.Rechtsform_3.4.json
-    )
-    location: Optional[str]
-    address_type_code: Optional[str] = Field(
-        None,
-        description="https://www.xrepository.de/details/urn:xoev-de:xjustiz:codeliste:gds.anschriftstyp",  # https://www.xrepository.de/api/xrepository/urn:xoev-de:xjustiz:codeliste:gds.anschriftstyp_3.0/download/GDS.Anschriftstyp_3.0.json
-    )
-    street: Optional[str]
-    house_number: Optional[str]
-    postal_code: Optional[str]
-    city: Optional[str]
-    state: Optional[str]
-    subject_matter: Optional[str]
-    register_code: Optional[str]
-    register_number: str
-    register_number_addition: Optional[str]
-    company_number: str
-    file_path: str
-    opencorporates: str = Field(
-        None,
-        description="The URL to the company's page on OpenCorporates",
+@router.get("/admin/db-stats")
+def read_db_stats():
+    """
+    Returns connection pool and SQLite pragma statistics.
+
+    Returns:
+        dict: The reader and writer pool usage and the active pragma values.
+    """
+    return database_stats()
+
+
+@router.get("/admin/db-snapshot")
+def read_db_snapshot():
+    """
+    Returns the database snapshot this worker serves and the published ones.
+    """
+    return db_snapshots.snapshot_status()
+
+
+@router.post("/admin/db-snapshot/reload")
+def reload_db_snapshot():
+    """
+    Switches this worker to the published snapshot now instead of at the next poll.
+    """
+    db_snapshots.switch_to_current()
+    return db_snapshots.snapshot_status()
+
+
+# Response fields of the read endpoints, see hr_api.serialization
+FILE_PATH_FIELD = computed_field("file_path", "file_path", sources.file_url)
+OPENCORPORATES_FIELD = computed_field("opencorporates", "company_number", sources.opencorporates_url)
+
+COMPANY_LIST_LAYOUT = tuple(
+    field
+    for column in models.Companies.__table__.columns
+    for field in (
+        (FILE_PATH_FIELD, OPENCORPORATES_FIELD) if column.name == "source_file_id" else (column.name,)
     )
+)
+
+COMPANY_LAYOUT = (
+    code_field("court_sender_code"),
+    "current_statute_date",
+    "current_designation",
+    code_field("legal_form_code"),
+    "location",
+    code_field("address_type_code"),
+    "street",
+    "house_number",
+    "postal_code",
+    "city",
+    "state",
+    "subject_matter",
+    "register_code",
+    "register_number",
+    "register_number_addition",
+    "company_number",
+    FILE_PATH_FIELD,
+    OPENCORPORATES_FIELD,
+)
+
+ENTRY_LAYOUT = (
+    "column",
+    "position",
+    "running_number",
+    code_field("entry_type_code"),
+    # Stored zstd-compressed, decompressed while rendering
+    computed_field("text", "text", compression.decompress_text),
+    code_field("company_number"),
+    FILE_PATH_FIELD,
+)
+
+PARTICIPANT_ORGANIZATION_LAYOUT = (
+    "role_number",
+    code_field("role_name_code"),
+    "name",
+    code_field("legal_form_code"),
+    "city",
+    "state_code",
+    code_field("company_number"),
+    FILE_PATH_FIELD,
+)
+
+PARTICIPANT_PERSON_LAYOUT = (
+    "role_number",
+    code_field("role_name_code"),
+    "first_name",
+    "last_name",
+    "birth_date",
+    code_field("gender_code"),
+    "city",
+    "state_code",
+    code_field("company_number"),
+    FILE_PATH_FIELD,
+)
+
+
+# Columns and joins behind the layouts, for the fields= parameter of the read endpoints
+COMPANY_COLUMNS = {
+    column.name: getattr(models.Companies, column.name)
+    for column in models.Companies.__table__.columns
+    if column.name != "source_file_id"
+}
+
+COMPANY_LIST_PROJECTION = Projection(
+    models.Companies,
+    COMPANY_LIST_LAYOUT,
+    {**COMPANY_COLUMNS, "file_path": models.SourceFiles.path},
+    {models.SourceFiles: models.Companies.source_file_id == models.SourceFiles.id},
+)
+
+COMPANY_PROJECTION = Projection(
+    models.Companies,
+    COMPANY_LAYOUT,
+    {
+        **COMPANY_COLUMNS,
+        "file_path": models.SourceFiles.path,
+        "court_sender_code_value": models.Companies.court_sender_code,
+        "court_sender_code_label": models.Gerichtscode.Registergericht,
+        "legal_form_code_value": models.Companies.legal_form_code,
+        "legal_form_code_label": models.Rechtsform.wert,
+        "address_type_code_value": models.Companies.address_type_code,
+        "address_type_code_label": models.Anschriftstyp.wert,
+    },
+    {
+        models.Gerichtscode: models.Companies.court_sender_code == models.Gerichtscode.XJustiz_Id,
+        models.Rechtsform: models.Companies.legal_form_code == models.Rechtsform.code,
+        models.Anschriftstyp: models.Companies.address_type_code == models.Anschriftstyp.code,
+        models.SourceFiles: models.Companies.source_file_id == models.SourceFiles.id,
+    },
+)
+
+ENTRY_PROJECTION = Projection(
+    models.Entries,
+    ENTRY_LAYOUT,
+    {
+        "column": models.Entries.column,
+        "position": models.Entries.position,
+        "running_number": models.Entries.running_number,
+        "text": models.Entries.text,
+        "file_path": models.SourceFiles.path,
+        "entry_type_code_value": models.Entries.entry_type_code,
+        "entry_type_code_label": models.Eintragungsart.Wert,
+        "company_number_value": models.Entries.company_number,
+        "company_number_label": models.Companies.current_designation,
+    },
+    {
+        models.Eintragungsart: models.Entries.entry_type_code == models.Eintragungsart.Schluessel,
+        models.Companies: models.Entries.company_number == models.Companies.company_number,
+        models.SourceFiles: models.Entries.source_file_id == models.SourceFiles.id,
+    },
+)
+
+PARTICIPANT_ORGANIZATION_PROJECTION = Projection(
+    models.ParticipantOrganizations,
+    PARTICIPANT_ORGANIZATION_LAYOUT,
+    {
+        "role_number": models.ParticipantOrganizations.role_number,
+        "name": models.ParticipantOrganizations.name,
+        "city": models.ParticipantOrganizations.city,
+        "state_code": models.ParticipantOrganizations.state_code,
+        "file_path": models.SourceFiles.path,
+        "role_name_code_value": models.ParticipantOrganizations.role_name_code,
+        "role_name_code_label": models.Rollenbezeichnung.wert,
+        "legal_form_code_value": models.ParticipantOrganizations.legal_form_code,
+        "legal_form_code_label": models.Rechtsform.wert,
+        "company_number_value": models.ParticipantOrganizations.company_number,
+        "company_number_label": models.Companies.current_designation,
+    },
+    {
+        models.Rollenbezeichnung: models.ParticipantOrganizations.role_name_code == models.Rollenbezeichnung.code,
+        models.Rechtsform: models.ParticipantOrganizations.legal_form_code == models.Rechtsform.code,
+        models.Companies: models.ParticipantOrganizations.company_number == models.Companies.company_number,
+        models.SourceFiles: models.ParticipantOrganizations.source_file_id == models.SourceFiles.id,
+    },
+)
+
+PARTICIPANT_PERSON_PROJECTION = Projection(
+    models.ParticipantPersons,
+    PARTICIPANT_PERSON_LAYOUT,
+    {
+        "role_number": models.ParticipantPersons.role_number,
+        "first_name": models.ParticipantPersons.first_name,
+        "last_name": models.ParticipantPersons.last_name,
+        "birth_date": models.ParticipantPersons.birth_date,
+        "city": models.ParticipantPersons.city,
+        "state_code": models.ParticipantPersons.state_code,
+        "file_path": models.SourceFiles.path,
+        "role_name_code_value": models.ParticipantPersons.role_name_code,
+        "role_name_code_label": models.Rollenbezeichnung.wert,
+        "gender_code_value": models.ParticipantPersons.gender_code,
+        "gender_code_label": models.Geschlecht.wert,
+        "company_number_value": models.ParticipantPersons.company_number,
+        "company_number_label": models.Companies.current_designation,
+    },
+    {
+        models.Rollenbezeichnung: models.ParticipantPersons.role_name_code == models.Rollenbezeichnung.code,
+        models.Geschlecht: models.ParticipantPersons.gender_code == models.Geschlecht.code,
+        models.Companies: models.ParticipantPersons.company_number == models.Companies.company_number,
+        models.SourceFiles: models.ParticipantPersons.source_file_id == models.SourceFiles.id,
+    },
+)
+
+
+def select_fields(projection, fields, source=None):
+    """
+    Returns the select() and layout of the requested fields of a read endpoint.
+
+    Raises:
+        HTTPException: 400 when a field is unknown.
+    """
+    try:
+        return projection.select(fields, source)
+    except ValueError as exception:
+        raise HTTPException(status_code=400, detail=str(exception))
+
+
+def read_as_of(projection, part, company_number, as_of, fields, db):
+    """
+    Renders the rows of a read endpoint as of the end of a day, rebuilt from the
+    company history, see hr_api.history.
+
+    Raises:
+        HTTPException: 404 when the company has no history.
+    """
+    rows = history.state_as_of(db, company_number, as_of, part)
+    if rows is None:
+        raise HTTPException(
+            status_code=404, detail=f"No history of {company_number}, it is ingested with INGEST_HISTORY=true"
+        )
+    stmt, layout = select_fields(projection, fields, rows_source(projection.base, rows))
+    return list_response(serialize_result(db.execute(stmt), layout))
 
 
 def create_connection():
@@ -214,101 +375,384 @@ def create_connection():
     return connection
 
 
-@app.get("/companies/count")
-def count_companies(db: Session = Depends(get_db)):
-    total = db.query(models.Companies).count()
+@router.get("/companies/count")
+def count_companies(
+    legal_form_code: Optional[str] = None,
+    court_sender_code: Optional[str] = None,
+    state: Optional[str] = None,
+    postal_region: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Counts the companies, optionally under a combination of facet values.
+
+    The count is read from the aggregate tables computed at the end of each ingest,
+    which POST /companies/ updates along with the company.
+
+    Args:
+        legal_form_code (str, optional): Only count companies with this legal form.
+        court_sender_code (str, optional): Only count companies registered at this court.
+        state (str, optional): Only count companies in this state.
+        postal_region (str, optional): Only count companies whose postal code starts with
+            these two digits.
+        db (Session, optional): The database session. Defaults to Depends(get_db).
+
+    Returns:
+        dict: The number of matching companies.
+    """
+    total = aggregates.count_companies(
+        db,
+        {
+            aggregates.CompanyFacet.legal_form_code: legal_form_code,
+            aggregates.CompanyFacet.court_sender_code: court_sender_code,
+            aggregates.CompanyFacet.state: state,
+            aggregates.CompanyFacet.postal_region: postal_region,
+        },
+    )
     return {"total": total}
 
 
-@app.get("/companies/")
+@router.get("/stats/companies/{facet}")
+def read_company_stats(
+    facet: aggregates.CompanyFacet,
+    legal_form_code: Optional[str] = None,
+    court_sender_code: Optional[str] = None,
+    state: Optional[str] = None,
+    postal_region: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Returns the distribution of companies over a facet.
+
+    Args:
+        facet (CompanyFacet): legal_form_code, court_sender_code, state or postal_region.
+        legal_form_code (str, optional): Only count companies with this legal form.
+        court_sender_code (str, optional): Only count companies registered at this court.
+        state (str, optional): Only count companies in this state.
+        postal_region (str, optional): Only count companies whose postal code starts with
+            these two digits.
+        db (Session, optional): The database session. Defaults to Depends(get_db).
+
+    Returns:
+        list: The facet values with their labels and number of companies.
+    """
+    return aggregates.company_distribution(
+        db,
+        facet,
+        {
+            aggregates.CompanyFacet.legal_form_code: legal_form_code,
+            aggregates.CompanyFacet.court_sender_code: court_sender_code,
+            aggregates.CompanyFacet.state: state,
+            aggregates.CompanyFacet.postal_region: postal_region,
+        },
+    )
+
+
+@router.get("/stats/participants/{participant_type}/roles")
+def read_participant_role_stats(
+    participant_type: aggregates.ParticipantType, db: Session = Depends(get_db)
+):
+    """
+    Returns the number of participant persons or organizations per role.
+
+    Args:
+        participant_type (ParticipantType): persons or organizations.
+        db (Session, optional): The database session. Defaults to Depends(get_db).
+
+    Returns:
+        list: The roles with their labels and number of participants.
+    """
+    return aggregates.participant_role_distribution(db, participant_type)
+
+
+@router.get("/companies/")
 def read_api(
-    skip: Optional[int] = 0, limit: Optional[int] = 100, db: Session = Depends(get_db)
+    skip: Optional[int] = 0,
+    limit: Optional[int] = 100,
+    legal_form_code: Optional[str] = None,
+    court_sender_code: Optional[str] = None,
+    city: Optional[str] = None,
+    postal_code: Optional[str] = Query(None, pattern=r"^\d{1,5}$"),
+    state: Optional[str] = None,
+    register_code: Optional[str] = None,
+    statute_date_from: Optional[date] = None,
+    statute_date_to: Optional[date] = None,
+    sort: listing.CompanySort = listing.CompanySort.company_number,
+    order: listing.SortOrder = listing.SortOrder.asc,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db),
 ):
-    return db.query(models.Companies).offset(skip).limit(limit).all()
-
-
-@app.get("/companies/{company_number}")
-def read_company(company_number: str, db: Session = Depends(get_db)):
-    result = db.execute(
-        select(
-            models.Companies.current_statute_date,
-            models.Companies.current_designation,
-            models.Companies.location,
-            models.Companies.street,
-            models.Companies.house_number,
-            models.Companies.postal_code,
-            models.Companies.city,
-            models.Companies.state,
-            models.Companies.subject_matter,
-            models.Companies.register_code,
-            models.Companies.register_number,
-            models.Companies.register_number_addition,
-            models.Companies.company_number,
-            models.Companies.file_path,
-            models.Companies.opencorporates,
-            models.Gerichtscode.XJustiz_Id.label("court_sender_code_value"),
-            models.Gerichtscode.Registergericht.label("court_sender_code_label"),
-            models.Rechtsform.code.label("legal_form_code_value"),
-            models.Rechtsform.wert.label("legal_form_code_label"),
-            models.Anschriftstyp.code.label("address_type_code_value"),
-            models.Anschriftstyp.wert.label("address_type_code_label"),
-        )
-        .join(
-            models.Gerichtscode,
-            models.Companies.court_sender_code == models.Gerichtscode.XJustiz_Id,
-        )
-        .join(
-            models.Rechtsform,
-            models.Companies.legal_form_code == models.Rechtsform.code,
-        )
-        .join(
-            models.Anschriftstyp,
-            models.Companies.address_type_code == models.Anschriftstyp.code,
-        )
-        .where(models.Companies.company_number == company_number)
-    ).fetchone()
+    """
+    Lists the companies matching all given filters.
+
+    Every combination of filters and sorts is answered from an index, see hr_api.listing.
+
+    Args:
+        skip (int, optional): The number of companies to skip. Defaults to 0.
+        limit (int, optional): The number of companies to return. Defaults to 100.
+        legal_form_code (str, optional): Only companies with this legal form.
+        court_sender_code (str, optional): Only companies registered at this court.
+        city (str, optional): Only companies in this city, as registered.
+        postal_code (str, optional): Only companies whose postal code starts with these digits.
+        state (str, optional): Only companies in this state.
+        register_code (str, optional): Only companies in this register, e.g. HRB.
+        statute_date_from (date, optional): Only companies whose current statute is from this day or later.
+        statute_date_to (date, optional): Only companies whose current statute is from this day or earlier.
+        sort (CompanySort, optional): The column to sort by, then by company number. Defaults to company_number.
+        order (SortOrder, optional): asc or desc. Defaults to asc.
+        fields (str, optional): Comma separated fields to return, e.g. company_number,current_designation.
+            Defaults to all fields.
+        db (Session, optional): The database session. Defaults to Depends(get_db).
+
+    Returns:
+        list: The companies.
+    """
+    filters = listing.CompanyFilters(
+        legal_form_code=legal_form_code,
+        court_sender_code=court_sender_code,
+        city=city,
+        postal_code=postal_code,
+        state=state,
+        register_code=register_code,
+        statute_date_from=statute_date_from,
+        statute_date_to=statute_date_to,
+    )
+    query, layout = select_fields(COMPANY_LIST_PROJECTION, fields)
+    result = db.execute(listing.listing_query(db, filters, sort, order, skip, limit, query))
+    return list_response(serialize_result(result, layout))
+
+
+@router.get("/companies/{company_number}")
+def read_company(
+    company_number: str,
+    fields: Optional[str] = None,
+    as_of: Optional[date] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Retrieves a company with its code labels.
+
+    Args:
+        company_number (str): The company number.
+        fields (str, optional): Comma separated fields to return, e.g. current_designation,city.
+            Code tables are only joined for requested code fields. Defaults to all fields.
+        as_of (date, optional): Return the company as of the end of this day, from the
+            register extract in effect then. Needs an ingest with INGEST_HISTORY.
+        db (Session, optional): The database session. Defaults to Depends(get_db).
+
+    Returns:
+        list: The company, or an empty list when it does not exist (as of that day).
+    """
+    if as_of is not None:
+        return read_as_of(COMPANY_PROJECTION, "company", company_number, as_of, fields, db)
+    stmt, layout = select_fields(COMPANY_PROJECTION, fields)
+    result = db.execute(stmt.where(models.Companies.company_number == company_number))
 
     # Transform the result into the desired format
-    return [
-        {
-            "court_sender_code": {
-                "value": result.court_sender_code_value,
-                "label": result.court_sender_code_label,
-            },
-            "current_statute_date": result.current_statute_date,
-            "current_designation": result.current_designation,
-            "legal_form_code": {
-                "value": result.legal_form_code_value,
-                "label": result.legal_form_code_label,
-            },
-            "location": result.location,
-            "address_type_code": {
-                "value": result.address_type_code_value,
-                "label": result.address_type_code_label,
-            },
-            "street": result.street,
-            "house_number": result.house_number,
-            "postal_code": result.postal_code,
-            "city": result.city,
-            "state": result.state,
-            "subject_matter": result.subject_matter,
-            "register_code": result.register_code,
-            "register_number": result.register_number,
-            "register_number_addition": result.register_number_addition,
-            "company_number": result.company_number,
-            "file_path": result.file_path,
-            "opencorporates": result.opencorporates,
-        }
-    ]
-
-
-@app.get("/register-entries/{company_number}")
-def read_entries(company_number: str, db: Session = Depends(get_db)):
+    return list_response(serialize_result(result, layout))
+
+
+@router.get("/autocomplete")
+def autocomplete_company_names(q: str, limit: int = 10, db: Session = Depends(get_db)):
+    """
+    Completes a company name as it is typed.
+
+    Umlauts and case are ignored, and so is the legal form: "mueller gmbh" finds
+    "Müller GmbH & Co. KG". Words inside a name match too, after the names starting with q.
+
+    Args:
+        q (str): The name typed so far.
+        limit (int): The number of completions, at most 50.
+        db (Session): The database session.
+
+    Returns:
+        list: The completions, best first, each with its company number, name and match
+            (exact, prefix or word).
+    """
+    return list_response(autocomplete.complete(db, q, max(1, min(limit, AUTOCOMPLETE_LIMIT))))
+
+
+@router.get("/match/companies")
+def match_company_name(name: str, limit: int = 5, min_score: float = 0.3, db: Session = Depends(get_db)):
+    """
+    Finds the companies with names similar to a name, despite typos, punctuation or
+    spelled out legal forms.
+
+    Args:
+        name (str): The company name to match.
+        limit (int): The number of candidates.
+        min_score (float): The lowest trigram similarity returned, between 0 and 1.
+        db (Session): The database session.
+
+    Returns:
+        dict: The name and its candidates, best first, each with company number, name and score.
+    """
+    return fuzzy.match_names(db, [name], limit=limit, min_score=min_score)[0]
+
+
+@router.post("/match/companies")
+def match_company_names(
+    names: list[str] = Body(...), limit: int = 5, min_score: float = 0.3, db: Session = Depends(get_db)
+):
+    """
+    Matches a batch of company names, e.g. for reconciling a CRM with the register.
+
+    Args:
+        names (list): The company names, at most MATCH_BATCH_LIMIT.
+        limit (int): The number of candidates per name.
+        min_score (float): The lowest trigram similarity returned, between 0 and 1.
+        db (Session): The database session.
+
+    Returns:
+        list: One result per name, in the order given.
+    """
+    if len(names) > MATCH_BATCH_LIMIT:
+        raise HTTPException(status_code=413, detail=f"At most {MATCH_BATCH_LIMIT} names per request")
+    return list_response(fuzzy.match_names(db, names, limit=limit, min_score=min_score))
+
+
+@router.get("/register-references/resolve")
+def resolve_register_reference(reference: str, db: Session = Depends(get_db)):
+    """
+    Resolves a register reference like "Amtsgericht Berlin (Charlottenburg) HRB 12345 B" to a company.
+
+    Args:
+        reference (str): The register reference, with or without the court.
+        db (Session): The database session.
+
+    Returns:
+        dict: The status (resolved, ambiguous, not_found or unparsed), the company number
+            when resolved and the candidates when ambiguous.
+    """
+    return registers.resolve_references(db, [reference])[0]
+
+
+@router.post("/register-references/resolve")
+def resolve_register_references(references: list[str] = Body(...), db: Session = Depends(get_db)):
+    """
+    Resolves a batch of register references to companies.
+
+    Args:
+        references (list): The register references, at most RESOLVE_BATCH_LIMIT.
+        db (Session): The database session.
+
+    Returns:
+        list: One result per reference, in the order given.
+    """
+    if len(references) > RESOLVE_BATCH_LIMIT:
+        raise HTTPException(status_code=413, detail=f"At most {RESOLVE_BATCH_LIMIT} references per request")
+    return list_response(registers.resolve_references(db, references))
+
+
+@router.get("/changes")
+def read_changes(since: int = 0, cursor: int = 0, limit: int = 1000, db: Session = Depends(get_db)):
+    """
+    Lists the companies inserted, updated or deleted by the ingests after a generation.
+
+    Start a sync with `since` set to the `generation` of the previous one and follow
+    `next_cursor` until it is null.
+
+    Args:
+        since (int): The generation the client last synced, 0 for all changes.
+        cursor (int): The next_cursor of the previous page.
+        limit (int): The number of events per page, at most CHANGES_PAGE_LIMIT.
+        db (Session): The database session.
+
+    Returns:
+        dict: The change events ordered by id, the next cursor and the latest finished generation.
+    """
+    limit = max(1, min(limit, CHANGES_PAGE_LIMIT))
+    return list_response(changes.read_changes(db, since=since, cursor=cursor, limit=limit))
+
+
+@router.get("/export/{dataset}")
+def export_dataset(
+    dataset: ExportDataset,
+    format: ExportFormat = ExportFormat.ndjson,
+    gzip: bool = False,
+    generation: Optional[int] = None,
+):
+    """
+    Streams a full dump of a dataset as NDJSON or CSV.
+
+    Args:
+        dataset (ExportDataset): companies, register-entries, participant-persons or
+            participant-organizations.
+        format (ExportFormat): The output format, ndjson or csv.
+        gzip (bool): Whether to gzip the stream.
+        generation (int, optional): Only export rows written by this ingest generation.
+
+    Returns:
+        StreamingResponse: The rows, read through a server-side cursor and encoded in batches.
+    """
+    filename = f"{dataset.value}.{format.value}"
+    media_type = MEDIA_TYPES[format]
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        export_stream(dataset, format, generation=generation, gzip=gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/snapshots/columnar")
+def read_columnar_snapshots():
+    """
+    Lists the Parquet/Arrow snapshots written by the ingest runs.
+
+    Returns:
+        list: One dictionary per generation with the available tables and formats.
+    """
+    return columnar.list_snapshots()
+
+
+@router.get("/snapshots/columnar/{generation}/{table}")
+def download_columnar_snapshot(
+    generation: int,
+    table: columnar.ColumnarTable,
+    format: columnar.ColumnarFormat = columnar.ColumnarFormat.parquet,
+):
+    """
+    Downloads the columnar snapshot of a table for an ingest generation.
+
+    Args:
+        generation (int): The ingest generation.
+        table (ColumnarTable): companies, entries, participant_persons or participant_organizations.
+        format (ColumnarFormat): parquet or arrow (IPC stream format).
+
+    Returns:
+        FileResponse: The snapshot file.
+    """
+    if not columnar.COLUMNAR_SNAPSHOT_FOLDER:
+        raise HTTPException(status_code=404, detail="Columnar snapshots are disabled")
+    path = columnar.snapshot_path(generation, table.value, format.value)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    return FileResponse(
+        path,
+        media_type=columnar.MEDIA_TYPES[format],
+        filename=f"{table.value}-{generation}.{columnar.FILE_EXTENSIONS[format.value]}",
+    )
+
+
+@router.get("/register-entries/{company_number}")
+def read_entries(
+    company_number: str,
+    fields: Optional[str] = None,
+    as_of: Optional[date] = None,
+    db: Session = Depends(get_db),
+):
     """
     Retrieves entries from the database for a given company number.
 
     Args:
         company_number (str): The company number for which to retrieve entries.
+        fields (str, optional): Comma separated fields to return, e.g. position,text.
+            Defaults to all fields.
+        as_of (date, optional): Return the entries as of the end of this day. Needs an
+            ingest with INGEST_HISTORY.
         db (Session, optional): The database session. Defaults to Depends(get_db).
 
     Returns:
@@ -326,57 +770,31 @@ def read_entries(company_number: str, db: Session = Depends(get_db)):
                 - label: The label of the company number.
             - file_path: The file path of the entry.
     """
-    result = db.execute(
-        select(
-            models.Entries.column,
-            models.Entries.position,
-            models.Entries.running_number,
-            models.Entries.text,
-            models.Entries.file_path,
-            models.Eintragungsart.Schluessel.label("entry_type_code_value"),
-            models.Eintragungsart.Wert.label("entry_type_code_label"),
-            models.Companies.company_number.label("company_number_value"),
-            models.Companies.current_designation.label("company_number_label"),
-        )
-        .join(
-            models.Eintragungsart,
-            models.Entries.entry_type_code == models.Eintragungsart.Schluessel,
-        )
-        .join(
-            models.Companies,
-            models.Entries.company_number == models.Companies.company_number,
-        )
-        .where(models.Entries.company_number == company_number)
-    ).fetchall()
+    if as_of is not None:
+        return read_as_of(ENTRY_PROJECTION, "entries", company_number, as_of, fields, db)
+    stmt, layout = select_fields(ENTRY_PROJECTION, fields)
+    result = db.execute(stmt.where(models.Entries.company_number == company_number))
 
     # Transform the result into the desired format
-    return [
-        {
-            "column": row.column,
-            "position": row.position,
-            "running_number": row.running_number,
-            "entry_type_code": {
-                "value": row.entry_type_code_value,
-                "label": row.entry_type_code_label,
-            },
-            "text": row.text,
-            "company_number": {
-                "value": row.company_number_value,
-                "label": row.company_number_label,
-            },
-            "file_path": row.file_path,
-        }
-        for row in result
-    ]
-
-
-@app.get("/participant-organizations/{company_number}")
-def read_participant_organizations(company_number: str, db: Session = Depends(get_db)):
+    return list_response(serialize_result(result, layout))
+
+
+@router.get("/participant-organizations/{company_number}")
+def read_participant_organizations(
+    company_number: str,
+    fields: Optional[str] = None,
+    as_of: Optional[date] = None,
+    db: Session = Depends(get_db),
+):
     """
     Retrieves participant organizations based on the provided company number.
 
     Args:
         company_number (str): The company number to filter participant organizations.
+        fields (str, optional): Comma separated fields to return, e.g. name,role_name_code.
+            Defaults to all fields.
+        as_of (date, optional): Return the participants as of the end of this day. Needs
+            an ingest with INGEST_HISTORY.
         db (Session, optional): The database session. Defaults to Depends(get_db).
 
     Returns:
@@ -400,135 +818,50 @@ def read_participant_organizations(company_number: str, db: Session = Depends(ge
                 - label (str): The label of the company number.
             - file_path (str): The file path of the participant organization.
     """
-    result = db.execute(
-        select(
-            models.ParticipantOrganizations.role_number,
-            models.ParticipantOrganizations.name,
-            models.ParticipantOrganizations.city,
-            models.ParticipantOrganizations.state_code,
-            models.ParticipantOrganizations.file_path,
-            models.Rollenbezeichnung.code.label("role_name_code_value"),
-            models.Rollenbezeichnung.wert.label("role_name_code_label"),
-            models.Rechtsform.code.label("legal_form_code_value"),
-            models.Rechtsform.wert.label("legal_form_code_label"),
-            models.Companies.company_number.label("company_number_value"),
-            models.Companies.current_designation.label("company_number_label"),
+    if as_of is not None:
+        return read_as_of(
+            PARTICIPANT_ORGANIZATION_PROJECTION, "participant_organizations", company_number, as_of, fields, db
         )
-        .join(
-            models.Rollenbezeichnung,
-            models.ParticipantOrganizations.role_name_code
-            == models.Rollenbezeichnung.code,
-        )
-        .join(
-            models.Rechtsform,
-            models.ParticipantOrganizations.legal_form_code == models.Rechtsform.code,
-        )
-        .join(
-            models.Companies,
-            models.ParticipantOrganizations.company_number
-            == models.Companies.company_number,
-        )
-        .where(models.ParticipantOrganizations.company_number == company_number)
-    ).fetchall()
+    stmt, layout = select_fields(PARTICIPANT_ORGANIZATION_PROJECTION, fields)
+    result = db.execute(stmt.where(models.ParticipantOrganizations.company_number == company_number))
 
     # Transform the result into the desired format
-    return [
-        {
-            "role_number": row.role_number,
-            "role_name_code": {
-                "value": row.role_name_code_value,
-                "label": row.role_name_code_label,
-            },
-            "name": row.name,
-            "legal_form_code": {
-                "value": row.legal_form_code_value,
-                "label": row.legal_form_code_label,
-            },
-            "city": row.city,
-            "state_code": row.state_code,
-            "company_number": {
-                "value": row.company_number_value,
-                "label": row.company_number_label,
-            },
-            "file_path": row.file_path,
-        }
-        for row in result
-    ]
-
-
-@app.get("/participant-persons/{company_number}")
-def read_participant_persons(company_number: str, db: Session = Depends(get_db)):
+    return list_response(serialize_result(result, layout))
+
+
+@router.get("/participant-persons/{company_number}")
+def read_participant_persons(
+    company_number: str,
+    fields: Optional[str] = None,
+    as_of: Optional[date] = None,
+    db: Session = Depends(get_db),
+):
     """
     Retrieves participant persons from the database based on the given company number.
 
     Args:
         company_number (str): The company number to filter the participant persons.
+        fields (str, optional): Comma separated fields to return, e.g. first_name,last_name.
+            Defaults to all fields.
+        as_of (date, optional): Return the participants as of the end of this day. Needs
+            an ingest with INGEST_HISTORY.
         db (Session, optional): The database session. Defaults to Depends(get_db).
 
     Returns:
         list: A list of participant persons in the desired format.
 
     """
-    result = db.execute(
-        select(
-            models.ParticipantPersons.role_number,
-            models.ParticipantPersons.first_name,
-            models.ParticipantPersons.last_name,
-            models.ParticipantPersons.birth_date,
-            models.ParticipantPersons.city,
-            models.ParticipantPersons.state_code,
-            models.ParticipantPersons.file_path,
-            models.Rollenbezeichnung.code.label("role_name_code_value"),
-            models.Rollenbezeichnung.wert.label("role_name_code_label"),
-            models.Geschlecht.code.label("gender_code_value"),
-            models.Geschlecht.wert.label("gender_code_label"),
-            models.Companies.company_number.label("company_number_value"),
-            models.Companies.current_designation.label("company_number_label"),
-        )
-        .join(
-            models.Rollenbezeichnung,
-            models.ParticipantPersons.role_name_code == models.Rollenbezeichnung.code,
-        )
-        .join(
-            models.Geschlecht,
-            models.ParticipantPersons.gender_code == models.Geschlecht.code,
-        )
-        .join(
-            models.Companies,
-            models.ParticipantPersons.company_number == models.Companies.company_number,
-        )
-        .where(models.ParticipantPersons.company_number == company_number)
-    ).fetchall()
+    if as_of is not None:
+        return read_as_of(PARTICIPANT_PERSON_PROJECTION, "participant_persons", company_number, as_of, fields, db)
+    stmt, layout = select_fields(PARTICIPANT_PERSON_PROJECTION, fields)
+    result = db.execute(stmt.where(models.ParticipantPersons.company_number == company_number))
 
     # Transform the result into the desired format
-    return [
-        {
-            "role_number": row.role_number,
-            "role_name_code": {
-                "value": row.role_name_code_value,
-                "label": row.role_name_code_label,
-            },
-            "first_name": row.first_name,
-            "last_name": row.last_name,
-            "birth_date": row.birth_date,
-            "gender_code": {
-                "value": row.gender_code_value,
-                "label": row.gender_code_label,
-            },
-            "city": row.city,
-            "state_code": row.state_code,
-            "company_number": {
-                "value": row.company_number_value,
-                "label": row.company_number_label,
-            },
-            "file_path": row.file_path,
-        }
-        for row in result
-    ]
-
-
-@app.post("/companies/")
-def create_company(company: Company, db: Session = Depends(get_db)):
+    return list_response(serialize_result(result, layout))
+
+
+@router.post("/companies/")
+def create_company(company: Company, db: Session = Depends(get_writer_db)):
     db_company = models.Companies(
         court_sender_code=company.court_sender_code,
         current_statute_date=company.current_statute_date,
@@ -546,232 +879,17 @@ def create_company(company: Company, db: Session = Depends(get_db)):
         register_number=company.register_number,
         register_number_addition=company.register_number_addition,
         company_number=company.company_number,
-        file_path=company.file_path,
-        opencorporates=company.opencorporates,
+        source_file_id=sources.add_source_file(db, sources.source_path_from_url(company.file_path)),
     )
     db.add(db_company)
+    aggregates.add_company(db, company)
     db.commit()
-    db.refresh(db_company)
-    return db_company
-
-
-def extract_company_info(data_dict, latest_file_path):
-    # Extract the required information
-    company = data_dict.get("tns:nachricht.reg.0400003", {})
-    nachrichtenkopf = company.get("tns:nachrichtenkopf", {})
-    auswahl_absender = nachrichtenkopf.get("tns:auswahl_absender", {})
-    absender_gericht = auswahl_absender.get("tns:absender.gericht", {})
-    court_sender_code = absender_gericht.get("code")
-
-    fachdatenRegister = company.get("tns:fachdatenRegister", {})
-    basisdatenRegister = fachdatenRegister.get("tns:basisdatenRegister", {})
-    satzungsdatum = basisdatenRegister.get("tns:satzungsdatum", {})
-    current_statute_date = satzungsdatum.get("tns:aktuellesSatzungsdatum")
-
-    rechtstraeger = basisdatenRegister.get("tns:rechtstraeger", {})
-    bezeichnung = rechtstraeger.get("tns:bezeichnung", {})
-    current_designation = bezeichnung.get("tns:bezeichnung.aktuell")
-
-    angabenZurRechtsform = rechtstraeger.get("tns:angabenZurRechtsform", {})
-    rechtsform = angabenZurRechtsform.get("tns:rechtsform", {}) if isinstance(angabenZurRechtsform, dict) else {}
-    legal_form_code = rechtsform.get("code") if isinstance(rechtsform, dict) else None
-
-    sitz = rechtstraeger.get("tns:sitz", {}) if rechtstraeger else {}
-    location = sitz.get("tns:ort")
-
-    anschrift = rechtstraeger.get("tns:anschrift", {})
-    if isinstance(anschrift, list):
-        anschrift = anschrift[0] if anschrift else {}
-    anschriftstyp = anschrift.get("tns:anschriftstyp", {})
-    address_type_code = anschriftstyp.get("code")
-
-    street = anschrift.get("tns:strasse")
-    house_number = anschrift.get("tns:hausnummer")
-    postal_code = anschrift.get("tns:postleitzahl")
-    city = anschrift.get("tns:ort")
-
-    staat = anschrift.get("tns:staat", {})
-    auswahl_staat = staat.get("tns:auswahl_staat", {})
-    staat = auswahl_staat.get("tns:staat", {})
-    state = staat.get("code")
-
-    subject_matter = basisdatenRegister.get("tns:gegenstand")
-
-    grunddaten = company.get("tns:grunddaten", {})
-    verfahrensdaten = grunddaten.get("tns:verfahrensdaten", {})
-    instanzdaten = verfahrensdaten.get("tns:instanzdaten", {})
-    aktenzeichen = instanzdaten.get("tns:aktenzeichen", {})
-    auswahl_aktenzeichen = aktenzeichen.get("tns:auswahl_aktenzeichen", {})
-    aktenzeichen_strukturiert = auswahl_aktenzeichen.get(
-        "tns:aktenzeichen.strukturiert", {}
-    )
-    register = aktenzeichen_strukturiert.get("tns:register", {})
-    register_code = register.get("code")
-    register_number = aktenzeichen_strukturiert.get("tns:laufendeNummer")
-    register_number_addition = aktenzeichen_strukturiert.get("tns:zusatz")
-
-    if not register_number:
-        register_number = aktenzeichen_strukturiert.get("tns:aktenzeichen.freitext")
-        if not register_number:
-            register_number = (
-                data_dict.get("tns:nachricht.reg.0400003", {})
-                .get("tns:nachrichtenkopf", {})
-                .get("tns:aktenzeichen.absender")
-            )
-        # Regex pattern
-        pattern = r"(HRB)\s+(\d+)\s+([A-Z]+)"
-        logger.info(register_number)
-        # Search for the pattern in the register_number
-        match = re.search(pattern, register_number)
-        if match:
-            register_code = match.group(1)
-            register_number = match.group(2)
-            register_number_addition = match.group(3)
-
-    if register_number_addition:
-        company_number = f"{court_sender_code}_{register_code}{register_number}{register_number_addition}"
-    else:
-        company_number = f"{court_sender_code}_{register_code}{register_number}"
-
-    # Merge all the information into a single dictionary
-    company = Company(
-        court_sender_code=court_sender_code,
-        current_statute_date=current_statute_date,
-        current_designation=current_designation,
-        legal_form_code=legal_form_code,
-        location=location,
-        address_type_code=address_type_code,
-        street=street,
-        house_number=house_number,
-        postal_code=postal_code,
-        city=city,
-        state=state,
-        subject_matter=subject_matter,
-        register_code=register_code,
-        register_number=register_number,
-        register_number_addition=register_number_addition,
-        company_number=company_number,
-        file_path=latest_file_path,
-        opencorporates=f"https://www.opencorporates.com/companies/de/{company_number}",
-    )
-
+    company.opencorporates = sources.opencorporates_url(company.company_number)
     return company
 
 
-def extract_parties(data_dict, company_number, latest_file_path):
-    # Extract the people and organizations under tns:beteiligung
-    company = data_dict.get("tns:nachricht.reg.0400003", {})
-    grunddaten = company.get("tns:grunddaten", {})
-    verfahrensdaten = grunddaten.get("tns:verfahrensdaten", {})
-    beteiligung = verfahrensdaten.get("tns:beteiligung", [])
-
-    parties = []
-    for participant in beteiligung:
-        roles = participant.get("tns:rolle", {})
-        # If roles is a list, take the first one
-        if isinstance(roles, list):
-            role = roles[0]
-        else:
-            role = roles
-        role_number = role.get("tns:rollennummer")
-        rollenbezeichnung = role.get("tns:rollenbezeichnung", {})
-        role_name_code = (
-            rollenbezeichnung.get("code") if rollenbezeichnung else None
-        )
-        beteiligter = participant.get("tns:beteiligter", {})
-        auswahl_beteiligter = beteiligter.get("tns:auswahl_beteiligter", {})
-        if "tns:natuerlichePerson" in auswahl_beteiligter:
-            person_info = auswahl_beteiligter.get("tns:natuerlichePerson", {})
-            vollerName = person_info.get("tns:vollerName", {})
-            first_name = vollerName.get("tns:vorname")
-            last_name = vollerName.get("tns:nachname")
-            geburt = person_info.get("tns:geburt", {})
-            birth_date = geburt.get("tns:geburtsdatum") if geburt else None
-            geschlecht = person_info.get("tns:geschlecht", {})
-            gender_code = geschlecht.get("code") if geschlecht else None
-            anschrift = person_info.get("tns:anschrift", {})
-            city = anschrift.get("tns:ort") 
-            staat = anschrift.get("tns:staat", {})
-            auswahl_staat = staat.get("tns:auswahl_staat", {})
-            staat = auswahl_staat.get("tns:staat", {})
-            state_code = staat.get("code") if staat else None
-
-            parties.append(
-                ParticipantPerson(
-                    role_number=role_number,
-                    role_name_code=role_name_code,
-                    first_name=first_name,
-                    last_name=last_name,
-                    birth_date=birth_date,
-                    gender_code=gender_code,
-                    city=city,
-                    state_code=state_code,
-                    company_number=company_number,
-                    file_path=latest_file_path,
-                )
-            )
-        elif "tns:organisation" in auswahl_beteiligter:
-            org_info = auswahl_beteiligter.get("tns:organisation", {})
-            bezeichnung = org_info.get("tns:bezeichnung", {}) if org_info else {}
-            name = bezeichnung.get("tns:bezeichnung.aktuell") if bezeichnung else None
-            angabenZurRechtsform = org_info.get("tns:angabenZurRechtsform", {})
-            rechtsform = angabenZurRechtsform.get("tns:rechtsform", {}) if angabenZurRechtsform else {}
-            legal_form_code = rechtsform.get("code") if rechtsform else None
-            sitz = org_info.get("tns:sitz", {}) if org_info else {}
-            city = sitz.get("tns:ort") if sitz else None
-            anschrift = org_info.get("tns:anschrift", {}) if org_info else {}
-            staat = anschrift.get("tns:staat", {}) if anschrift else {}
-            auswahl_staat = staat.get("tns:auswahl_staat", {}) if staat else {}
-            staat = auswahl_staat.get("tns:staat", {}) if auswahl_staat else {}
-            state_code = staat.get("code") if staat else None
-            parties.append(
-                ParticipantOrganization(
-                    role_number=role_number,
-                    role_name_code=role_name_code,
-                    name=name,
-                    legal_form_code=legal_form_code,
-                    city=city,
-                    state_code=state_code,
-                    company_number=company_number,
-                    file_path=latest_file_path,
-                )
-            )
-
-    return parties
-
-
-def extract_entries(data_dict, company_number, latest_file_path):
-    # Extract the tns:eintragungstext
-    company = data_dict.get("tns:nachricht.reg.0400003", {})
-    fachdatenRegister = company.get("tns:fachdatenRegister", {})
-    auszug = fachdatenRegister.get("tns:auszug", {})
-    eintragungstext = auszug.get("tns:eintragungstext", [])
-
-    entries = []
-    for entry in eintragungstext:
-        if isinstance(entry, dict):
-            column = entry.get("tns:spalte")
-            position = entry.get("tns:position")
-            running_number = entry.get("tns:laufendeNummer")
-            eintragungsart = entry.get("tns:eintragungsart", {})
-            entry_type_code = eintragungsart.get("code")
-            text = entry.get("tns:text")
-            entries.append(
-                RegisterEntry(
-                    column=column,
-                    position=position,
-                    running_number=running_number,
-                    entry_type_code=entry_type_code,
-                    text=text,
-                    company_number=company_number,
-                    file_path=latest_file_path,
-                )
-            )
-    return entries
-
-
-@app.get("/admin/refresh-db")
-def refresh_db(db: Session = Depends(get_db)):
+@router.get("/admin/refresh-db")
+def refresh_db(db: Session = Depends(get_writer_db)):
     """
     Refreshes the database by deleting existing data and adding new data from XML files.
 
@@ -780,88 +898,63 @@ def refresh_db(db: Session = Depends(get_db)):
 
     Returns:
         dict: A dictionary containing a message indicating the number of companies added to the database.
+
+    Raises:
+        HTTPException: 409 while another worker or ingest process writes to the database.
     """
-    db.execute(text("DELETE FROM companies"))
-    db.execute(text("DELETE FROM entries"))
-    db.execute(text("DELETE FROM participant_organizations"))
-    db.execute(text("DELETE FROM participant_persons"))
+    # Imported here, the API workers only load the parser when an ingest is triggered
+    from hr_api import ingest
 
-    company_dirs = glob.glob(f"{DOWNLOAD_FOLDER}/*/*/")
-    for company_dir in company_dirs:
-        # Get a list of all matching file paths for the current company
-        xml_files = glob.glob(f"{company_dir}si/*.xml")
-        xhtml_files = glob.glob(f"{company_dir}si/*.xhtml")
-        file_paths = xml_files + xhtml_files
-
-        if not file_paths:
-            continue
-
-        # Sort the file paths by date and time in descending order
-        file_paths.sort(
-            key=lambda f: re.search(r"\d{4}-\d{2}-\d{2}T\d{2}-\d{2}-\d{2}", f).group(0),
-            reverse=True,
-        )
+    try:
+        with ingest.ingest_lock():
+            ingest.init_schema()
+            return ingest.run_ingest(db)
+    except ingest.IngestRunning as exception:
+        raise HTTPException(status_code=409, detail=str(exception))
 
-        # Pick the latest file
-        latest_file_path = file_paths[0]
 
-        with open(latest_file_path, "r", encoding="utf-8") as file:
-            xml_data = file.read()
+@router.get("/admin/ingest-runs")
+def read_ingest_runs(limit: int = 20, db: Session = Depends(get_db)):
+    """
+    Lists the most recent ingest runs with their file counts and stage timings.
 
-        # Parse the XML data
-        data_dict = xmltodict.parse(xml_data)
+    Args:
+        limit (int): The number of runs to return, newest first.
+        db (Session): The database session.
 
-        url_path = (
-            FILESERVER_URL
-            + quote(latest_file_path.replace("/root/download/", ""))
+    Returns:
+        list: One dictionary per run.
+    """
+    runs = db.execute(
+        select(models.IngestRuns).order_by(models.IngestRuns.id.desc()).limit(limit)
+    ).scalars()
+
+    result = []
+    for run in runs:
+        duration = run.duration_seconds
+        result.append(
+            {
+                "id": run.id,
+                "generation": run.generation,
+                "status": run.status,
+                "started_at": run.started_at,
+                "finished_at": run.finished_at,
+                "duration_seconds": duration,
+                "files_seen": run.files_seen,
+                "files_parsed": run.files_parsed,
+                "files_skipped": run.files_skipped,
+                "files_failed": run.files_failed,
+                "companies_inserted": run.companies_inserted,
+                "participants_inserted": run.participants_inserted,
+                "entries_inserted": run.entries_inserted,
+                "files_per_second": round(run.files_seen / duration, 1) if duration and run.files_seen else None,
+                "stage_seconds": json.loads(run.stage_seconds) if run.stage_seconds else {},
+            }
         )
-        try:
-            if "tns:nachricht.reg.0400003" in data_dict:
-                company = extract_company_info(data_dict, url_path)
-                parties = extract_parties(data_dict, company.company_number, url_path)
-                entries = extract_entries(data_dict, company.company_number, url_path)
-            else:
-                print(f"File {latest_file_path} does not contain the required data")
-        except TypeError:
-            logger.error(f"TypeError adding data to the database for {latest_file_path}")
-            continue
-
-        if company.current_designation is None:
-            for party in parties:
-                if isinstance(party, ParticipantOrganization):
-                    if party.role_name_code == "287":  # ["287","Rechtsträger(in)",""]
-                        company.current_designation = party.name
-                        break
-        
-        try:
-            db.add(models.Companies(**company.model_dump()))
-
-            for party in parties:
-                party_values = party.model_dump()
-                if isinstance(party, models.ParticipantPersons):
-                    db.add(models.ParticipantPersons(**party_values))
-                elif isinstance(party, models.ParticipantOrganizations):
-                    db.add(models.ParticipantOrganizations(**party_values))
-
-            for entry_item in entries:
-                entry_values = entry_item.model_dump()
-                db.add(models.Entries(**entry_values))
-
-            db.commit()
-        except IntegrityError:
-            db.rollback()
-            logger.error(f"IntegrityError adding data to the database for {latest_file_path}")
-            continue
+    return result
 
 
-        db.close()
-
-    
-
-    return {"message": f"Added {len(company_dirs)} companies to the database.."}
-
-
-@app.get("/analytics/company-with-ownershiptable/count")
+@router.get("/analytics/company-with-ownershiptable/count")
 def count_company_with_ownership_table():
     """
     Counts the number of companies that have ownership tables.
@@ -881,7 +974,7 @@ def count_company_with_ownership_table():
     return {"companies": count}
 
 
-@app.get("/analytics/company/count")
+@router.get("/analytics/company/count")
 def count_companies():
     """
     Counts the number of companies that have ownership tables.
@@ -892,7 +985,7 @@ def count_companies():
     return {"companies": len(glob.glob(f"{DOWNLOAD_FOLDER}/*/*/"))}
 
 
-@app.get("/analytics/ownership-tables/count")
+@router.get("/analytics/ownership-tables/count")
 def count_ownership_tables():
     """
     Counts the number of ownership tables for each company.
@@ -916,7 +1009,7 @@ def count_ownership_tables():
 
 
 
-@app.get("/analytics/register-numbers/count")
+@router.get("/analytics/register-numbers/count")
 def count_registernumbers():
     """
     Counts the number of register numbers in the specified download folder.
@@ -925,3 +1018,58 @@ def count_registernumbers():
         A dictionary containing the count of register numbers.
     """
     return {"register-numbers": len(glob.glob(f"{DOWNLOAD_FOLDER}/*/"))}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    watcher = None
+    if db_snapshots.DB_SNAPSHOT_FOLDER:
+        if db_snapshots.switch_to_current() is None:
+            logger.warning("No database snapshot published yet, serving DB_LOCATION")
+        if db_snapshots.DB_SNAPSHOT_POLL_INTERVAL > 0:
+            watcher = asyncio.create_task(db_snapshots.watch_pointer())
+
+    # Schema work belongs to the ingest (python -m hr_api.ingest), the API only checks for it
+    try:
+        initialized = inspect(engine).has_table(models.Companies.__tablename__)
+    except OperationalError:
+        initialized = False
+    if not initialized:
+        logger.warning("The database is not initialized yet, run python -m hr_api.ingest")
+    else:
+        autocomplete.refresh_in_background()
+    yield
+    if watcher is not None:
+        watcher.cancel()
+    engine.dispose()
+    writer_engine.dispose()
+
+
+def create_app():
+    """
+    Creates the API application.
+
+    Starting it neither creates tables nor loads code lists or the XML parser, see
+    hr_api.ingest for that.
+
+    Returns:
+        FastAPI: The application.
+    """
+    app = FastAPI(lifespan=lifespan)
+    if profiling.PROFILING_ENABLED:
+        app.add_middleware(profiling.ProfilingMiddleware)
+    # Requests coalesced or queued by the admission middlewares are measured, not profiled
+    app.add_middleware(admission.ConcurrencyLimitMiddleware)
+    app.add_middleware(admission.SingleFlightMiddleware, routes=COALESCED_ROUTES)
+    app.add_middleware(ResponseCompressionMiddleware, routes=CACHED_ROUTES)
+    # Outside the cache, so cache hits report the queries they did not run
+    app.add_middleware(QueryStatsMiddleware)
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(router)
+
+    instrument_engine(engine, "reader")
+    instrument_engine(writer_engine, "writer")
+    return app
+
+
+app = create_app()
@@ -0,0 +1,17 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import hr_api.models as models
+
+
+@pytest.fixture
+def db(tmp_path):
+    """
+    A session on an empty database with all tables.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
@@ -0,0 +1,51 @@
+import hr_api.aggregates as aggregates
+import hr_api.models as models
+from hr_api.schemas import Company
+
+FACETS = {
+    aggregates.CompanyFacet.legal_form_code: "GMBH",
+    aggregates.CompanyFacet.court_sender_code: None,
+    aggregates.CompanyFacet.state: None,
+    aggregates.CompanyFacet.postal_region: "10",
+}
+
+
+def company(company_number, postal_code="10115", legal_form_code="GMBH"):
+    values = {name: None for name in Company.model_fields if name != "opencorporates"}
+    values.update(
+        company_number=company_number,
+        register_number=company_number.rsplit("HRB", 1)[1],
+        legal_form_code=legal_form_code,
+        postal_code=postal_code,
+        file_path="unused.xml",
+    )
+    return Company(**values)
+
+
+def add_companies(db, *companies):
+    for item in companies:
+        db.add(models.Companies(**item.model_dump(exclude={"file_path", "opencorporates"})))
+        aggregates.add_company(db, item)
+    db.commit()
+
+
+def test_count_before_the_first_ingest_counts_the_companies_table(db):
+    add_companies(db, company("F1103R_HRB1"), company("F1103R_HRB2", postal_code="80331"))
+
+    assert aggregates.count_companies(db, FACETS) == 1
+    assert db.query(models.CompanyFacets).count() == 0
+
+
+def test_added_companies_are_counted_until_the_next_ingest(db):
+    add_companies(db, company("F1103R_HRB1"))
+    aggregates.refresh_aggregates(db, 1)
+
+    add_companies(db, company("F1103R_HRB2"), company("F1103R_HRB3", postal_code=None, legal_form_code="AG"))
+
+    assert aggregates.count_companies(db, FACETS) == 2
+    assert aggregates.count_companies(db, {aggregates.CompanyFacet.legal_form_code: "AG"}) == 1
+    assert aggregates.count_companies(db, {}) == 3
+    counted = aggregates.count_companies(db, {})
+    aggregates.refresh_aggregates(db, 2)
+    assert aggregates.count_companies(db, {}) == counted
+    assert db.query(models.CompanyFacets).count() == 2
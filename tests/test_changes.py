@@ -0,0 +1,116 @@
+import struct
+
+import pytest
+
+import hr_api.changes as changes
+import hr_api.models as models
+from hr_api.schemas import Company, RegisterEntry
+
+
+def company(company_number="R3101_HRB1", **fields):
+    values = {name: None for name in changes.COMPANY_FIELDS}
+    values.update(
+        register_code="HRB",
+        register_number=company_number.rsplit("HRB", 1)[1],
+        company_number=company_number,
+        current_designation="Muster GmbH",
+        file_path="1/Muster GmbH/si/2023-03-11T13-59-19.xml",
+    )
+    values.update(fields)
+    return Company(**values)
+
+
+def entry(running_number, text, file_path="1/Muster GmbH/si/2023-03-11T13-59-19.xml"):
+    return RegisterEntry(
+        column="6",
+        position="a",
+        running_number=running_number,
+        entry_type_code="2",
+        text=text,
+        company_number="R3101_HRB1",
+        file_path=file_path,
+    )
+
+
+@pytest.fixture
+def ingest(db):
+    """
+    Records companies as an ingest generation does and returns their change types.
+    """
+
+    def record(generation, *companies):
+        db.merge(models.Generations(generation=generation))
+        change_types = [changes.record_company(db, item, [], entries, generation) for item, entries in companies]
+        db.commit()
+        return change_types
+
+    return record
+
+
+def test_new_company_is_inserted(db, ingest):
+    assert ingest(1, (company(), [])) == ["inserted"]
+
+    (event,) = changes.read_changes(db)["changes"]
+    assert event["change_type"] == "inserted"
+    assert event["changed_fields"] is None
+
+
+def test_unchanged_company_gets_no_event(db, ingest):
+    ingest(1, (company(), [entry("1", "a"), entry("2", "b")]))
+
+    assert ingest(2, (company(), [entry("2", "b"), entry("1", "a")])) == [None]
+    assert len(changes.read_changes(db)["changes"]) == 1
+
+
+def test_new_extract_file_with_the_same_content_gets_no_event(ingest):
+    newer_file = "1/Muster GmbH/si/2024-01-02T08-00-00.xml.gz"
+    ingest(1, (company(), [entry("1", "a")]))
+
+    assert ingest(2, (company(file_path=newer_file), [entry("1", "a", newer_file)])) == [None]
+
+
+def test_changed_fields_are_reported(db, ingest):
+    ingest(1, (company(), [entry("1", "a")]))
+
+    assert ingest(2, (company(city="Köln"), [entry("1", "a"), entry("2", "b")])) == ["updated"]
+    event = changes.read_changes(db, since=1)["changes"][0]
+    assert event["generation"] == 2
+    assert event["changed_fields"] == ["city", "entries"]
+
+
+def test_fingerprint_of_another_version_is_replaced_without_event(db, ingest):
+    current = changes.fingerprint(company(), [], [])
+    legacy = struct.pack(f"<{len(changes.FINGERPRINT_FIELDS) + 1}I", *range(len(changes.FINGERPRINT_FIELDS) + 1))
+    db.add(models.CompanyFingerprints(company_number="R3101_HRB1", generation=1, fingerprint=legacy))
+    db.commit()
+
+    assert ingest(2, (company(), [])) == [None]
+    assert db.get(models.CompanyFingerprints, "R3101_HRB1").fingerprint == current
+    assert changes.changed_fields(bytes([changes.FINGERPRINT_VERSION + 1]) + current[1:], current) is None
+    assert changes.read_changes(db)["changes"] == []
+
+
+def test_companies_not_seen_again_are_deleted(db, ingest):
+    ingest(1, (company("R3101_HRB1"), []), (company("R3101_HRB2"), []))
+    ingest(2, (company("R3101_HRB1"), []))
+
+    assert changes.record_deletions(db, 2) == 1
+    events = changes.read_changes(db, since=1)["changes"]
+    assert [(event["company_number"], event["change_type"]) for event in events] == [("R3101_HRB2", "deleted")]
+    assert db.get(models.CompanyFingerprints, "R3101_HRB2") is None
+
+
+def test_read_changes_pages(db, ingest):
+    ingest(1, *((company(f"R3101_HRB{number}"), []) for number in range(1, 6)))
+    db.add(models.IngestRuns(generation=1, status="finished"))
+    db.commit()
+
+    first = changes.read_changes(db, limit=2)
+    second = changes.read_changes(db, cursor=first["next_cursor"], limit=2)
+    last = changes.read_changes(db, cursor=second["next_cursor"], limit=2)
+
+    numbers = [event["company_number"] for page in (first, second, last) for event in page["changes"]]
+    assert numbers == [f"R3101_HRB{number}" for number in range(1, 6)]
+    assert last["next_cursor"] is None
+    assert first["generation"] == 1
+    assert changes.read_changes(db, since=1)["changes"] == []
@@ -0,0 +1,46 @@
+import os
+import time
+
+import pytest
+
+import hr_api.db_snapshots as db_snapshots
+
+
+@pytest.fixture
+def snapshots(tmp_path, monkeypatch):
+    """
+    Creates snapshots of generations 1 to 5, written 5000, 4000, 3000, 30 and 0 seconds ago.
+    """
+    monkeypatch.setattr(db_snapshots, "DB_SNAPSHOT_FOLDER", str(tmp_path))
+    monkeypatch.setattr(db_snapshots, "DB_SNAPSHOT_GRACE_PERIOD", 60)
+    now = time.time()
+    for generation, age in ((1, 5000), (2, 4000), (3, 3000), (4, 30)):
+        path = db_snapshots.snapshot_path(generation)
+        open(path, "w").close()
+        os.utime(path, (now - age, now - age))
+    open(db_snapshots.snapshot_path(5), "w").close()
+    return monkeypatch
+
+
+def test_prune_keeps_snapshots_within_the_grace_period(snapshots):
+    snapshots.setattr(db_snapshots, "DB_SNAPSHOT_KEEP", 1)
+
+    db_snapshots.prune_snapshots(5)
+
+    assert db_snapshots.list_snapshots() == [3, 4, 5]
+
+
+def test_prune_keeps_the_newest_snapshots(snapshots):
+    snapshots.setattr(db_snapshots, "DB_SNAPSHOT_KEEP", 4)
+
+    db_snapshots.prune_snapshots(5)
+
+    assert db_snapshots.list_snapshots() == [2, 3, 4, 5]
+
+
+def test_prune_disabled(snapshots):
+    snapshots.setattr(db_snapshots, "DB_SNAPSHOT_KEEP", 0)
+
+    db_snapshots.prune_snapshots(5)
+
+    assert db_snapshots.list_snapshots() == [1, 2, 3, 4, 5]
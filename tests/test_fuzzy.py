@@ -0,0 +1,97 @@
+from collections import Counter
+
+import pytest
+
+import hr_api.fuzzy as fuzzy
+import hr_api.models as models
+
+DESIGNATIONS = {
+    "R3101_HRB1": "Müller Logistik GmbH",
+    "R3101_HRB2": "Müller Logistik AG",
+    "R3101_HRB3": "Müllermann Logistik GmbH",
+    "R3101_HRB4": "Schmidt Bäckerei GmbH",
+    "R3101_HRB5": "Nordwind Handel KG",
+    "R3101_HRB6": None,
+}
+
+
+@pytest.fixture
+def names(db):
+    db.add_all(
+        models.Companies(company_number=company_number, current_designation=designation, generation=1)
+        for company_number, designation in DESIGNATIONS.items()
+    )
+    db.commit()
+    fuzzy.refresh_name_index(db, 1)
+    return db
+
+
+def candidates(db, name, **options):
+    (result,) = fuzzy.match_names(db, [name], **options)
+    return [(candidate["company_number"], candidate["score"]) for candidate in result["candidates"]]
+
+
+def test_trigrams_pad_each_word():
+    assert fuzzy.trigrams("ab c") == {"  a", " ab", "ab ", "  c", " c "}
+
+
+def test_similarity():
+    first = fuzzy.trigrams("mueller")
+    assert fuzzy.similarity(first, first) == 1.0
+    assert fuzzy.similarity(first, set()) == 0.0
+    assert 0 < fuzzy.similarity(first, fuzzy.trigrams("mueller logistik")) < 1
+
+
+def test_refresh_name_index_skips_companies_without_name(names):
+    assert names.query(models.CompanyNames).count() == 5
+
+
+def test_exact_name_ranks_first(names):
+    ranked = candidates(names, "Schmidt Bäckerei GmbH")
+
+    assert ranked[0] == ("R3101_HRB4", 1.0)
+
+
+def test_same_legal_form_ranks_first_among_equal_scores(names):
+    assert [number for number, _ in candidates(names, "Mueller Logistik AG", limit=2)] == ["R3101_HRB2", "R3101_HRB1"]
+    assert [number for number, _ in candidates(names, "Müller Logistik GmbH", limit=2)] == ["R3101_HRB1", "R3101_HRB2"]
+
+
+def test_spelled_out_legal_form(names):
+    ranked = candidates(names, "Müller Logistik Gesellschaft mit beschränkter Haftung", limit=1)
+
+    assert ranked == [("R3101_HRB1", 1.0)]
+
+
+def test_misspelled_name(names):
+    ranked = candidates(names, "Schmitt Bäckerai GmbH", limit=1)
+
+    assert ranked[0][0] == "R3101_HRB4"
+    assert ranked[0][1] < 1.0
+
+
+def test_scores_are_descending_and_limited(names):
+    ranked = candidates(names, "Müller Logistik", limit=3)
+
+    assert len(ranked) == 3
+    assert [score for _, score in ranked] == sorted((score for _, score in ranked), reverse=True)
+    assert ranked[-1][0] == "R3101_HRB3"
+
+
+def test_min_score(names):
+    assert candidates(names, "Nordwind Handel", min_score=0.99) == [("R3101_HRB5", 1.0)]
+    assert candidates(names, "Zebra", min_score=0.3) == []
+
+
+def test_results_keep_the_order_of_the_names(names):
+    results = fuzzy.match_names(names, ["Nordwind Handel KG", "Schmidt Bäckerei GmbH"], limit=1)
+
+    assert [result["name"] for result in results] == ["Nordwind Handel KG", "Schmidt Bäckerei GmbH"]
+    assert [result["candidates"][0]["company_number"] for result in results] == ["R3101_HRB5", "R3101_HRB4"]
+
+
+def test_most_shared_takes_the_ids_sharing_most_trigrams(monkeypatch):
+    monkeypatch.setattr(fuzzy, "FUZZY_CANDIDATES", 3)
+    counts = Counter({1: 5, 2: 1, 3: 4, 4: 4, 5: 2, 6: 3})
+
+    assert fuzzy._most_shared(counts) == [1, 4, 3]
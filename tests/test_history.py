@@ -0,0 +1,148 @@
+import json
+from datetime import date
+
+import hr_api.history as history
+import hr_api.models as models
+from hr_api.schemas import Company, ParticipantPerson, RegisterEntry
+
+COMPANY_NUMBER = "R3101_HRB1234"
+
+
+def company(**fields):
+    values = {name: None for name in history.COMPANY_FIELDS}
+    values.update(
+        register_code="HRB",
+        register_number="1234",
+        company_number=COMPANY_NUMBER,
+        current_designation="Muster GmbH",
+        city="Köln",
+        file_path="1234/Muster GmbH/si/2023-03-11T13-59-19.xml",
+    )
+    values.update(fields)
+    return Company(**values)
+
+
+def person(last_name, role_name_code="086"):
+    return ParticipantPerson(
+        role_number="1",
+        role_name_code=role_name_code,
+        first_name="Erika",
+        last_name=last_name,
+        birth_date=None,
+        gender_code="2",
+        city="Köln",
+        state_code=None,
+        company_number=COMPANY_NUMBER,
+        file_path="unused.xml",
+    )
+
+
+def entry(running_number, text):
+    return RegisterEntry(
+        column="6",
+        position="a",
+        running_number=running_number,
+        entry_type_code="2",
+        text=text,
+        company_number=COMPANY_NUMBER,
+        file_path="unused.xml",
+    )
+
+
+def stored_delta(newer, older):
+    # The ingest stores deltas as JSON, which turns rows into lists
+    return json.loads(json.dumps(history.reverse_delta(newer, older)))
+
+
+def test_reverse_delta_round_trip():
+    newer = history.extract_state(
+        company(city="Berlin"), [person("Mustermann"), person("Musterfrau")], [entry("1", "a"), entry("2", "b")]
+    )
+    older = history.extract_state(company(), [person("Mustermann")], [entry("1", "a"), entry("2", "old")])
+
+    delta = stored_delta(newer, older)
+
+    assert delta["company"] == {"city": "Köln"}
+    assert "participant_organizations" not in delta
+    assert {**newer["company"], **delta["company"]} == older["company"]
+    for part in history.ROW_FIELDS:
+        rows = history.apply_delta(newer[part], delta[part]) if part in delta else newer[part]
+        assert rows == older[part]
+
+
+def test_reverse_delta_round_trip_with_duplicate_rows():
+    newer = history.extract_state(company(), [person("Muster")] * 3, [entry("1", "same")] * 2)
+    older = history.extract_state(company(), [person("Muster")], [entry("1", "same")] * 3 + [entry("2", "new")])
+
+    delta = stored_delta(newer, older)
+
+    assert len(delta["participant_persons"]["removed"]) == 2
+    assert delta["participant_persons"]["added"] == []
+    assert len(delta["entries"]["added"]) == 2
+    for part in ("participant_persons", "entries"):
+        assert history.apply_delta(newer[part], delta[part]) == older[part]
+
+
+def test_reverse_delta_of_equal_extracts_is_empty():
+    state = history.extract_state(company(), [person("Muster")] * 2, [entry("1", "a")])
+
+    assert history.reverse_delta(state, state) == {}
+
+
+def add_history(db):
+    """
+    Stores a company with a newest extract of 2023-03-11 and an older one of 2021-05-01.
+    """
+    newest_file = "1234/Muster GmbH/si/2023-03-11T13-59-19.xml"
+    older_file = "1234/Muster GmbH/si/2021-05-01T08-00-00.xml"
+    newest = company(city="Berlin", file_path=newest_file)
+    older = company(file_path=older_file)
+    db.add(models.Generations(generation=1))
+    db.add_all(
+        [models.SourceFiles(id=1, path=newest_file, generation=1), models.SourceFiles(id=2, path=older_file, generation=1)]
+    )
+    db.add(
+        models.Companies(
+            **{name: getattr(newest, name) for name in history.COMPANY_FIELDS}, source_file_id=1, generation=1
+        )
+    )
+    for row in (entry("1", "a"), entry("2", "b")):
+        db.add(models.Entries(**row.model_dump(exclude={"file_path"}), source_file_id=1, generation=1))
+    delta = history.reverse_delta(
+        history.extract_state(newest, [], [entry("1", "a"), entry("2", "b")]),
+        history.extract_state(older, [], [entry("1", "a")]),
+    )
+    db.add(history.history_row(COMPANY_NUMBER, newest_file, 1, 1))
+    db.add(history.history_row(COMPANY_NUMBER, older_file, 2, 1, delta))
+    db.commit()
+
+
+def test_state_as_of(db):
+    add_history(db)
+
+    current = history.state_as_of(db, COMPANY_NUMBER, date(2024, 1, 1), "company")
+    older = history.state_as_of(db, COMPANY_NUMBER, date(2022, 1, 1), "company")
+    entries = history.state_as_of(db, COMPANY_NUMBER, date(2022, 1, 1), "entries")
+
+    assert [(row["city"], row["source_file_id"]) for row in current] == [("Berlin", 1)]
+    assert [(row["city"], row["source_file_id"]) for row in older] == [("Köln", 2)]
+    assert [(row["running_number"], row["text"]) for row in entries] == [("1", "a")]
+
+
+def test_state_as_of_the_day_of_an_extract(db):
+    add_history(db)
+
+    rows = history.state_as_of(db, COMPANY_NUMBER, date(2023, 3, 11), "company")
+
+    assert rows[0]["city"] == "Berlin"
+
+
+def test_state_as_of_before_the_first_extract(db):
+    add_history(db)
+
+    assert history.state_as_of(db, COMPANY_NUMBER, date(2021, 4, 30), "company") == []
+    assert history.state_as_of(db, COMPANY_NUMBER, date(2021, 4, 30), "entries") == []
+
+
+def test_state_as_of_without_history(db):
+    assert history.state_as_of(db, COMPANY_NUMBER, date(2024, 1, 1), "company") is None
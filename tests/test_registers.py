@@ -0,0 +1,43 @@
+import pytest
+
+from hr_api.registers import RegisterReference, parse_reference, register_key
+
+
+@pytest.mark.parametrize(
+    "reference, expected",
+    [
+        ("Amtsgericht Köln HRB 1234", RegisterReference("koeln", "HRB", "1234", None)),
+        (
+            "Amtsgericht Berlin (Charlottenburg) HRB 12345 B",
+            RegisterReference("berlin charlottenburg", "HRB", "12345", "B"),
+        ),
+        ("HRB12345B", RegisterReference(None, "HRB", "12345", "B")),
+        ("hra 99 München", RegisterReference("muenchen", "HRA", "99", None)),
+        ("Registergericht Hamburg GnR Nr. 7", RegisterReference("hamburg", "GnR", "7", None)),
+        ("F1103R_HRB12345B", RegisterReference("F1103R", "HRB", "12345", "B")),
+        ("D2601_VR42", RegisterReference("D2601", "VR", "42", None)),
+        ("HRB 1234 HL", RegisterReference(None, "HRB", "1234", "HL")),
+        # Words after the number are no addition
+        ("HRB 1234 in Köln", RegisterReference("koeln", "HRB", "1234", None)),
+        ("HRB 12345 AG Köln", RegisterReference("koeln", "HRB", "12345", None)),
+        ("HRB 12345 b", RegisterReference("b", "HRB", "12345", None)),
+        ("HRB 1234 Berlin", RegisterReference("berlin", "HRB", "1234", None)),
+        ("HRB 1234 BERLIN", RegisterReference("berlin", "HRB", "1234", None)),
+        ("HRB 55 KG", RegisterReference("kg", "HRB", "55", None)),
+    ],
+)
+def test_parse_reference(reference, expected):
+    assert parse_reference(reference) == expected
+
+
+@pytest.mark.parametrize("reference", ["Muster GmbH", "Amtsgericht Köln", "HRB", ""])
+def test_parse_reference_without_register_number(reference):
+    assert parse_reference(reference) is None
+
+
+def test_parsed_reference_has_the_register_key_of_the_company():
+    reference = parse_reference("Amtsgericht Berlin HRB 012345 B")
+
+    assert register_key(reference.register_code, reference.register_number, reference.register_number_addition) == (
+        register_key("HRB", "12345", "B")
+    )